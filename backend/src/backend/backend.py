@@ -1,41 +1,49 @@
-import logging
-import os
+import asyncio
+
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.concurrency import asynccontextmanager
 from fastapi.exceptions import RequestValidationError
 
-from db.pool import init_pool
+from db.pool import THREADPOOL_SIZE, init_background_pool, init_pool, settings_from_env
+from db.mariadb import shutdown_executor
 from endpoints.questions import topics, questions
 from endpoints.profile import profile
+from endpoints.profile.avatars import shutdown_render_pool
 from endpoints.auth import auth
 from endpoints.answers import answers
 from endpoints.validate import validations
+from endpoints.validate.scheduler import reconcile_periodically
 from endpoints.gamification import leaderboard
+from endpoints.gamification.ranking import refresh_periodically
 from endpoints.reports import reports
-from exceptions import request_validation_exception_handler
-
-
-db_host = os.getenv("DB_HOST", "culturallm-db")
-db_port = int(os.getenv("DB_PORT", 3306))
-db_user = os.getenv("DB_USER" , "")
-db_password = os.getenv("DB_PASSWORD", "")
-db_name = os.getenv("DB_NAME", "culturallm_db")
+from endpoints.status import status
+from endpoints.events import events
+from endpoints.export import export
+from events.feed import start_feed, stop_feed
+from crypto.executor import ExecutorFull, password_executor
+from exceptions import executor_full_exception_handler, request_validation_exception_handler
 
 
-if not db_user or not db_password:
-    raise RuntimeError("Environment variables DB_USER and DB_PASSWORD must be set.")
+db_settings = settings_from_env()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_pool(
-        host=db_host,
-        port=db_port,
-        user=db_user,
-        password=db_password,
-        database=db_name
-    )
+    # endpoint sincroni e dipendenze girano su questi thread: dimensionati sul pool (vedi db.pool)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    init_pool(**db_settings)
+    init_background_pool(**db_settings)
+    start_feed()
+    reconciler = asyncio.create_task(reconcile_periodically())
+    rank_refresher = asyncio.create_task(refresh_periodically())
     yield
+    rank_refresher.cancel()
+    reconciler.cancel()
+    await stop_feed()
+    shutdown_render_pool()
+    password_executor.shutdown()
+    shutdown_executor()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -44,6 +52,7 @@ app.title = "Backend CulturaLLM API"
 app.description = "API for managing CulturaLLM project."
 
 app.exception_handler(RequestValidationError)(request_validation_exception_handler)
+app.exception_handler(ExecutorFull)(executor_full_exception_handler)
 
 
 app.include_router(reports.router)
@@ -53,4 +62,7 @@ app.include_router(topics.router)
 app.include_router(questions.router)
 app.include_router(answers.router)
 app.include_router(validations.router)
-app.include_router(leaderboard.router)
\ No newline at end of file
+app.include_router(leaderboard.router)
+app.include_router(status.router)
+app.include_router(events.router)
+app.include_router(export.router)
\ No newline at end of file
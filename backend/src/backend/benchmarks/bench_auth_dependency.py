@@ -0,0 +1,58 @@
+"""
+Costo per richiesta della dipendenza di autenticazione (get_token_payload e
+get_current_principal), con e senza la cache dei token verificati di
+crypto/jwt.py. Gira in-process, non serve il backend in esecuzione:
+
+    JWT_SECRET_KEY=x JWT_REFRESH_SECRET_KEY=y python -m benchmarks.bench_auth_dependency
+"""
+import argparse
+import time
+
+from fastapi import Request
+
+from crypto import jwt
+from endpoints.auth.auth import get_current_principal, get_token_payload
+
+
+def per_call(func, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main(args):
+    tokens = [jwt.create_access_token({"sub": f"utente{i}", "uid": i}) for i in range(args.tokens)]
+    request = Request({"type": "http", "method": "GET", "path": "/profile/", "query_string": b"", "headers": []})
+    position = 0
+
+    def next_token() -> str:
+        nonlocal position
+        position = (position + 1) % len(tokens)
+        return tokens[position]
+
+    def uncached():
+        jwt._verified.clear()
+        get_token_payload(next_token())
+
+    def cached():
+        get_token_payload(next_token())
+
+    def principal():
+        get_current_principal(request, get_token_payload(next_token()), None)
+
+    for token in tokens:
+        get_token_payload(token)
+
+    print(f"{args.tokens} token in rotazione, {args.calls} chiamate")
+    print(f"get_token_payload senza cache:   {per_call(uncached, args.calls):8.2f}us per richiesta")
+    print(f"get_token_payload con cache:     {per_call(cached, args.calls):8.2f}us per richiesta")
+    print(f"get_current_principal con cache: {per_call(principal, args.calls):8.2f}us per richiesta")
+    print(f"cache: {jwt.token_cache_stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=100_000)
+    main(parser.parse_args())
@@ -0,0 +1,85 @@
+"""
+Throughput di POST /auth/login sotto un'ondata di login concorrenti e latenza,
+nello stesso momento, di una rotta che non fa hashing (/topics/random).
+
+Con l'hashing nell'executor delle password (crypto/executor.py) la rotta di
+controllo non dovrebbe risentire dei login; le richieste oltre
+PASSWORD_QUEUE_LIMIT ricevono 503 con Retry-After e vengono contate a parte.
+
+    python -m benchmarks.bench_login_load --concurrency 100 --requests 2000
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.common import add_server_arguments, login, summarize
+
+
+async def login_worker(client, args, queue: asyncio.Queue, latencies: list[float], statuses: Counter):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        start = time.perf_counter()
+        resp = await client.post("/auth/login", data={"username": args.username, "password": args.password})
+        statuses[resp.status_code] += 1
+        if resp.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+
+
+async def probe(client, stop: asyncio.Event, latencies: list[float]):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/topics/random")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60.0) as client:
+        await login(client, args.username, args.password)
+
+        idle: list[float] = []
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, stop, idle))
+        await asyncio.sleep(args.warmup)
+        stop.set()
+        await probe_task
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(args.requests):
+            queue.put_nowait(i)
+
+        login_latencies: list[float] = []
+        probe_latencies: list[float] = []
+        statuses: Counter = Counter()
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, stop, probe_latencies))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            login_worker(client, args, queue, login_latencies, statuses)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await probe_task
+
+    print(summarize("POST /auth/login (200)", login_latencies, elapsed))
+    print(f"{'esiti login':<24} {dict(sorted(statuses.items()))}")
+    print(summarize("GET /topics/random idle", idle))
+    print(summarize("GET /topics/random", probe_latencies))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_server_arguments(parser)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=float, default=2.0, help="secondi di misura della rotta di controllo senza login")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,191 @@
+"""
+Benchmark di carico delle pipeline di valutazione, da usare come gate di regressione.
+
+Invia POST /questions/ e POST /answers/ a ritmo costante (open loop: le
+richieste partono all'ora prevista anche se le precedenti non hanno finito),
+poi aspetta che la coda dei job si svuoti. Riporta throughput e latenza delle
+submit, latenza end-to-end delle valutazioni misurata dal worker e saturazione
+massima osservata di coda job, code NLP e pool del DB.
+
+Esempio con lo stub NLP (docker compose --profile bench up):
+
+    python -m benchmarks.bench_pipeline_load --rate 20 --duration 60 --answer-ratio 0.5
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+import httpx
+
+from benchmarks.common import add_server_arguments, login, summarize
+
+
+class Saturation:
+    """Massimi osservati campionando gli endpoint /status"""
+
+    def __init__(self):
+        self.pending_jobs = 0
+        self.running_jobs = 0
+        self.nlp_queue = 0
+        self.db_in_use = 0
+        self.db_waiting = 0
+
+    async def sample(self, api: httpx.AsyncClient, worker: httpx.AsyncClient) -> int | None:
+        """Job ancora da completare (pending più running), None se /status/jobs non ha risposto"""
+        in_flight = None
+        resp = await api.get("/status/jobs")
+        if resp.status_code == 200:
+            pending = running = 0
+            for row in resp.json()["queue"]:
+                if row["status"] == "pending":
+                    pending += row["jobs"]
+                elif row["status"] == "running":
+                    running += row["jobs"]
+            self.pending_jobs = max(self.pending_jobs, pending)
+            self.running_jobs = max(self.running_jobs, running)
+            in_flight = pending + running
+
+        resp = await worker.get("/status/nlp")
+        if resp.status_code == 200:
+            depth = sum(limiter["queue_depth"] for limiter in resp.json()["limiters"].values())
+            self.nlp_queue = max(self.nlp_queue, depth)
+
+        # disponibile solo se il backend espone le metriche del pool
+        resp = await api.get("/status/db")
+        if resp.status_code == 200:
+            pool = resp.json().get("pool", {})
+            self.db_in_use = max(self.db_in_use, pool.get("in_use", 0))
+            self.db_waiting = max(self.db_waiting, pool.get("waiting", 0))
+
+        return in_flight
+
+    def report(self) -> str:
+        return (
+            f"saturazione max: job pending={self.pending_jobs} running={self.running_jobs} "
+            f"coda NLP={self.nlp_queue} pool DB in uso={self.db_in_use} in attesa={self.db_waiting}"
+        )
+
+
+async def submit_question(client, headers, n: int, latencies: list[float], errors: list[int]):
+    payload = {"question": f"Qual è il piatto tipico della festa numero {n}?", "topic": "🍝 Cibo"}
+    start = time.perf_counter()
+    resp = await client.post("/questions/", json=payload, headers=headers)
+    latencies.append(time.perf_counter() - start)
+    if resp.status_code != 201:
+        errors.append(resp.status_code)
+
+
+async def submit_answer(client, headers, n: int, latencies: list[float], errors: list[int]):
+    resp = await client.get("/questions/random/to_answer", headers=headers)
+    if resp.status_code != 200:
+        errors.append(resp.status_code)
+        return
+    payload = {"question_id": resp.json()["id"], "answer": f"Risposta di benchmark numero {n}"}
+    start = time.perf_counter()
+    resp = await client.post("/answers/", json=payload, headers=headers)
+    latencies.append(time.perf_counter() - start)
+    if resp.status_code != 201:
+        errors.append(resp.status_code)
+
+
+async def monitor(api, worker, saturation: Saturation, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            await saturation.sample(api, worker)
+        except httpx.HTTPError as e:
+            print(f"monitor: {e}")
+        await asyncio.sleep(1.0)
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60.0) as api, \
+               httpx.AsyncClient(base_url=args.worker_url, timeout=10.0) as worker:
+
+        users = [
+            await login(api, f"{args.username}{i}", args.password)
+            for i in range(args.users)
+        ]
+        users_cycle = itertools.cycle(users)
+
+        question_latencies: list[float] = []
+        answer_latencies: list[float] = []
+        errors: list[int] = []
+        saturation = Saturation()
+        stop = asyncio.Event()
+        monitor_task = asyncio.create_task(monitor(api, worker, saturation, stop))
+
+        tasks = set()
+        interval = 1 / args.rate
+        start = time.perf_counter()
+        for n in range(int(args.rate * args.duration)):
+            # open loop: si rispetta il calendario indipendentemente dalle risposte
+            delay = start + n * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            headers = next(users_cycle)
+            if random.random() < args.answer_ratio:
+                coroutine = submit_answer(api, headers, n, answer_latencies, errors)
+            else:
+                coroutine = submit_question(api, headers, n, question_latencies, errors)
+            task = asyncio.create_task(coroutine)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+        # aspettiamo che il worker smaltisca la coda: nessun job pending né running.
+        # Un campione fallito non dice nulla sulla coda, quindi si continua ad aspettare
+        drain_start = time.perf_counter()
+        drained = False
+        while time.perf_counter() - drain_start < args.drain_timeout:
+            try:
+                in_flight = await saturation.sample(api, worker)
+            except httpx.HTTPError as e:
+                print(f"drain: {e}")
+                in_flight = None
+            if in_flight == 0:
+                drained = True
+                break
+            await asyncio.sleep(1.0)
+        drain_time = time.perf_counter() - drain_start
+
+        stop.set()
+        await monitor_task
+        worker_status = (await worker.get("/status/worker")).json()
+
+    print(summarize("POST /questions/", question_latencies, elapsed))
+    print(summarize("POST /answers/", answer_latencies, elapsed))
+    print(f"errori HTTP: {len(errors)} {sorted(set(errors))}")
+    if drained:
+        print(f"coda svuotata in {drain_time:.1f}s dopo la fine del carico")
+    else:
+        print(f"coda NON svuotata entro {args.drain_timeout:.0f}s dalla fine del carico")
+    for kind, summary in worker_status["latency"].items():
+        if summary["count"]:
+            print(
+                f"valutazione {kind:<9} n={summary['count']:<6} p50={summary['p50']:.2f}s "
+                f"p99={summary['p99']:.2f}s max={summary['max']:.2f}s"
+            )
+    print(
+        f"worker: done={worker_status['done']} retried={worker_status['retried']} "
+        f"deferred={worker_status['deferred']} failed={worker_status['failed']}"
+    )
+    print(saturation.report())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_server_arguments(parser)
+    parser.add_argument("--worker-url", default="http://localhost:8004")
+    parser.add_argument("--rate", type=float, default=10.0, help="submit al secondo")
+    parser.add_argument("--duration", type=float, default=60.0, help="durata del carico in secondi")
+    parser.add_argument("--answer-ratio", type=float, default=0.5, help="quota di risposte sul totale")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--drain-timeout", type=float, default=600.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,131 @@
+"""
+Utilizzo del pool delle connessioni delle richieste sotto traffico misto:
+richieste rifiutate prima di arrivare al DB (401 su /reports/, 400 e 422 di
+submit_report, avatar) insieme a rotte che fanno query (classifica, storico).
+
+Durante il carico campiona /status/db e riporta connessioni in uso, richieste
+in attesa, 503 e quante richieste non hanno mai preso una connessione
+(lazy.skipped, vedi LazyConnection in db/mariadb.py) o l'hanno restituita
+prima della risposta (lazy.released_early).
+
+    python -m benchmarks.bench_pool_utilization --concurrency 100 --requests 5000
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.common import add_server_arguments, login, summarize
+
+
+# nome -> (metodo, percorso, argomenti per httpx, autenticata)
+ROUTES = {
+    "unauthorized": ("POST", "/reports/", {"json": {"question_id": 1}}, False),
+    "report_400": ("POST", "/reports/", {"json": {"report": "spam"}}, True),
+    "report_422": ("POST", "/reports/", {"json": {"question_id": "non un id"}}, True),
+    "avatar": ("GET", "/profile/avatar/", {"params": {"username": "bench", "size": 64}}, False),
+    "leaderboard": ("GET", "/leaderboard/", {"params": {"limit": 50, "window": "week"}}, False),
+    "history": ("GET", "/profile/questions/", {"params": {"limit": 100}}, True),
+}
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    """nome=peso separati da virgola, ad esempio unauthorized=3,leaderboard=1"""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ROUTES:
+            raise argparse.ArgumentTypeError(f"rotta sconosciuta: {name} (disponibili: {', '.join(ROUTES)})")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+async def worker(client, headers, mix, queue: asyncio.Queue, latencies: dict, statuses: dict):
+    names, weights = list(mix), list(mix.values())
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        name = random.choices(names, weights)[0]
+        method, path, kwargs, authenticated = ROUTES[name]
+        start = time.perf_counter()
+        resp = await client.request(method, path, headers=headers if authenticated else None, **kwargs)
+        latencies[name].append(time.perf_counter() - start)
+        statuses[name][resp.status_code] += 1
+
+
+async def sample(client, stop: asyncio.Event, interval: float, samples: list[dict]):
+    while not stop.is_set():
+        resp = await client.get("/status/db")
+        samples.append(resp.json()["pool"])
+        await asyncio.sleep(interval)
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60.0) as client:
+        headers = await login(client, args.username, args.password)
+        before = (await client.get("/status/db")).json()
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(args.requests):
+            queue.put_nowait(i)
+
+        latencies = {name: [] for name in args.mix}
+        statuses = {name: Counter() for name in args.mix}
+        samples: list[dict] = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample(client, stop, args.interval, samples))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            worker(client, headers, args.mix, queue, latencies, statuses)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+        after = (await client.get("/status/db")).json()
+
+    for name in args.mix:
+        print(summarize(name, latencies[name]))
+        print(f"{'  esiti':<24} {dict(sorted(statuses[name].items()))}")
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{'throughput':<24} {total / elapsed:8.1f} req/s")
+    if samples:
+        in_use = [s["in_use"] for s in samples]
+        waiting = [s["waiting"] for s in samples]
+        print(
+            f"{'pool':<24} size={samples[0]['size']} "
+            f"in_use medio={sum(in_use) / len(in_use):5.1f} max={max(in_use)} "
+            f"utilizzo medio={sum(s['utilization'] for s in samples) / len(samples):5.1%} "
+            f"in attesa medio={sum(waiting) / len(waiting):5.1f} max={max(waiting)}"
+        )
+        print(f"{'attesa connessione':<24} p50={after['pool']['wait_p50']} p99={after['pool']['wait_p99']}")
+
+    delta = {
+        key: after[section][key] - before[section][key]
+        for section, keys in (("pool", ("checkouts", "shed", "timeouts")),
+                              ("lazy", ("requests", "checked_out", "skipped", "released_early")))
+        for key in keys
+    }
+    print(f"{'durante il carico':<24} {delta}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_server_arguments(parser)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--interval", type=float, default=0.05, help="secondi tra due campioni di /status/db")
+    parser.add_argument(
+        "--mix", type=parse_mix,
+        default=parse_mix("unauthorized=3,report_400=1,report_422=1,avatar=2,leaderboard=2,history=1"),
+        help="peso di ogni tipo di richiesta, ad esempio unauthorized=3,leaderboard=1",
+    )
+    asyncio.run(main(parser.parse_args()))
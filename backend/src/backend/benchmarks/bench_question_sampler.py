@@ -0,0 +1,78 @@
+"""
+Costo di un'estrazione di QuestionSampler a 10k, 100k e 1M domande.
+
+Per ogni dimensione misura il tempo per estrazione al variare della frazione
+di domande a cui l'utente ha già risposto, confrontandolo con una scansione
+completa (filtro + scelta casuale, lo stesso lavoro lineare di ORDER BY RAND()),
+e controlla che la distribuzione resti uniforme sulle domande ammissibili.
+Il tempo del sampler include la prima chiamata per l'utente, che per chi ha
+risposto a quasi tutto costruisce la lista delle domande ammissibili.
+Non serve il backend in esecuzione:
+
+    python -m benchmarks.bench_question_sampler --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+from collections import Counter
+
+from endpoints.questions.sampler import QuestionSampler
+
+
+def time_per_call(func, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def full_scan(ids: list[int], answered: set[int], rng: random.Random) -> int | None:
+    candidates = [question_id for question_id in ids if question_id not in answered]
+    return rng.choice(candidates) if candidates else None
+
+
+def uniformity(sampler: QuestionSampler, answered: set[int], eligible: int, draws: int, user_id=None) -> float:
+    """Rapporto tra la frequenza massima e quella attesa (1.0 = perfettamente uniforme)"""
+    counts = Counter(sampler.sample(answered, user_id) for _ in range(draws))
+    assert not answered.intersection(counts), "estratta una domanda già risposta"
+    return max(counts.values()) / (draws / eligible)
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        ids = list(range(1, size + 1))
+        sampler = QuestionSampler(rng=random.Random(args.seed))
+        start = time.perf_counter()
+        sampler.load(ids)
+        print(f"\n{size} domande (caricamento array: {(time.perf_counter() - start) * 1000:.1f}ms)")
+
+        for user_id, fraction in enumerate(args.answered):
+            answered = set(rng.sample(ids, int(size * fraction)))
+            per_sample = time_per_call(lambda: sampler.sample(answered, user_id), args.calls)
+            per_scan = time_per_call(lambda: full_scan(ids, answered, rng), max(1, args.calls // 1000))
+            print(
+                f"  risposte dell'utente {fraction:>5.0%}: "
+                f"sampler={per_sample * 1e6:9.2f}us  scansione={per_scan * 1e6:12.1f}us  "
+                f"speedup={per_scan / per_sample:9.0f}x"
+            )
+
+        # uniformità su un sottoinsieme piccolo, perché servono molte estrazioni per domanda
+        small = QuestionSampler(rng=random.Random(args.seed))
+        small.load(range(1, 1001))
+        answered = set(range(1, 501))
+        ratio = uniformity(small, answered, 500, args.draws)
+        print(f"  uniformità (1000 domande, 500 ammissibili, {args.draws} estrazioni): max/atteso={ratio:.2f}")
+        dense = set(range(1, 991))
+        ratio = uniformity(small, dense, 10, args.draws, user_id=0)
+        print(f"  uniformità (1000 domande, 10 ammissibili, lista per utente): max/atteso={ratio:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--answered", type=float, nargs="+", default=[0.0, 0.5, 0.9, 0.99])
+    parser.add_argument("--calls", type=int, default=10_000)
+    parser.add_argument("--draws", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    main(parser.parse_args())
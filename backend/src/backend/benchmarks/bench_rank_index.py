@@ -0,0 +1,63 @@
+"""
+Costo di RankIndex con 1M di utenti: caricamento, posizione di un utente
+e aggiornamento di un punteggio, confrontati con il conteggio lineare che
+fa la query SQL originale (COUNT(*) degli utenti davanti).
+Controlla anche che le posizioni coincidano con quelle del conteggio.
+Non serve il backend in esecuzione:
+
+    python -m benchmarks.bench_rank_index --users 1000000
+"""
+import argparse
+import random
+import time
+
+from endpoints.gamification.ranking import RankIndex
+
+
+def linear_rank(scores: list[int], user_id: int) -> int:
+    score = scores[user_id]
+    return 1 + sum(
+        1 for other, other_score in enumerate(scores)
+        if other_score > score or (other_score == score and other < user_id)
+    )
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    # molti utenti con punteggio basso e pochi con punteggio alto, come in una classifica reale
+    scores = [0] + [int(rng.paretovariate(1.2) * 10) - 10 for _ in range(args.users)]
+
+    start = time.perf_counter()
+    index = RankIndex()
+    index.load((user_id, scores[user_id]) for user_id in range(1, args.users + 1))
+    print(f"caricamento di {args.users} utenti: {time.perf_counter() - start:.2f}s")
+
+    user_ids = [rng.randint(1, args.users) for _ in range(args.lookups)]
+    start = time.perf_counter()
+    for user_id in user_ids:
+        index.rank(user_id)
+    print(f"posizione:     {(time.perf_counter() - start) / args.lookups * 1e6:8.2f}us per chiamata")
+
+    start = time.perf_counter()
+    for user_id in user_ids:
+        scores[user_id] += rng.randint(1, 5)
+        index.set_score(user_id, scores[user_id])
+    print(f"aggiornamento: {(time.perf_counter() - start) / args.lookups * 1e6:8.2f}us per chiamata")
+
+    checked = user_ids[:args.checks]
+    start = time.perf_counter()
+    expected = [linear_rank(scores, user_id) for user_id in checked]
+    linear = (time.perf_counter() - start) / len(checked)
+    print(f"conteggio lineare: {linear * 1e6:12.2f}us per chiamata")
+
+    mismatches = sum(1 for user_id, rank in zip(checked, expected) if index.rank(user_id) != rank)
+    print(f"consistenza: {len(checked) - mismatches}/{len(checked)} posizioni uguali al conteggio lineare")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--checks", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    main(parser.parse_args())
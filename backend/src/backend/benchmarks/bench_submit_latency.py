@@ -0,0 +1,74 @@
+"""
+Latenza di POST /questions/ con molte richieste concorrenti.
+
+Misura p50/p90/p99 delle submit e, in parallelo, di una rotta leggera
+(/topics/random) che soffre ogni volta che l'event loop resta bloccato.
+Per il confronto prima/dopo lanciarlo contro il backend alla revisione
+precedente e a quella corrente, con gli stessi parametri:
+
+    python -m benchmarks.bench_submit_latency --concurrency 50 --requests 2000
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import add_server_arguments, login, summarize
+
+
+async def submit_worker(client, headers, queue: asyncio.Queue, latencies: list[float]):
+    while True:
+        try:
+            i = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        payload = {"question": f"Domanda di benchmark numero {i}?", "topic": "🎨 Arte"}
+        start = time.perf_counter()
+        resp = await client.post("/questions/", json=payload, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        if resp.status_code != 201:
+            print(f"submit {i}: status {resp.status_code}")
+
+
+async def probe(client, stop: asyncio.Event, latencies: list[float]):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/topics/random")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60.0) as client:
+        headers = await login(client, args.username, args.password)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(args.requests):
+            queue.put_nowait(i)
+
+        submit_latencies: list[float] = []
+        probe_latencies: list[float] = []
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, stop, probe_latencies))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            submit_worker(client, headers, queue, submit_latencies)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await probe_task
+
+    print(summarize("POST /questions/", submit_latencies, elapsed))
+    print(summarize("GET /topics/random", probe_latencies))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_server_arguments(parser)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,52 @@
+"""
+Funzioni condivise dagli script di benchmark.
+
+Gli script vanno lanciati dalla cartella del backend, ad esempio:
+
+    python -m benchmarks.bench_submit_latency --base-url http://localhost:8003
+"""
+import argparse
+import math
+
+import httpx
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Percentile p (0-100) con il metodo nearest-rank"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(name: str, latencies: list[float], elapsed: float | None = None) -> str:
+    """Riga di riepilogo con i percentili in millisecondi"""
+    ms = [value * 1000 for value in latencies]
+    line = (
+        f"{name:<24} n={len(ms):<6} "
+        f"p50={percentile(ms, 50):8.1f}ms p90={percentile(ms, 90):8.1f}ms "
+        f"p99={percentile(ms, 99):8.1f}ms max={max(ms, default=float('nan')):8.1f}ms"
+    )
+    if elapsed:
+        line += f" throughput={len(ms) / elapsed:8.1f} req/s"
+    return line
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--base-url", default="http://localhost:8003")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="benchpassword1")
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> dict[str, str]:
+    """Registra l'utente di benchmark se serve e ritorna gli header di autenticazione"""
+    await client.post("/auth/signup", json={
+        "username": username,
+        "email": f"{username}@bench.local",
+        "nation": "Italia",
+        "password": password,
+    })
+    resp = await client.post("/auth/login", data={"username": username, "password": password})
+    resp.raise_for_status()
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
@@ -0,0 +1,103 @@
+"""
+Executor dedicato all'hashing e alla verifica delle password.
+
+scrypt è volutamente lento (decine di ms per hash): eseguito nel threadpool
+delle richieste, un'ondata di login lo occuperebbe tutto e bloccherebbe ogni
+altro endpoint. Qui gira su PASSWORD_WORKERS thread (hashlib.scrypt rilascia
+il GIL, non servono processi) e al più PASSWORD_QUEUE_LIMIT operazioni possono
+essere in coda o in esecuzione: oltre, submit solleva ExecutorFull e l'endpoint
+risponde 503 con Retry-After invece di accodare senza limite.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", 64))
+
+
+class ExecutorFull(Exception):
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Executor delle password pieno, riprovare tra {retry_after}s")
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+
+    def __init__(self, workers: int = PASSWORD_WORKERS, limit: int = PASSWORD_QUEUE_LIMIT, name: str = "password"):
+        self.workers = workers
+        self.limit = limit
+        self._executor: ThreadPoolExecutor | None = None
+        self._name = name
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self._name)
+        return self._executor
+
+    def retry_after(self) -> int:
+        """Secondi stimati per smaltire la coda attuale"""
+        average = self.busy_seconds / self.completed if self.completed else 0.1
+        return max(1, math.ceil(self.pending * average / self.workers))
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self.pending >= self.limit:
+                self.rejected += 1
+                raise ExecutorFull(self.retry_after())
+            self.pending += 1
+
+    def _timed(self, func, args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self.busy_seconds += time.perf_counter() - start
+
+    def _submit(self, func, args):
+        self._acquire()
+        try:
+            return self._get_executor().submit(self._timed, func, args)
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            raise
+
+    async def run(self, func, *args):
+        """Esegue func(*args) su un thread dell'executor; ExecutorFull se la coda è piena"""
+        return await asyncio.wrap_future(self._submit(func, args))
+
+    def call(self, func, *args):
+        """Come run, per gli endpoint sincroni: blocca il thread chiamante fino al risultato"""
+        return self._submit(func, args).result()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "limit": self.limit,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "average_seconds": self.busy_seconds / self.completed if self.completed else None,
+        }
+
+
+password_executor = BoundedExecutor()
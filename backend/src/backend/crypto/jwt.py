@@ -1,18 +1,25 @@
+import hashlib
 import os
 import jwt
 from datetime import datetime, timedelta, timezone
 
 from crypto.models import TokenExpired, TokenInvalid, TokenMissing
+from lru import LRUCache
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 REFRESH_SECRET_KEY = os.getenv("JWT_REFRESH_SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+# token di accesso già verificati, per digest del token; ogni elemento scade con il token
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
 
 if not SECRET_KEY or not REFRESH_SECRET_KEY:
     raise RuntimeError("Environment variables JWT_SECRET_KEY and JWT_REFRESH_SECRET_KEY must be set.")
 
+# l'LRU ha un suo lock: può essere usata dai thread del threadpool degli endpoint sincroni
+_verified = LRUCache(max_items=TOKEN_CACHE_SIZE)
+
 #encode data in a token
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     to_encode = data.copy()
@@ -32,9 +39,18 @@ def decode_access_token(token: str) -> dict:
     try:
         if not token:
             raise TokenMissing("Token non fornito")
-        
+
+        # un client manda lo stesso token per tutti i suoi 15 minuti di vita:
+        # firma e claim vengono verificati solo la prima volta
+        key = hashlib.sha256(token.encode()).digest()
+        payload = _verified.get(key)
+        if payload is not None:
+            return dict(payload)
+
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        if "exp" in payload:
+            _verified.put(key, payload, expires_at=payload["exp"])
+        return dict(payload)
     except jwt.ExpiredSignatureError:
         raise TokenExpired("Token scaduto")
     except jwt.InvalidTokenError:
@@ -50,4 +66,8 @@ def decode_refresh_token(token: str) -> dict:
     except jwt.ExpiredSignatureError:
         raise TokenExpired("Token scaduto")
     except jwt.InvalidTokenError:
-        raise TokenInvalid("Token non valido")
\ No newline at end of file
+        raise TokenInvalid("Token non valido")
+
+
+def token_cache_stats() -> dict:
+    return _verified.stats()
@@ -1,16 +1,64 @@
 import hashlib
+import hmac
 import os
 
+# parametri di scrypt per i nuovi hash: cambiandoli, gli hash esistenti vengono
+# aggiornati al login successivo di ogni utente (needs_rehash)
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", 2 ** 14))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", 8))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", 1))
+SCRYPT_LENGTH = 32
+
 # generate a casual salt of "byte" bytes
 def get_salt(byte: int) -> bytes:
     return os.urandom(byte)
 
-# it computes the hash of pwd + salt
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> str:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r * p, dklen=SCRYPT_LENGTH,
+    ).hex()
+
+
+# it computes the hash of pwd + salt, as scrypt$n$r$p$hash
 def hash_password(password, salt) -> str:
-    pwd_hash: str = hashlib.sha256(salt + password.encode()).hexdigest()
-    return pwd_hash
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${digest}"
 
 # checks wether the password is correct or not
 def verify_password(stored_hash, stored_salt, provided_password) ->bool:
+    if stored_hash.startswith("scrypt$"):
+        _, n, r, p, digest = stored_hash.split("$")
+        pwd_hash = _scrypt(provided_password, stored_salt, int(n), int(r), int(p))
+        return hmac.compare_digest(pwd_hash, digest)
+
+    # hash sha256 salvati prima di scrypt
     pwd_hash = hashlib.sha256(stored_salt + provided_password.encode()).hexdigest()
-    return pwd_hash == stored_hash
+    return hmac.compare_digest(pwd_hash, stored_hash)
+
+
+def needs_rehash(stored_hash: str) -> bool:
+    """Vero per gli hash sha256 e per quelli scrypt con parametri diversi da quelli attuali"""
+    return not stored_hash.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+# hash e salt fissi da verificare quando l'utente non esiste, così il login
+# costa uno scrypt anche in quel caso e i tempi di risposta non dicono quali
+# username sono registrati. Nessuna password produce un digest di soli zeri
+DUMMY_SALT = bytes(16)
+DUMMY_HASH = f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${'0' * 2 * SCRYPT_LENGTH}"
+
+
+def verify_and_upgrade(stored_hash, stored_salt, provided_password) -> tuple[bool, tuple[str, str] | None]:
+    """
+    verify_password più, se la password è giusta ma l'hash usa parametri vecchi,
+    il nuovo (hash, salt esadecimale) da salvare. Un'unica chiamata, da eseguire
+    nell'executor delle password.
+    """
+    if not verify_password(stored_hash, stored_salt, provided_password):
+        return False, None
+    if not needs_rehash(stored_hash):
+        return True, None
+    salt = get_salt(16)
+    return True, (hash_password(provided_password, salt), salt.hex())
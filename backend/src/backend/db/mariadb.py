@@ -1,16 +1,133 @@
+import asyncio
+import functools
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
 import mariadb
 from fastapi import HTTPException
 
-from db.pool import get_pool
+from db.pool import (
+    BACKGROUND_POOL_SIZE, DB_BACKGROUND_MAX_WAITING, DB_MAX_WAITING, POOL_SIZE, PoolSaturated,
+    background_checkin, background_checkout, checkin, checkout,
+)
+
+
+# executor dedicato alle chiamate bloccanti del connettore: ha tanti thread
+# quante sono le connessioni dei due pool più i chiamanti che possono aspettarne
+# una (le LazyConnection degli handler async la prendono su questi thread)
+_executor: ThreadPoolExecutor | None = None
+
+logger = logging.getLogger("app")
+
+
+def saturated(exc: PoolSaturated) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Database sovraccarico, riprova più tardi",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+# richieste servite da db_connection: quante hanno davvero preso una connessione
+# e quante l'hanno restituita prima della fine dell'handler (release)
+lazy_connections = Counter()
+
+
+class LazyConnection:
+    """
+    Connessione del pool presa solo al primo uso (cursor, commit, ...), non quando
+    la dipendenza viene risolta: le richieste rifiutate prima di arrivare al DB
+    (401, 422, token con il claim uid) non occupano una connessione.
+    release() la restituisce subito, prima che la risposta venga serializzata;
+    un uso successivo ne prende un'altra.
+    """
+
+    def __init__(self):
+        self._conn: mariadb.Connection | None = None
+        self._checked_out_at = 0.0
+        self._lock = threading.Lock()
+        self.used = False
+
+    def _connect(self) -> mariadb.Connection:
+        with self._lock:
+            if self._conn is None:
+                try:
+                    self._conn, self._checked_out_at = checkout()
+                except PoolSaturated as e:
+                    raise saturated(e)
+                self.used = True
+            return self._conn
+
+    @property
+    def checked_out(self) -> bool:
+        return self._conn is not None
+
+    def cursor(self, *args, **kwargs):
+        return self._connect().cursor(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._connect(), name)
+
+    def release(self) -> None:
+        """Restituisce la connessione al pool, se è stata presa"""
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            checkin(conn, self._checked_out_at)
 
 
 def db_connection():
-    """Return a connection to the database, and close it when done"""
-    conn = get_pool().get_connection()
+    """Return a lazy connection to the database, and release it when done"""
+    conn = LazyConnection()
+    lazy_connections["requests"] += 1
     try:
         yield conn
     finally:
-        conn.close()
+        if conn.used:
+            lazy_connections["checked_out"] += 1
+            if not conn.checked_out:
+                lazy_connections["released_early"] += 1
+        conn.release()
+
+
+def lazy_connection_stats() -> dict:
+    return {
+        "requests": lazy_connections["requests"],
+        "checked_out": lazy_connections["checked_out"],
+        "skipped": lazy_connections["requests"] - lazy_connections["checked_out"],
+        "released_early": lazy_connections["released_early"],
+    }
+
+
+@contextmanager
+def pooled_connection():
+    """Lend a pooled connection for the duration of a with block"""
+    try:
+        conn, checked_out_at = checkout()
+    except PoolSaturated as e:
+        raise saturated(e)
+    try:
+        yield conn
+    finally:
+        checkin(conn, checked_out_at)
+
+
+@contextmanager
+def background_connection():
+    """
+    Lend a connection of the background pool for the duration of a with block.
+    Background work must keep it only around its DB statements. When the pool
+    is exhausted it waits for a free connection (see background_gate) instead
+    of failing right away; PoolSaturated if the wait is too long.
+    """
+    conn, checked_out_at = background_checkout()
+    try:
+        yield conn
+    finally:
+        background_checkin(conn, checked_out_at)
 
 
 def execute_query(
@@ -19,9 +136,13 @@ def execute_query(
     params: tuple = (), 
     fetchone: bool = False,
     fetch: bool = True, 
-    dict: bool = False
+    dict: bool = False,
+    commit: bool = True
 ):
-    """Execute a query and return the results if there are"""
+    """
+    Execute a query and return the results if there are.
+    With commit=False writes are left to the caller's transaction (transaction_async).
+    """
     try:
         with connection.cursor(dictionary=dict) as cursor:
             cursor.execute(query, params)
@@ -34,13 +155,106 @@ def execute_query(
                 results = None
 
             if query.strip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
-                connection.commit()
+                if commit:
+                    connection.commit()
                 if query.strip().upper().startswith("INSERT"):
                     return cursor.lastrowid  # 👈 Restituisce l'ID per INSERT
 
+    except HTTPException:
+        # pool saturo (LazyConnection): 503, non un errore della query
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nell'esecuzione della query: {e}")
     
     return results
 
 
+def get_executor() -> ThreadPoolExecutor:
+    """Return the executor used by the async helpers, creating it if needed"""
+    global _executor
+    if _executor is None:
+        threads = POOL_SIZE + DB_MAX_WAITING + BACKGROUND_POOL_SIZE + DB_BACKGROUND_MAX_WAITING
+        _executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="db")
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Esegue una funzione bloccante che usa il db sull'executor dedicato"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def execute_query_async(
+    connection: mariadb.Connection,
+    query: str,
+    params: tuple = (),
+    fetchone: bool = False,
+    fetch: bool = True,
+    dict: bool = False,
+    commit: bool = True
+):
+    """
+    Versione awaitable di execute_query: la query viene eseguita
+    sull'executor del db, così l'event loop non resta bloccato
+    per tutto il round trip verso MariaDB.
+    """
+    return await run_blocking(
+        execute_query, connection, query, params,
+        fetchone=fetchone, fetch=fetch, dict=dict, commit=commit
+    )
+
+
+@asynccontextmanager
+async def transaction_async(connection: mariadb.Connection):
+    """
+    Le scritture eseguite nel blocco con commit=False vengono confermate
+    insieme all'uscita, o annullate tutte se il blocco solleva un'eccezione.
+    """
+    try:
+        yield connection
+    except BaseException:
+        try:
+            await run_blocking(connection.rollback)
+        except Exception:
+            logger.exception("Rollback fallito")
+        raise
+    try:
+        await run_blocking(connection.commit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore nel commit della transazione: {e}")
+
+
+def execute_background_query(
+    query: str,
+    params: tuple = (),
+    fetchone: bool = False,
+    fetch: bool = True,
+    dict: bool = False
+):
+    """Execute a query on a background connection, returned to the pool right after"""
+    with background_connection() as conn:
+        return execute_query(conn, query, params, fetchone=fetchone, fetch=fetch, dict=dict)
+
+
+async def execute_background_query_async(
+    query: str,
+    params: tuple = (),
+    fetchone: bool = False,
+    fetch: bool = True,
+    dict: bool = False
+):
+    """
+    Versione awaitable di execute_background_query: sia il checkout della
+    connessione sia la query avvengono sull'executor del db.
+    """
+    return await run_blocking(
+        execute_background_query, query, params,
+        fetchone=fetchone, fetch=fetch, dict=dict
+    )
@@ -1,14 +1,135 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+
 import mariadb
 
 
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+# richieste che possono aspettare una connessione libera; le altre ricevono subito 503
+DB_MAX_WAITING = int(os.getenv("DB_MAX_WAITING", POOL_SIZE))
+# attesa massima di una connessione, oltre la richiesta riceve 503
+DB_CHECKOUT_TIMEOUT = float(os.getenv("DB_CHECKOUT_TIMEOUT", 2.0))
+# thread di AnyIO per endpoint e dipendenze sincrone: POOL_SIZE li usano, DB_MAX_WAITING
+# aspettano, gli altri restano agli endpoint sincroni che non usano il DB
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", max(40, POOL_SIZE + DB_MAX_WAITING + 10)))
+# pool separato per il lavoro in background (worker, refresh periodici),
+# così non compete con le connessioni delle richieste HTTP. Lo usano i job del
+# worker (fino a due stadi NLP ciascuno), lease e ack della coda, gli eventi, il
+# feed, lo scheduler e la classifica: il default copre WORKER_CONCURRENCY=4 più questi
+BACKGROUND_POOL_SIZE = int(os.getenv("DB_BACKGROUND_POOL_SIZE", 12))
+# chi chiede una connessione di background quando sono tutte in uso aspetta,
+# fino a DB_BACKGROUND_MAX_WAITING chiamanti e per DB_BACKGROUND_CHECKOUT_TIMEOUT secondi
+DB_BACKGROUND_MAX_WAITING = int(os.getenv("DB_BACKGROUND_MAX_WAITING", 32))
+DB_BACKGROUND_CHECKOUT_TIMEOUT = float(os.getenv("DB_BACKGROUND_CHECKOUT_TIMEOUT", 30.0))
+
 _pool: mariadb.ConnectionPool | None = None
+_background_pool: mariadb.ConnectionPool | None = None
+
+
+class PoolSaturated(Exception):
+
+    def __init__(self, retry_after: int):
+        super().__init__("Nessuna connessione al database disponibile")
+        self.retry_after = retry_after
+
+
+class ConnectionGate:
+    """
+    Ammissione al pool delle richieste: al più size connessioni in uso, al più
+    max_waiting richieste in attesa (in ordine di arrivo) e per non più di
+    timeout secondi. ConnectionPool.get_connection invece fallisce subito
+    quando il pool è esaurito.
+    """
+
+    def __init__(self, size: int, max_waiting: int, timeout: float):
+        self.size = size
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.shed = 0
+        self.timeouts = 0
+        self._waits: deque[float] = deque(maxlen=1000)
+        self._holds: deque[float] = deque(maxlen=1000)
+        self._cond = threading.Condition()
+
+    def retry_after(self) -> int:
+        """Secondi dopo i quali è ragionevole riprovare: il tempo medio di uso di una connessione per la coda"""
+        hold = sum(self._holds) / len(self._holds) if self._holds else 0.1
+        return max(1, math.ceil(hold * (self.waiting + 1)))
+
+    def acquire(self) -> float:
+        """Occupa un posto nel pool e ritorna i secondi di attesa; PoolSaturated se non è possibile"""
+        start = time.monotonic()
+        with self._cond:
+            if self.in_use >= self.size:
+                if self.waiting >= self.max_waiting:
+                    self.shed += 1
+                    raise PoolSaturated(self.retry_after())
+                self.waiting += 1
+                try:
+                    available = self._cond.wait_for(lambda: self.in_use < self.size, timeout=self.timeout)
+                finally:
+                    self.waiting -= 1
+                if not available:
+                    self.timeouts += 1
+                    raise PoolSaturated(self.retry_after())
+            self.in_use += 1
+            self.checkouts += 1
+            waited = time.monotonic() - start
+            self._waits.append(waited)
+        return waited
+
+    def release(self, held: float) -> None:
+        with self._cond:
+            self.in_use -= 1
+            self._holds.append(held)
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            waits = sorted(self._waits)
+            holds = list(self._holds)
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "utilization": self.in_use / self.size,
+            "checkouts": self.checkouts,
+            "shed": self.shed,
+            "timeouts": self.timeouts,
+            "wait_p50": waits[len(waits) // 2] if waits else None,
+            "wait_p99": waits[int(0.99 * (len(waits) - 1))] if waits else None,
+            "hold_avg": sum(holds) / len(holds) if holds else None,
+        }
+
+
+gate = ConnectionGate(POOL_SIZE, DB_MAX_WAITING, DB_CHECKOUT_TIMEOUT)
+background_gate = ConnectionGate(BACKGROUND_POOL_SIZE, DB_BACKGROUND_MAX_WAITING, DB_BACKGROUND_CHECKOUT_TIMEOUT)
 
 
 def init_pool(host: str, port: int, user: str, password: str, database: str) -> None:
     global _pool
     _pool = mariadb.ConnectionPool(
         pool_name="mypool",
-        pool_size=10,
+        pool_size=POOL_SIZE,
+        host=host,
+        port=port,
+        user=user,
+        password=password,
+        database=database,
+    )
+
+
+def init_background_pool(host: str, port: int, user: str, password: str, database: str) -> None:
+    global _background_pool
+    _background_pool = mariadb.ConnectionPool(
+        pool_name="background",
+        pool_size=BACKGROUND_POOL_SIZE,
         host=host,
         port=port,
         user=user,
@@ -20,4 +141,58 @@ def init_pool(host: str, port: int, user: str, password: str, database: str) ->
 def get_pool() -> mariadb.ConnectionPool:
     if _pool is None:
         raise RuntimeError("Pool not initialized")
-    return _pool
\ No newline at end of file
+    return _pool
+
+
+def checkout() -> tuple[mariadb.Connection, float]:
+    """Connessione del pool delle richieste, passando per gate; ritorna anche l'istante del checkout"""
+    gate.acquire()
+    try:
+        return get_pool().get_connection(), time.monotonic()
+    except BaseException:
+        gate.release(0.0)
+        raise
+
+
+def checkin(conn: mariadb.Connection, checked_out_at: float) -> None:
+    try:
+        conn.close()
+    finally:
+        gate.release(time.monotonic() - checked_out_at)
+
+
+def get_background_pool() -> mariadb.ConnectionPool:
+    if _background_pool is None:
+        raise RuntimeError("Background pool not initialized")
+    return _background_pool
+
+
+def background_checkout() -> tuple[mariadb.Connection, float]:
+    """Connessione del pool di background, passando per background_gate; ritorna anche l'istante del checkout"""
+    background_gate.acquire()
+    try:
+        return get_background_pool().get_connection(), time.monotonic()
+    except BaseException:
+        background_gate.release(0.0)
+        raise
+
+
+def background_checkin(conn: mariadb.Connection, checked_out_at: float) -> None:
+    try:
+        conn.close()
+    finally:
+        background_gate.release(time.monotonic() - checked_out_at)
+
+
+def settings_from_env() -> dict:
+    """Parametri di connessione al database letti dalle variabili d'ambiente"""
+    settings = {
+        "host": os.getenv("DB_HOST", "culturallm-db"),
+        "port": int(os.getenv("DB_PORT", 3306)),
+        "user": os.getenv("DB_USER", ""),
+        "password": os.getenv("DB_PASSWORD", ""),
+        "database": os.getenv("DB_NAME", "culturallm_db"),
+    }
+    if not settings["user"] or not settings["password"]:
+        raise RuntimeError("Environment variables DB_USER and DB_PASSWORD must be set.")
+    return settings
@@ -1,11 +1,15 @@
 from fastapi import APIRouter, BackgroundTasks, Depends, Response, HTTPException
 from typing import Annotated, Literal, Optional, List
 import mariadb
-from endpoints.answers.answers_nlp import background_evaluation_pipeline
-from db.mariadb import db_connection, execute_query
-from endpoints.auth.auth import get_current_user, get_current_user_id
+from db.mariadb import db_connection, execute_query_async, transaction_async
+from endpoints.auth.auth import get_current_principal
+from endpoints.auth.models import Principal
 from endpoints.answers.models import AnswerValues
-import asyncio
+from endpoints.questions.leases import question_leases
+from endpoints.questions.sampler import sampler
+from endpoints.validate.scheduler import scheduler
+from events.feed import record_event
+from jobs.queue import enqueue
 import logging
 
 
@@ -18,25 +22,21 @@ async def submit_answer(
     data : AnswerValues,
     background_tasks: BackgroundTasks,
     db: Annotated[mariadb.Connection, Depends(db_connection)],
-    current_user: Annotated[Optional[str], Depends(get_current_user)] = None,
+    principal: Annotated[Optional[Principal], Depends(get_current_principal)] = None,
     type: Literal["human", "llm"] = "human"
 ) -> Response:
     """
     Inserisci una risposta ad una domanda 
     """
 
-    if type == "human" and current_user is None:
+    if type == "human" and principal is None:
         raise HTTPException(
             status_code=401,
             detail="Errore: l'utente deve essere loggato per poter rispondere ad una domanda.",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    username = current_user if type == "human" else ""
-    if username is None:
-        username = ""
-    
-    user_id = get_current_user_id(username, db)
+    user_id = principal.user_id if type == "human" else None
 
     insert_query = """
         INSERT INTO answers (question_id, user_id, type, answer) 
@@ -44,16 +44,27 @@ async def submit_answer(
     """
     params = (data.question_id, user_id, type, data.answer)
 
-    answer_id = execute_query(db, insert_query, params, fetch=False)
-    
-    if not answer_id:
-        logger.info(f"answer_id={answer_id}")
-        raise HTTPException(status_code=500, detail="Errore interno durante l'inserimento della risposta")
-
-    # Lancia la task asincrona senza bloccare
-    asyncio.create_task(
-        background_evaluation_pipeline(data.question_id, data.answer, answer_id, db)
-    )
+    # risposta, job di valutazione ed evento in un'unica transazione (vedi submit_question)
+    async with transaction_async(db):
+        answer_id = await execute_query_async(db, insert_query, params, fetch=False, commit=False)
+
+        if not answer_id:
+            logger.info(f"answer_id={answer_id}")
+            raise HTTPException(status_code=500, detail="Errore interno durante l'inserimento della risposta")
+
+        # la valutazione viene eseguita dal worker (jobs/worker.py)
+        await enqueue(db, "answer", {
+            "question_id": data.question_id,
+            "answer_id": answer_id,
+            "answer": data.answer,
+            "user_id": user_id,
+        }, commit=False)
+        await record_event(user_id, "answer", answer_id, "queued", conn=db, commit=False)
+
+    # lo stato in memoria si aggiorna solo dopo il commit
+    sampler.mark_answered(user_id, data.question_id)
+    question_leases.release(data.question_id, user_id)
+    scheduler.add_answer(answer_id, user_id)
 
     return Response(status_code=201)
 
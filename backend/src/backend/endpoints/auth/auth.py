@@ -1,25 +1,54 @@
+import os
+import time
+from collections import Counter, defaultdict
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import mariadb
 import logging
 from exceptions import handle_exceptions, Error
-from crypto.jwt import create_access_token, create_refresh_token, decode_access_token, decode_refresh_token
+from crypto.jwt import create_access_token, create_refresh_token, decode_access_token, decode_refresh_token, token_cache_stats
 from crypto.models import TokenExpired, TokenInvalid, TokenMissing
-from db.mariadb import db_connection, execute_query
-from endpoints.auth.models import RefreshTokenRequest, SignupRequest, Token
-from crypto.password import get_salt, hash_password, verify_password
+from db.mariadb import db_connection, execute_query, execute_query_async, pooled_connection
+from endpoints.auth.models import Principal, RefreshTokenRequest, SignupRequest, Token
+from crypto.executor import password_executor
+from crypto.password import DUMMY_HASH, DUMMY_SALT, get_salt, hash_password, verify_and_upgrade
+from lru import LRUCache
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 logger = logging.getLogger("app")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# id degli amministratori, separati da virgola: l'id, a differenza dello username, non cambia proprietario
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()}
 
-def get_current_user(token : Annotated[str, Depends(oauth2_scheme)]) -> str:
+# username -> id per i token emessi prima del claim uid; le rinomine lo invalidano (forget_user_id)
+USER_ID_CACHE_SIZE = int(os.getenv("USER_ID_CACHE_SIZE", 10000))
+USER_ID_CACHE_TTL = float(os.getenv("USER_ID_CACHE_TTL", 300))
+
+USER_ID_QUERY = """
+    SELECT id FROM users WHERE username = ?
+"""
+
+_user_ids = LRUCache(max_items=USER_ID_CACHE_SIZE)
+
+# per rotta: da dove get_current_principal ha preso l'id (token, cache o db)
+user_id_lookups: defaultdict[str, Counter] = defaultdict(Counter)
+
+
+def issue_tokens(username: str, user_id: int) -> Token:
+    claims = {"sub": username, "uid": user_id}
+    return Token(
+        access_token=create_access_token(claims),
+        refresh_token=create_refresh_token(claims),
+        token_type="bearer"
+    )
+
+
+def get_token_payload(token : Annotated[str, Depends(oauth2_scheme)]) -> dict:
     try:
         payload = decode_access_token(token)
-        username = payload.get("sub")
-        if username is None:
+        if payload.get("sub") is None:
             raise TokenInvalid("Token non valido")
     except (TokenExpired, TokenInvalid, TokenMissing) as token_exception:
         raise HTTPException(
@@ -27,7 +56,64 @@ def get_current_user(token : Annotated[str, Depends(oauth2_scheme)]) -> str:
             detail=str(token_exception),
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return username
+    return payload
+
+
+def get_current_user(payload: Annotated[dict, Depends(get_token_payload)]) -> str:
+    return payload["sub"]
+
+
+def get_current_principal(
+    request: Request,
+    payload: Annotated[dict, Depends(get_token_payload)],
+    db: Annotated[mariadb.Connection, Depends(db_connection)],
+) -> Principal:
+    """
+    Username e id dell'utente autenticato. L'id viene dal claim uid del token;
+    solo i token emessi prima che ci fosse richiedono la cache o una query.
+    """
+    username, user_id = payload["sub"], payload.get("uid")
+    if user_id is not None:
+        source = "token"
+    else:
+        user_id, source = _lookup_user_id(username, db)
+
+    route = request.scope.get("route")
+    user_id_lookups[route.path if route else request.url.path][source] += 1
+    return Principal(username=username, user_id=user_id)
+
+
+def get_admin_user(payload: Annotated[dict, Depends(get_token_payload)]) -> int:
+    """
+    Id dell'amministratore autenticato. Conta solo il claim uid del token: i token
+    emessi prima che ci fosse identificano l'utente solo per username, che può
+    essere rinominato o registrato da altri.
+    """
+    user_id = payload.get("uid")
+    if user_id not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Operazione riservata agli amministratori")
+    return user_id
+
+
+def remember_user_id(username: str, user_id: int) -> None:
+    _user_ids.put(username, user_id, expires_at=time.time() + USER_ID_CACHE_TTL)
+
+
+def forget_user_id(username: str) -> None:
+    """Da chiamare quando un username cambia proprietario (rinomina)"""
+    _user_ids.pop(username)
+
+
+def _lookup_user_id(username: str, conn: mariadb.Connection) -> tuple[int | None, str]:
+    user_id = _user_ids.get(username)
+    if user_id is not None:
+        return user_id, "cache"
+
+    row = execute_query(conn, USER_ID_QUERY, (username,), fetchone=True)
+    if not row:
+        return None, "db"
+    remember_user_id(username, row[0])
+    return row[0], "db"
 
 
 
@@ -38,16 +124,38 @@ def get_current_user_id(
     
     if not username: return None
 
-    select_query = """
-        SELECT id FROM users WHERE username = ?
-    """
+    return _lookup_user_id(username, conn)[0]
 
-    user_id = execute_query(conn, select_query, (username,), fetchone=True)
-    
-    if user_id: return user_id[0]
+
+async def get_current_user_id_async(
+        username: str,
+        conn: mariadb.Connection
+) -> int | None:
+    """Come get_current_user_id, ma senza bloccare l'event loop"""
+    if not username: return None
+
+    user_id = _user_ids.get(username)
+    if user_id is not None: return user_id
+
+    user_id = await execute_query_async(conn, USER_ID_QUERY, (username,), fetchone=True)
+
+    if user_id:
+        remember_user_id(username, user_id[0])
+        return user_id[0]
     else: return None
 
 
+def auth_stats() -> dict:
+    return {
+        "token_cache": token_cache_stats(),
+        "user_id_cache": _user_ids.stats(),
+        "lookups": {
+            route: {**counts, "saved": counts["token"] + counts["cache"]}
+            for route, counts in sorted(user_id_lookups.items())
+        },
+    }
+
+
 
 
 @router.post("/login", responses={
@@ -61,39 +169,47 @@ def get_current_user_id(
     }
 })
 @handle_exceptions()
-def login(
+async def login(
     data: Annotated[OAuth2PasswordRequestForm, Depends()], 
     conn: mariadb.Connection = Depends(db_connection)
 ) -> Token:
     #Recover password_hash and salt
-    auth_query = "SELECT password_hash, salt FROM users WHERE username = ?"
-    result = execute_query(conn, auth_query, (data.username,))
+    auth_query = "SELECT id, password_hash, salt FROM users WHERE username = ?"
+    result = await execute_query_async(conn, auth_query, (data.username,))
     
     if not result:
         logger.info(f"result è vuoto: {result}")
+        # stesso lavoro di una password sbagliata: il tempo di risposta non rivela se l'utente esiste
+        await password_executor.run(verify_and_upgrade, DUMMY_HASH, DUMMY_SALT, data.password)
         raise HTTPException(status_code=401, detail="Email o password errati")
 
-    stored_hash, stored_salt_hex = result[0] 
+    user_id, stored_hash, stored_salt_hex = result[0]
     stored_salt = bytes.fromhex(stored_salt_hex)
 
-    #Verify password
-    if not verify_password(stored_hash, stored_salt, data.password):
-        logger.info(f"Email o password errati: \nstored_hash:{stored_hash}, \nstored_salt:{stored_salt}, \npassword: {data.password}")
+    #Verify password (scrypt, nell'executor delle password: 503 se è pieno)
+    valid, upgraded = await password_executor.run(verify_and_upgrade, stored_hash, stored_salt, data.password)
+    if not valid:
+        logger.info(f"Email o password errati per l'utente {data.username}")
         raise HTTPException(status_code=401, detail="Email o password errati")
     
-    #Aggiorna last_login
-    update_query = """
-        UPDATE users 
-        SET last_login = NOW()
-        WHERE username = ?
-    """
-    execute_query(conn, update_query, (data.username,), fetch=False)
+    #Aggiorna last_login e, se l'hash usa parametri vecchi, lo sostituisce con quello nuovo
+    if upgraded is None:
+        update_query = """
+            UPDATE users 
+            SET last_login = NOW()
+            WHERE username = ?
+        """
+        params = (data.username,)
+    else:
+        update_query = """
+            UPDATE users 
+            SET last_login = NOW(), password_hash = ?, salt = ?
+            WHERE username = ?
+        """
+        params = (*upgraded, data.username)
+    await execute_query_async(conn, update_query, params, fetch=False)
 
-    return Token(
-        access_token=create_access_token({"sub": data.username}), 
-        refresh_token=create_refresh_token({"sub": data.username}),
-        token_type="bearer"
-    )
+    return issue_tokens(data.username, user_id)
 
 
 
@@ -109,14 +225,14 @@ def login(
     }
 })
 @handle_exceptions()
-def signup(data: SignupRequest, conn: Annotated[mariadb.Connection, Depends(db_connection)]) -> Token:
+async def signup(data: SignupRequest, conn: Annotated[mariadb.Connection, Depends(db_connection)]) -> Token:
     # Controlla se utente o email esistono già
     check_query = """
         SELECT username 
         FROM users 
         WHERE username = ? OR email = ?
     """
-    existing = execute_query(conn, check_query, (data.username, data.email))
+    existing = await execute_query_async(conn, check_query, (data.username, data.email))
     if existing:
         logger.info(f"Username o email già registrati: \nemail:{data.email} \nusername:{data.username}")
         raise HTTPException(status_code=400, detail="Username o email già registrati")
@@ -124,20 +240,16 @@ def signup(data: SignupRequest, conn: Annotated[mariadb.Connection, Depends(db_c
     # prendo i salt per la passwrod
     salt_pwd = get_salt(16)
     salt_hex = salt_pwd.hex()
-    pwd_hash = hash_password(data.password, salt_pwd)
+    pwd_hash = await password_executor.run(hash_password, data.password, salt_pwd)
     
     insert_query = """
         INSERT INTO users (username, email, nation, password_hash, salt, signup_date, last_login)
         VALUES (?, ?, ?, ?, ?, NOW(), NOW())
     """
 
-    execute_query(conn, insert_query, (data.username, data.email, data.nation, pwd_hash, salt_hex), fetch=False)
+    user_id = await execute_query_async(conn, insert_query, (data.username, data.email, data.nation, pwd_hash, salt_hex), fetch=False)
 
-    return Token(
-        access_token=create_access_token({"sub": data.username}), 
-        refresh_token=create_refresh_token({"sub": data.username}),
-        token_type="bearer"
-    )
+    return issue_tokens(data.username, user_id)
 
 
 @router.post("/refresh", responses={
@@ -164,8 +276,12 @@ def refresh_token(request: RefreshTokenRequest):
         logger.info("Refresh token non valido")
         raise HTTPException(status_code=401, detail="Token non valido")
 
-    return Token(
-        access_token=create_access_token({"sub": username}),
-        refresh_token=create_refresh_token({"sub": username}),
-        token_type="bearer"
-    )
+    user_id = payload.get("uid")
+    if user_id is None:
+        # refresh token emesso prima del claim uid
+        with pooled_connection() as conn:
+            user_id = get_current_user_id(username, conn)
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Token non valido")
+
+    return issue_tokens(username, user_id)
@@ -39,4 +39,9 @@ class Token(BaseModel):
 
 
 class RefreshTokenRequest(BaseModel):
-    refresh_token: str
\ No newline at end of file
+    refresh_token: str
+
+
+class Principal(BaseModel):
+    username: str
+    user_id: int | None = None
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import os
+from typing import Annotated, Optional
+
+import mariadb
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from db.mariadb import db_connection
+from endpoints.auth.auth import get_current_principal
+from endpoints.auth.models import Principal
+from events.feed import missed_events, start_feed
+from events.hub import hub
+
+
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", 15.0))
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+
+def format_event(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+
+
+@router.get("/evaluations")
+async def stream_evaluations(
+    request: Request,
+    principal: Annotated[Principal, Depends(get_current_principal)],
+    db: Annotated[mariadb.Connection, Depends(db_connection)],
+    last_event_id: Annotated[Optional[int], Header()] = None,
+) -> StreamingResponse:
+    """
+    Stream SSE (text/event-stream) dei cambi di stato delle domande e risposte dell'utente:
+    queued, scored, coherence_checked, llm_answer_generated, completed, failed.
+    Chi si riconnette con l'header Last-Event-ID riceve prima gli eventi persi.
+    """
+    user_id = principal.user_id
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="Utente non trovato")
+
+    # ci iscriviamo prima di leggere gli eventi persi, così non ne perdiamo nessuno in mezzo
+    queue = hub.subscribe(user_id)
+    start_feed()
+
+    try:
+        backlog = await missed_events(db, user_id, last_event_id) if last_event_id is not None else []
+    except BaseException:
+        hub.unsubscribe(user_id, queue)
+        raise
+
+    # la connessione al DB viene restituita al pool prima che lo stream inizi:
+    # durante lo stream si legge solo dalla coda in memoria
+    async def stream():
+        last_id = last_event_id or 0
+        try:
+            yield f"retry: {int(EVENTS_KEEPALIVE * 1000)}\n\n"
+            for event in backlog:
+                last_id = event["id"]
+                yield format_event(event)
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE)
+                except TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                # già inviato con il backlog
+                if event["id"] <= last_id:
+                    continue
+                last_id = event["id"]
+                yield format_event(event)
+        finally:
+            hub.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,55 @@
+from typing import Annotated, AsyncIterator, Literal
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from db.mariadb import pooled_connection, run_blocking
+from endpoints.auth.auth import get_admin_user
+from exceptions import Error
+from export.dataset import ENCODERS, EXPORT_CHUNK_SIZE, export_step, parquet_available
+
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+
+def _step(encoder, after: int) -> tuple[bytes, int, int]:
+    # la connessione viene presa per un blocco alla volta, non per tutto il download
+    with pooled_connection() as conn:
+        return export_step(conn, encoder, after)
+
+
+async def stream_dataset(encoder, since_id: int) -> AsyncIterator[bytes]:
+    last_id = since_id
+    while True:
+        data, last_id, count = await run_blocking(_step, encoder, last_id)
+        if data:
+            yield data
+        if count < EXPORT_CHUNK_SIZE:
+            break
+    yield encoder.close()
+
+
+@router.get("/dataset", response_class=StreamingResponse, responses={
+    200: {"content": {"application/x-ndjson": {}, "application/vnd.apache.parquet": {}}},
+    403: {"model": Error},
+    501: {"model": Error, "description": "pyarrow non installato"},
+})
+async def export_dataset(
+    admin: Annotated[int, Depends(get_admin_user)],
+    format: Literal["ndjson", "parquet"] = "ndjson",
+    since_id: int = 0,
+) -> StreamingResponse:
+    """
+    Dataset di domande e risposte con valutazioni e rating aggregati, una riga per risposta
+    (vedi export/dataset.py). Con since_id esporta solo le risposte con id maggiore.
+    Solo per gli utenti in ADMIN_USER_IDS.
+    """
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Export Parquet non disponibile: pyarrow non è installato")
+
+    encoder = ENCODERS[format]()
+    return StreamingResponse(
+        stream_dataset(encoder, since_id),
+        media_type=encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="dataset-{since_id}.{encoder.extension}"'},
+    )
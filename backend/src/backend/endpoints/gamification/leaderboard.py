@@ -1,28 +1,115 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Annotated, List
+import base64
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import Annotated, List, Literal
 import mariadb
-from db.mariadb import db_connection, execute_query
-from endpoints.auth.auth import get_current_user
+from db.mariadb import LazyConnection, db_connection, execute_query
+from endpoints.gamification.ranking import ranking
+from endpoints.gamification.rollups import windowed_page
+from endpoints.gamification.snapshot import LEADERBOARD_TOP_SIZE, serialize, snapshot
+from etag import cached_response
+from endpoints.auth.auth import get_current_principal
 from endpoints.gamification.models import User
-from endpoints.auth.auth import get_current_user_id
+from endpoints.auth.models import Principal
 
 router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
 
+LEADERBOARD_PAGE_SIZE = int(os.getenv("LEADERBOARD_PAGE_SIZE", 100))
+LEADERBOARD_PAGE_MAX = int(os.getenv("LEADERBOARD_PAGE_MAX", 1000))
 
-@router.get("/")
-def get_leaderboard(db: Annotated[mariadb.Connection, Depends(db_connection)])->List[User]:
-    
-    select_query = """
-    SELECT u.username, l.score
-    FROM   users u JOIN leaderboard l ON u.id = l.user_id
-    ORDER BY score DESC"""
-    
-    users = execute_query(db, select_query, dict = True)
-    
-    if not users:
+
+def encode_cursor(score: int, user_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{score}:{user_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, user_id = base64.urlsafe_b64decode(padded).decode().split(":")
+        return int(score), int(user_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursore non valido")
+
+
+def all_time_page(
+    conn: mariadb.Connection,
+    nation: str | None,
+    after: tuple[int, int] | None,
+    limit: int,
+) -> list[dict]:
+    conditions, params = [], []
+    if nation is not None:
+        conditions.append("l.nation = ?")
+        params.append(nation)
+    if after is not None:
+        score, user_id = after
+        conditions.append("(l.score < ? OR (l.score = ? AND l.user_id > ?))")
+        params.extend((score, score, user_id))
+    params.append(limit)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    select_query = f"""
+    SELECT u.username, l.score, l.user_id
+    FROM   leaderboard l JOIN users u ON u.id = l.user_id
+    {where}
+    ORDER BY l.score DESC, l.user_id ASC
+    LIMIT ?"""
+
+    return execute_query(conn, select_query, tuple(params), dict = True) or []
+
+
+@router.get("/", response_model=List[User], responses={304: {"description": "Pagina non modificata"}})
+def get_leaderboard(
+    request: Request,
+    db: Annotated[LazyConnection, Depends(db_connection)],
+    limit: Annotated[int, Query(ge=1, le=LEADERBOARD_PAGE_MAX)] = LEADERBOARD_PAGE_SIZE,
+    cursor: str | None = None,
+    window: Literal["all", "day", "week"] = "all",
+    nation: str | None = None,
+) -> Response:
+    """
+    Classifica paginata per (score decrescente, user_id crescente).
+    Se ci sono altre posizioni l'header X-Next-Cursor contiene il cursore
+    da passare per ottenere la pagina successiva.
+    window=day|week somma i punti fatti oggi o negli ultimi 7 giorni,
+    nation limita la classifica agli utenti di una nazione.
+    """
+    if window == "all" and nation is None and cursor is None and limit <= snapshot.size:
+        # la prima pagina è quella richiesta più spesso: la serviamo dall'istantanea
+        snapshot.ensure_fresh(db)
+        body, etag, users = snapshot.top(limit)
+    else:
+        after = decode_cursor(cursor) if cursor is not None else None
+        if window == "all":
+            users = all_time_page(db, nation, after, limit)
+        else:
+            users = windowed_page(db, window, nation, after, limit)
+        db.release()
+        body, etag = serialize(users), None
+
+    if not users and cursor is None:
         raise HTTPException(status_code=404, detail="No users found")
-    return [User(**user) for user in users]
 
+    headers = {}
+    if len(users) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(users[-1]["score"], users[-1]["user_id"])
+
+    return cached_response(request, body, etag=etag, headers=headers)
+
+
+@router.get("/top", response_model=List[User], responses={304: {"description": "Classifica non modificata"}})
+def get_leaderboard_top(
+    request: Request,
+    db: Annotated[mariadb.Connection, Depends(db_connection)],
+    n: Annotated[int, Query(ge=1, le=LEADERBOARD_TOP_SIZE)] = 10,
+) -> Response:
+    """
+    Le prime n posizioni, da un'istantanea aggiornata ogni pochi secondi.
+    I client che fanno polling con If-None-Match ricevono 304 finché non cambia.
+    """
+    snapshot.ensure_fresh(db)
+    body, etag, _ = snapshot.top(n)
+    return cached_response(request, body, etag=etag)
 
 
 
@@ -30,35 +117,22 @@ def get_leaderboard(db: Annotated[mariadb.Connection, Depends(db_connection)])->
 @router.get("/user")
 def get_user_position(
     db: Annotated[mariadb.Connection, Depends(db_connection)],
-    current_user: Annotated[str, Depends(get_current_user)],
+    principal: Annotated[Principal, Depends(get_current_principal)],
 ) -> int:
-    if current_user is None:
+    if principal is None:
         raise HTTPException(
             status_code=401,
             detail="Errore: l'utente deve autenticarsi per ottenere la propria posizione in classifica",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    username = current_user
-    user_id = get_current_user_id(username, db)
-
-    select_query = """
-        SELECT 
-            (SELECT COUNT(*) + 1
-            FROM leaderboard l2 
-            JOIN users u2 ON l2.user_id = u2.id
-            WHERE l2.score > l.score 
-                OR (l2.score = l.score AND u2.id < u.id)
-            ) AS position
-        FROM leaderboard l
-        JOIN users u ON l.user_id = u.id
-        WHERE l.user_id = ?
-    """
+    user_id = principal.user_id
 
-    user = execute_query(db, select_query, (user_id,), fetchone=True, dict=True)
+    # indice in memoria (endpoints/gamification/ranking.py): O(log n) invece di un COUNT(*) sulla classifica
+    position = ranking.position(user_id, db) if user_id is not None else None
 
-    if not user or "position" not in user:
+    if not position:
         raise HTTPException(status_code=404, detail="Posizione dell'utente non trovata")
 
-    return user["position"]
+    return position
 
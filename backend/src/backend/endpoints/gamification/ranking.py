@@ -0,0 +1,277 @@
+"""
+Posizione in classifica in O(log n), per /leaderboard/user e il profilo.
+
+L'ordine è quello della classifica: score decrescente, a parità di score
+user_id crescente. La posizione di un utente è quindi
+
+    (utenti con score maggiore) + (utenti con lo stesso score e id minore) + 1
+
+Il primo termine viene da un albero di Fenwick indicizzato per score, il secondo
+da un array ordinato degli id per ogni score. L'indice viene caricato all'avvio,
+aggiornato ogni RANK_POLL_INTERVAL secondi con le righe di leaderboard cambiate
+(colonna updated_at) e ricaricato da zero ogni RANK_RELOAD_INTERVAL secondi.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+import mariadb
+
+from db.mariadb import background_connection, execute_query, run_blocking
+
+
+RANK_POLL_INTERVAL = float(os.getenv("RANK_POLL_INTERVAL", 1.0))
+RANK_RELOAD_INTERVAL = float(os.getenv("RANK_RELOAD_INTERVAL", 600.0))
+# le righe aggiornate da transazioni ancora aperte durante un polling vengono rilette al successivo
+RANK_POLL_OVERLAP = timedelta(seconds=float(os.getenv("RANK_POLL_OVERLAP", 2.0)))
+
+logger = logging.getLogger("app")
+
+NO_SCORE = -(2 ** 62)
+
+# la query originale di /leaderboard/user, usata quando l'utente non è ancora nell'indice
+# e come riferimento per il controllo di consistenza
+RANK_QUERY = """
+    SELECT
+        (SELECT COUNT(*) + 1
+        FROM leaderboard l2
+        JOIN users u2 ON l2.user_id = u2.id
+        WHERE l2.score > l.score
+            OR (l2.score = l.score AND u2.id < u.id)
+        ) AS position
+    FROM leaderboard l
+    JOIN users u ON l.user_id = u.id
+    WHERE l.user_id = ?
+"""
+
+
+class RankIndex:
+
+    def __init__(self):
+        # score per user_id (gli id sono autoincrementali, quindi densi); NO_SCORE = assente
+        self._scores = array("q")
+        self._ties: dict[int, array] = {}
+        self._offset = 0
+        self._tree = [0]
+        self._total = 0
+        self._lock = threading.Lock()
+
+    # --- albero di Fenwick sugli score (indice = score - offset + 1) ---
+
+    def _add(self, score: int, delta: int) -> None:
+        i = score - self._offset + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_up_to(self, score: int) -> int:
+        """Utenti con score <= score"""
+        i = min(score - self._offset + 1, len(self._tree) - 1)
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _rebuild_tree(self, low: int, high: int) -> None:
+        """Ricostruisce l'albero per coprire gli score da low a high, in O(ampiezza)"""
+        capacity = 1
+        while capacity < high - low + 1:
+            capacity *= 2
+        self._offset = low
+        tree = [0] * (capacity + 1)
+        for score, ids in self._ties.items():
+            tree[score - low + 1] += len(ids)
+        for i in range(1, capacity + 1):
+            parent = i + (i & -i)
+            if parent <= capacity:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _ensure_range(self, score: int) -> None:
+        low, high = self._offset, self._offset + len(self._tree) - 2
+        if low <= score <= high:
+            return
+        # raddoppiamo l'ampiezza per non ricostruire a ogni nuovo massimo
+        span = max(high - low + 1, 1)
+        self._rebuild_tree(min(low, score - span if score < low else low), max(high, score + span))
+
+    # --- aggiornamenti ---
+
+    def load(self, rows) -> None:
+        """Carica da coppie (user_id, score)"""
+        pairs = sorted(rows, key=lambda row: (row[1], row[0]))
+        fresh = RankIndex()
+        max_id = max((user_id for user_id, _ in pairs), default=0)
+        fresh._scores = array("q", [NO_SCORE]) * (max_id + 1)
+        for user_id, score in pairs:
+            fresh._scores[user_id] = score
+            ids = fresh._ties.get(score)
+            if ids is None:
+                ids = fresh._ties[score] = array("i")
+            ids.append(user_id)
+        fresh._total = len(pairs)
+        if pairs:
+            fresh._rebuild_tree(min(0, pairs[0][1]), pairs[-1][1])
+
+        with self._lock:
+            self._scores, self._ties = fresh._scores, fresh._ties
+            self._offset, self._tree, self._total = fresh._offset, fresh._tree, fresh._total
+
+    def set_score(self, user_id: int, score: int) -> None:
+        with self._lock:
+            if user_id >= len(self._scores):
+                self._scores.extend(array("q", [NO_SCORE]) * (user_id + 1 - len(self._scores)))
+
+            old = self._scores[user_id]
+            if old == score:
+                return
+            if old != NO_SCORE:
+                ids = self._ties[old]
+                del ids[bisect_left(ids, user_id)]
+                if not ids:
+                    del self._ties[old]
+                self._add(old, -1)
+                self._total -= 1
+
+            self._ensure_range(score)
+            ids = self._ties.get(score)
+            if ids is None:
+                ids = self._ties[score] = array("i")
+            insort(ids, user_id)
+            self._add(score, 1)
+            self._scores[user_id] = score
+            self._total += 1
+
+    # --- interrogazioni ---
+
+    def score(self, user_id: int) -> int | None:
+        if user_id >= len(self._scores) or self._scores[user_id] == NO_SCORE:
+            return None
+        return self._scores[user_id]
+
+    def rank(self, user_id: int) -> int | None:
+        with self._lock:
+            score = self.score(user_id)
+            if score is None:
+                return None
+            above = self._total - self._count_up_to(score)
+            return above + bisect_left(self._ties[score], user_id) + 1
+
+    def __len__(self) -> int:
+        return self._total
+
+    def user_ids(self) -> list[int]:
+        return [user_id for user_id, score in enumerate(self._scores) if score != NO_SCORE]
+
+
+class Ranking:
+    """RankIndex più lo stato del caricamento e del polling dal DB"""
+
+    def __init__(self):
+        self.index = RankIndex()
+        self.loaded_at: float | None = None
+        self.polled_at = 0.0
+        self._watermark: datetime | None = None
+        self._refreshing = threading.Lock()
+        self.polls = 0
+        self.updates = 0
+        self.fallbacks = 0
+
+    def reload(self, conn: mariadb.Connection) -> None:
+        with self._refreshing:
+            self._reload(conn)
+
+    def _reload(self, conn: mariadb.Connection) -> None:
+        now = execute_query(conn, "SELECT NOW(3)", fetchone=True)[0]
+        rows = execute_query(conn, "SELECT user_id, score FROM leaderboard")
+        self.index.load(rows or [])
+        self._watermark = now - RANK_POLL_OVERLAP
+        self.loaded_at = self.polled_at = time.monotonic()
+
+    def poll(self, conn: mariadb.Connection) -> None:
+        """Applica le righe di leaderboard cambiate dall'ultimo polling"""
+        with self._refreshing:
+            if self._watermark is None:
+                self._reload(conn)
+                return
+            select_query = """
+                SELECT user_id, score, updated_at
+                FROM leaderboard
+                WHERE updated_at >= ?
+                ORDER BY updated_at
+            """
+            rows = execute_query(conn, select_query, (self._watermark,)) or []
+            for user_id, score, _ in rows:
+                self.index.set_score(user_id, score)
+            if rows:
+                self._watermark = max(self._watermark, rows[-1][2] - RANK_POLL_OVERLAP)
+            self.polls += 1
+            self.updates += len(rows)
+            self.polled_at = time.monotonic()
+
+    def ensure_loaded(self, conn: mariadb.Connection) -> None:
+        """Carica l'indice al primo uso, se il task di polling non l'ha già fatto"""
+        if self.loaded_at is None:
+            with self._refreshing:
+                if self.loaded_at is None:
+                    self._reload(conn)
+
+    def position(self, user_id: int, conn: mariadb.Connection) -> int | None:
+        self.ensure_loaded(conn)
+        rank = self.index.rank(user_id)
+        if rank is not None:
+            return rank
+        # utente registrato dopo l'ultimo polling
+        self.fallbacks += 1
+        row = execute_query(conn, RANK_QUERY, (user_id,), fetchone=True)
+        return row[0] if row else None
+
+    def check_consistency(self, conn: mariadb.Connection, sample: int) -> dict:
+        """Confronta la posizione di sample utenti a caso con quella calcolata dalla query SQL"""
+        self.ensure_loaded(conn)
+        user_ids = self.index.user_ids()
+        mismatches = []
+        for user_id in random.sample(user_ids, min(sample, len(user_ids))):
+            expected = execute_query(conn, RANK_QUERY, (user_id,), fetchone=True)
+            actual = self.index.rank(user_id)
+            if expected is not None and expected[0] != actual:
+                mismatches.append({"user_id": user_id, "index": actual, "sql": expected[0]})
+        return {"checked": min(sample, len(user_ids)), "mismatches": mismatches}
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.index),
+            "loaded": self.loaded_at is not None,
+            "since_poll": time.monotonic() - self.polled_at if self.loaded_at is not None else None,
+            "polls": self.polls,
+            "updates": self.updates,
+            "fallbacks": self.fallbacks,
+        }
+
+
+ranking = Ranking()
+
+
+def _refresh_in_background() -> None:
+    with background_connection() as conn:
+        if ranking.loaded_at is None or time.monotonic() - ranking.loaded_at >= RANK_RELOAD_INTERVAL:
+            ranking.reload(conn)
+        else:
+            ranking.poll(conn)
+
+
+async def refresh_periodically() -> None:
+    """Carica l'indice all'avvio del backend e lo tiene aggiornato"""
+    while True:
+        try:
+            await run_blocking(_refresh_in_background)
+        except Exception:
+            logger.exception("Errore durante l'aggiornamento dell'indice della classifica")
+        await asyncio.sleep(RANK_POLL_INTERVAL)
@@ -0,0 +1,60 @@
+"""
+Classifiche giornaliere e settimanali, anche per nazione.
+
+I punteggi vengono sommati per utente e per giorno nella tabella
+leaderboard_daily dai trigger su logs (mariadb/init/trigger.sql), mentre i log
+vengono scritti. Una classifica su una finestra legge solo le righe dei giorni
+della finestra, una per utente attivo per giorno: il costo non dipende dalla
+dimensione di logs.
+"""
+import mariadb
+
+from db.mariadb import execute_query
+
+
+# giorni precedenti a oggi inclusi nella finestra
+WINDOW_DAYS = {
+    "day": 0,
+    "week": 6,
+}
+
+
+def windowed_page(
+    conn: mariadb.Connection,
+    window: str,
+    nation: str | None,
+    after: tuple[int, int] | None,
+    limit: int,
+) -> list[dict]:
+    """
+    Una pagina della classifica della finestra, ordinata per (score decrescente,
+    user_id crescente), a partire dalla posizione successiva ad after (score, user_id).
+    """
+    where = "WHERE d.day >= CURDATE() - INTERVAL ? DAY"
+    params: list = [WINDOW_DAYS[window]]
+    if nation is not None:
+        where += " AND d.nation = ?"
+        params.append(nation)
+
+    having = ""
+    if after is not None:
+        score, user_id = after
+        having = "HAVING total < ? OR (total = ? AND d.user_id > ?)"
+        params.extend((score, score, user_id))
+    params.append(limit)
+
+    select_query = f"""
+    SELECT u.username, t.total AS score, t.user_id
+    FROM (
+        -- SUM torna DECIMAL, che json.dumps (serialize) non accetta
+        SELECT d.user_id, CAST(SUM(d.score) AS SIGNED) AS total
+        FROM leaderboard_daily d
+        {where}
+        GROUP BY d.user_id
+        {having}
+        ORDER BY total DESC, d.user_id ASC
+        LIMIT ?
+    ) t JOIN users u ON u.id = t.user_id
+    ORDER BY t.total DESC, t.user_id ASC"""
+
+    return execute_query(conn, select_query, tuple(params), dict=True) or []
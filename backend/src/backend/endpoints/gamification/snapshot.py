@@ -0,0 +1,115 @@
+"""
+Istantanea in memoria delle prime posizioni della classifica.
+
+/leaderboard/top e la prima pagina di /leaderboard/ vengono serviti da qui:
+la query sulle prime LEADERBOARD_TOP_SIZE posizioni viene rifatta al più ogni
+LEADERBOARD_SNAPSHOT_INTERVAL secondi, o prima se questo processo ha cambiato
+dei punteggi (invalidate), ma mai più spesso di LEADERBOARD_SNAPSHOT_MIN_INTERVAL.
+I corpi JSON sono serializzati una volta per versione e la versione fa da ETag.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import mariadb
+
+from db.mariadb import execute_query
+
+
+LEADERBOARD_TOP_SIZE = int(os.getenv("LEADERBOARD_TOP_SIZE", 1000))
+LEADERBOARD_SNAPSHOT_INTERVAL = float(os.getenv("LEADERBOARD_SNAPSHOT_INTERVAL", 5.0))
+LEADERBOARD_SNAPSHOT_MIN_INTERVAL = float(os.getenv("LEADERBOARD_SNAPSHOT_MIN_INTERVAL", 1.0))
+
+TOP_QUERY = """
+    SELECT u.username, l.score, l.user_id
+    FROM leaderboard l JOIN users u ON u.id = l.user_id
+    ORDER BY l.score DESC, l.user_id ASC
+    LIMIT ?
+"""
+
+
+def serialize(rows: list[dict]) -> bytes:
+    return json.dumps(
+        [{"username": row["username"], "score": row["score"]} for row in rows],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+class LeaderboardSnapshot:
+
+    def __init__(
+        self,
+        size: int = LEADERBOARD_TOP_SIZE,
+        interval: float = LEADERBOARD_SNAPSHOT_INTERVAL,
+        min_interval: float = LEADERBOARD_SNAPSHOT_MIN_INTERVAL,
+    ):
+        self.size = size
+        self.interval = interval
+        self.min_interval = min_interval
+        self.rows: list[dict] = []
+        self.version = ""
+        self._bodies: dict[int, bytes] = {}
+        self._taken_at: float | None = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self.refreshes = 0
+        self.served = 0
+
+    def load(self, rows: list[dict]) -> None:
+        body = serialize(rows)
+        with self._lock:
+            self.rows = rows
+            self.version = hashlib.sha1(body).hexdigest()[:16]
+            self._bodies = {len(rows): body}
+            self._taken_at = time.monotonic()
+            self._dirty = False
+            self.refreshes += 1
+
+    def invalidate(self) -> None:
+        """Da chiamare quando questo processo cambia dei punteggi"""
+        self._dirty = True
+
+    def is_stale(self) -> bool:
+        if self._taken_at is None:
+            return True
+        age = time.monotonic() - self._taken_at
+        return age >= self.interval or (self._dirty and age >= self.min_interval)
+
+    def ensure_fresh(self, conn: mariadb.Connection) -> None:
+        if not self.is_stale():
+            return
+        # una sola richiesta rifà la query, le altre usano l'istantanea corrente
+        if not self._refreshing.acquire(blocking=self._taken_at is None):
+            return
+        try:
+            if self.is_stale():
+                self.load(execute_query(conn, TOP_QUERY, (self.size,), dict=True) or [])
+        finally:
+            self._refreshing.release()
+
+    def top(self, n: int) -> tuple[bytes, str, list[dict]]:
+        """Corpo JSON, ETag e righe delle prime n posizioni"""
+        with self._lock:
+            rows = self.rows[:n]
+            body = self._bodies.get(len(rows))
+            if body is None:
+                body = self._bodies[len(rows)] = serialize(rows)
+            version = self.version
+        self.served += 1
+        return body, f'"{version}-{len(rows)}"', rows
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.rows),
+            "version": self.version,
+            "age": time.monotonic() - self._taken_at if self._taken_at is not None else None,
+            "refreshes": self.refreshes,
+            "served": self.served,
+        }
+
+
+snapshot = LeaderboardSnapshot()
@@ -0,0 +1,306 @@
+"""
+Cache degli avatar su due livelli.
+
+1. LRU in memoria con un budget in byte (AVATAR_MEMORY_BYTES);
+2. file su disco in AVATAR_CACHE_DIR, con nome dato dall'hash di
+   versione, dimensione e username: il PNG è deterministico, quindi
+   lo stesso nome corrisponde sempre allo stesso contenuto. Lo spazio
+   occupato è limitato ad AVATAR_DISK_BYTES: oltre, si cancellano i file
+   letti meno di recente (la lettura aggiorna l'mtime).
+
+Solo in caso di miss su entrambi l'avatar viene disegnato, in un pool di
+processi: il rendering con PIL è CPU e non deve occupare l'event loop né i
+thread delle richieste. Richieste contemporanee per lo stesso avatar
+aspettano lo stesso rendering.
+
+Le sprite sheet di /profile/avatars/ seguono la stessa strada: gli avatar
+mancanti vengono divisi tra i processi del pool, la sprite composta viene
+tenuta nella stessa LRU (la chiave dipende dall'insieme degli username).
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from endpoints.profile.identicon import AVATAR_VERSION, compose_sprite, render, render_many, sprite_columns
+from etag import make_etag
+from lru import LRUCache
+from nlp.batching import SingleFlight
+
+
+# 200 resta accettata per i client della prima versione di ?size= (che era la dimensione predefinita)
+AVATAR_SIZES = (32, 64, 128, 200, 240)
+# 240: le dimensioni dell'avatar prima delle varianti
+AVATAR_DEFAULT_SIZE = 240
+AVATAR_MEMORY_BYTES = int(os.getenv("AVATAR_MEMORY_BYTES", 32 * 1024 * 1024))
+# gli username arrivano da chiamanti non autenticati: il disco va limitato come la memoria
+AVATAR_DISK_BYTES = int(os.getenv("AVATAR_DISK_BYTES", 256 * 1024 * 1024))
+AVATAR_CACHE_DIR = os.getenv("AVATAR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "culturallm-avatars"))
+AVATAR_RENDER_WORKERS = int(os.getenv("AVATAR_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+AVATAR_BATCH_MAX = int(os.getenv("AVATAR_BATCH_MAX", 100))
+# sotto questa soglia mandare gli avatar a più processi costa più del rendering stesso
+AVATAR_RENDER_CHUNK_MIN = int(os.getenv("AVATAR_RENDER_CHUNK_MIN", 8))
+# l'avatar di un username non cambia mai (a parità di AVATAR_VERSION)
+AVATAR_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+logger = logging.getLogger("app")
+
+# valori: (png, etag)
+_memory = LRUCache(max_weight=AVATAR_MEMORY_BYTES, weigher=lambda entry: len(entry[0]))
+_in_flight = SingleFlight()
+_pool: ProcessPoolExecutor | None = None
+
+# byte occupati in AVATAR_CACHE_DIR, calcolati alla prima scrittura; None se da ricalcolare
+_disk_lock = threading.Lock()
+_disk_dir: str | None = None
+_disk_bytes: int | None = None
+
+stats = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "renders": 0,
+    "render_seconds": 0.0,
+    "sprite_hits": 0,
+    "sprites": 0,
+    "disk_evictions": 0,
+}
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: il processo del backend ha già dei thread, fork non è sicuro
+        _pool = ProcessPoolExecutor(
+            max_workers=AVATAR_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_render_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def avatar_key(username: str, size: int) -> str:
+    return hashlib.sha256(f"{AVATAR_VERSION}\0{size}\0{username}".encode()).hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(AVATAR_CACHE_DIR, key[:2], f"{key}.png")
+
+
+def read_disk(key: str) -> bytes | None:
+    path = _path(key)
+    try:
+        with open(path, "rb") as f:
+            png = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        # l'mtime fa da ordine LRU per _evict_disk
+        os.utime(path)
+    except OSError:
+        pass
+    return png
+
+
+def _disk_files() -> list[tuple[float, int, str]]:
+    """(mtime, byte, percorso) dei PNG in AVATAR_CACHE_DIR"""
+    files = []
+    for root, _, names in os.walk(AVATAR_CACHE_DIR):
+        for name in names:
+            if not name.endswith(".png"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+    return files
+
+
+def _evict_disk() -> int:
+    """Cancella i file usati meno di recente finché si scende al 90% di AVATAR_DISK_BYTES"""
+    files = sorted(_disk_files())
+    total = sum(size for _, size, _ in files)
+    target = AVATAR_DISK_BYTES * 0.9
+    evicted = 0
+    for _, size, path in files:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        evicted += 1
+    stats["disk_evictions"] += evicted
+    return total
+
+
+def _account_disk(added: int) -> None:
+    global _disk_dir, _disk_bytes
+    with _disk_lock:
+        if _disk_bytes is None or _disk_dir != AVATAR_CACHE_DIR:
+            _disk_dir = AVATAR_CACHE_DIR
+            _disk_bytes = sum(size for _, size, _ in _disk_files())
+        else:
+            _disk_bytes += added
+        if _disk_bytes > AVATAR_DISK_BYTES:
+            _disk_bytes = _evict_disk()
+
+
+def write_disk(key: str, png: bytes) -> None:
+    """Scrittura atomica: un lettore non vede mai un file a metà"""
+    path = _path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(png)
+        os.replace(tmp, path)
+        _account_disk(len(png))
+    except OSError:
+        # la cache su disco è un'ottimizzazione: se non si può scrivere si va avanti
+        logger.exception(f"Impossibile salvare l'avatar {key} su disco")
+
+
+def remember(key: str, png: bytes) -> tuple[bytes, str]:
+    entry = (png, make_etag(png))
+    _memory.put(key, entry)
+    return entry
+
+
+async def _load(username: str, size: int, key: str) -> tuple[bytes, str]:
+    png = await asyncio.to_thread(read_disk, key)
+    if png is not None:
+        stats["disk_hits"] += 1
+        return remember(key, png)
+
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    png = await loop.run_in_executor(get_render_pool(), render, username, size)
+    stats["renders"] += 1
+    stats["render_seconds"] += time.perf_counter() - start
+
+    await asyncio.to_thread(write_disk, key, png)
+    return remember(key, png)
+
+
+async def get_avatar_png(username: str, size: int = AVATAR_DEFAULT_SIZE) -> tuple[bytes, str]:
+    """PNG e ETag dell'avatar, dalla memoria, dal disco o disegnato"""
+    key = avatar_key(username, size)
+    entry = _memory.get(key)
+    if entry is not None:
+        stats["memory_hits"] += 1
+        return entry
+    return await _in_flight.run(key, lambda: _load(username, size, key))
+
+
+async def _render_many(requests: list[tuple[str, int]]) -> list[bytes]:
+    """Divide i rendering tra i processi del pool, a blocchi di almeno AVATAR_RENDER_CHUNK_MIN"""
+    chunk = max(AVATAR_RENDER_CHUNK_MIN, math.ceil(len(requests) / AVATAR_RENDER_WORKERS))
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(pool, render_many, requests[i:i + chunk])
+        for i in range(0, len(requests), chunk)
+    ))
+    stats["renders"] += len(requests)
+    stats["render_seconds"] += time.perf_counter() - start
+    return [png for result in results for png in result]
+
+
+async def get_avatars_png(usernames: list[str], size: int) -> list[tuple[bytes, str]]:
+    """Come get_avatar_png per più username, con un solo passaggio su disco e sul pool"""
+    keys = [avatar_key(username, size) for username in usernames]
+    found = {}
+    missing = []
+    for username, key in zip(usernames, keys):
+        entry = _memory.get(key)
+        if entry is not None:
+            stats["memory_hits"] += 1
+            found[key] = entry
+        else:
+            missing.append((username, key))
+
+    if missing:
+        on_disk = await asyncio.to_thread(lambda: [read_disk(key) for _, key in missing])
+        to_render = []
+        for (username, key), png in zip(missing, on_disk):
+            if png is not None:
+                stats["disk_hits"] += 1
+                found[key] = remember(key, png)
+            else:
+                to_render.append((username, key))
+
+        if to_render:
+            rendered = await _render_many([(username, size) for username, _ in to_render])
+            new = [(key, png) for (_, key), png in zip(to_render, rendered)]
+            await asyncio.to_thread(lambda: [write_disk(key, png) for key, png in new])
+            for key, png in new:
+                found[key] = remember(key, png)
+
+    return [found[key] for key in keys]
+
+
+def sprite_key(usernames: list[str], size: int) -> str:
+    joined = "\n".join(usernames)
+    return "sprite:" + hashlib.sha256(f"{AVATAR_VERSION}\0{size}\0{joined}".encode()).hexdigest()
+
+
+async def _build_sprite(usernames: list[str], size: int, key: str) -> tuple[bytes, str]:
+    images = await get_avatars_png(usernames, size)
+    loop = asyncio.get_running_loop()
+    sheet = await loop.run_in_executor(get_render_pool(), compose_sprite, [png for png, _ in images], size)
+
+    columns = sprite_columns(len(usernames))
+    body = json.dumps({
+        "size": size,
+        "offsets": {
+            username: [(i % columns) * size, (i // columns) * size]
+            for i, username in enumerate(usernames)
+        },
+        "sprite": base64.b64encode(sheet).decode(),
+    }, ensure_ascii=False, separators=(",", ":")).encode()
+    stats["sprites"] += 1
+    return remember(key, body)
+
+
+async def get_sprite(usernames: list[str], size: int) -> tuple[bytes, str]:
+    """
+    Corpo JSON (offset di ogni username nella sprite e sprite PNG in base64) ed ETag.
+    Gli username vengono ordinati, così lo stesso insieme dà sempre la stessa sprite.
+    """
+    usernames = sorted(set(usernames))
+    key = sprite_key(usernames, size)
+    entry = _memory.get(key)
+    if entry is not None:
+        stats["sprite_hits"] += 1
+        return entry
+    return await _in_flight.run(key, lambda: _build_sprite(usernames, size, key))
+
+
+def avatar_stats() -> dict:
+    return {
+        **stats,
+        "memory": _memory.stats(),
+        "render_workers": AVATAR_RENDER_WORKERS,
+        "cache_dir": AVATAR_CACHE_DIR,
+        "disk_bytes": _disk_bytes,
+        "disk_max_bytes": AVATAR_DISK_BYTES,
+    }
@@ -0,0 +1,68 @@
+"""
+Storico delle domande e delle risposte di un utente, a pagine o in streaming.
+
+Le pagine sono per id crescente con un cursore keyset (id > cursore), così
+ogni pagina costa lo stesso indipendentemente da quanto è lungo lo storico.
+Lo streaming NDJSON legge lo storico a blocchi di HISTORY_STREAM_CHUNK righe
+e li scrive man mano: in memoria c'è al più un blocco, e la connessione al
+DB viene presa solo per la query di ogni blocco, non per tutta la durata
+del download (un client lento terrebbe occupata una connessione del pool).
+"""
+import json
+import os
+from typing import AsyncIterator
+
+import mariadb
+
+from db.mariadb import execute_query, pooled_connection, run_blocking
+
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 100))
+HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", 1000))
+HISTORY_STREAM_CHUNK = int(os.getenv("HISTORY_STREAM_CHUNK", 500))
+
+QUESTIONS_QUERY = """
+    SELECT q.id, q.question, q.topic
+    FROM questions q
+    WHERE q.user_id = ? AND q.id > ?
+    ORDER BY q.id ASC
+    LIMIT ?
+"""
+
+# logs ha un indice su (action_type, action_id)
+ANSWERS_QUERY = """
+    SELECT a.id, q.topic, q.question, a.answer, l.score
+    FROM answers a JOIN questions q ON a.question_id = q.id
+    JOIN logs l ON (l.action_type = 'answer' AND l.action_id = a.id)
+    WHERE a.user_id = ? AND a.id > ?
+    ORDER BY a.id ASC
+    LIMIT ?
+"""
+
+
+def history_page(
+    conn: mariadb.Connection,
+    query: str,
+    user_id: int,
+    after: int | None,
+    limit: int,
+) -> list[dict]:
+    return execute_query(conn, query, (user_id, after or 0, limit), dict=True) or []
+
+
+def fetch_chunk(query: str, user_id: int, after: int) -> list[dict]:
+    with pooled_connection() as conn:
+        return history_page(conn, query, user_id, after, HISTORY_STREAM_CHUNK)
+
+
+async def stream_history(query: str, user_id: int, after: int | None = None) -> AsyncIterator[str]:
+    """Una riga JSON per elemento, un blocco di righe alla volta"""
+    last_id = after or 0
+    while True:
+        rows = await run_blocking(fetch_chunk, query, user_id, last_id)
+        if not rows:
+            return
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+        if len(rows) < HISTORY_STREAM_CHUNK:
+            return
+        last_id = rows[-1]["id"]
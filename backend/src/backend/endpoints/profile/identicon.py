@@ -0,0 +1,62 @@
+"""
+Rendering degli avatar (identicon di pydenticon) e delle sprite sheet.
+
+Il modulo importa solo pydenticon e PIL: le funzioni vengono eseguite nei processi
+del pool di rendering (endpoints/profile/avatars.py), che lo importano da zero.
+"""
+import hashlib
+import io
+import math
+
+import pydenticon
+from PIL import Image
+
+
+# cambiando l'aspetto degli avatar va cambiata la versione, che entra nelle chiavi della cache
+AVATAR_VERSION = "2"
+
+generator = pydenticon.Generator(
+        5, 5,
+        digest=hashlib.sha1,
+        foreground = [ "rgb(128,36,51)" ],
+        background="rgb(255,255,255)",
+    )
+
+
+def render(username: str, size: int) -> bytes:
+    """
+    PNG size x size. pydenticon aggiunge il margine alla larghezza data,
+    che qui è quindi quella senza margine: con size=240 si ottiene
+    esattamente l'avatar originale (200px più 20px di margine per lato).
+    """
+    padding = size // 12
+    return generator.generate(
+        data = username,
+        width = size - 2 * padding,
+        height = size - 2 * padding,
+        padding = (padding, padding, padding, padding),
+        output_format='png'
+    )
+
+
+def render_many(requests: list[tuple[str, int]]) -> list[bytes]:
+    """Più avatar in una sola chiamata al processo, per ridurre il costo di pickling"""
+    return [render(username, size) for username, size in requests]
+
+
+def sprite_columns(count: int) -> int:
+    """Colonne della sprite: griglia il più possibile quadrata"""
+    return max(1, math.ceil(math.sqrt(count)))
+
+
+def compose_sprite(images: list[bytes], size: int) -> bytes:
+    """Affianca i PNG size x size in una griglia, riga per riga, nell'ordine dato"""
+    columns = sprite_columns(len(images))
+    rows = max(1, math.ceil(len(images) / columns))
+    sheet = Image.new("RGB", (columns * size, rows * size), "white")
+    for i, png in enumerate(images):
+        with Image.open(io.BytesIO(png)) as image:
+            sheet.paste(image, ((i % columns) * size, (i // columns) * size))
+    out = io.BytesIO()
+    sheet.save(out, format="PNG", optimize=True)
+    return out.getvalue()
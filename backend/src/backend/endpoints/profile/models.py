@@ -19,4 +19,12 @@ class ProfileSummary(BaseModel):
 
 class UpdateUserData(BaseModel):
     username: str | None = None
-    password: str | None = None
\ No newline at end of file
+    password: str | None = None
+
+
+class AvatarSprite(BaseModel):
+    size: int
+    # username -> [x, y] dell'angolo in alto a sinistra del suo avatar nella sprite
+    offsets: dict[str, list[int]]
+    # PNG in base64
+    sprite: str
@@ -1,16 +1,18 @@
-import hashlib
 from typing import Annotated, List
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 import mariadb
-import pydenticon
 from exceptions import Error
+from etag import cached_response
+from endpoints.profile.avatars import AVATAR_BATCH_MAX, AVATAR_CACHE_CONTROL, AVATAR_DEFAULT_SIZE, AVATAR_SIZES, get_avatar_png, get_sprite
 from endpoints.profile.models import UpdateUserData
-from endpoints.auth.auth import get_current_user
-from db.mariadb import db_connection, execute_query
+from endpoints.auth.auth import forget_user_id, get_current_principal, get_current_user
+from db.mariadb import LazyConnection, db_connection, execute_query
 from endpoints.questions.models import QuestionBasic
-from endpoints.auth.auth import get_current_user_id
+from endpoints.auth.models import Principal
 from endpoints.answers.models import AnswerBasic
-from endpoints.profile.models import ProfileSummary
+from endpoints.profile.models import AvatarSprite, ProfileSummary
+from endpoints.profile.history import ANSWERS_QUERY, HISTORY_PAGE_MAX, HISTORY_PAGE_SIZE, QUESTIONS_QUERY, history_page, stream_history
 from endpoints.gamification.leaderboard import get_user_position
 from endpoints.profile.levels import get_level_and_threshold    
 import re
@@ -19,35 +21,29 @@ import logging
 router = APIRouter(prefix="/profile", tags=["profile"])
 logger = logging.getLogger("app"
                            )
-generator = pydenticon.Generator(
-        5, 5,
-        digest=hashlib.sha1,
-        foreground = [ "rgb(128,36,51)" ],
-        background="rgb(255,255,255)",
-    )
 
 
 
 ## Questo endpoint ritorna tutte le informazioni necessarie per il profilo dell'utente
 @router.get("/")
 def profile(
-    current_user: Annotated[str, Depends(get_current_user)], 
+    principal: Annotated[Principal, Depends(get_current_principal)], 
     db: Annotated[mariadb.Connection, Depends(db_connection)]
 ) -> ProfileSummary:
-    logger.info(f"Looking up user: {current_user}")
+    logger.info(f"Looking up user: {principal.username}")
     get_query = """
         SELECT u.username, u.email, u.signup_date, u.last_login, u.nation, l.num_questions, l.num_answers, l.score
         FROM users u JOIN leaderboard l ON u.id = l.user_id
-        WHERE u.username = ?
+        WHERE u.id = ?
     """
-    result = execute_query(db, get_query, (current_user,), dict=True, fetchone=True)
+    result = execute_query(db, get_query, (principal.user_id,), dict=True, fetchone=True)
     if not result:
         raise HTTPException(status_code=404, detail="Utente non trovato")
     
     result["level"] = get_level_and_threshold(result["score"])["level"]
     result["level_threshold"] = get_level_and_threshold(result["score"])["next_threshold"]
     
-    user_rank : int = get_user_position(db, current_user)
+    user_rank : int = get_user_position(db, principal)
 
     if not user_rank:
         raise HTTPException(status_code=404, detail="User position not found")
@@ -88,10 +84,11 @@ def edit_profile(
         params.append(data.username)
     
     if data.password:
+        from crypto.executor import password_executor
         from crypto.password import get_salt, hash_password
         salt_pwd = get_salt(16)
         salt_hex = salt_pwd.hex()
-        pwd_hash = hash_password(data.password, salt_pwd)
+        pwd_hash = password_executor.call(hash_password, data.password, salt_pwd)
 
         update_fields.append("password_hash = ?, salt = ?")
         params.extend([pwd_hash, salt_hex])
@@ -105,6 +102,11 @@ def edit_profile(
         """
     
     execute_query(db, update_query, tuple(params), fetch=False)
+
+    if data.username:
+        # la cache username -> id non deve più risolvere il vecchio nome
+        forget_user_id(current_user)
+        forget_user_id(data.username)
     
     return Response(status_code=204)
 
@@ -117,23 +119,56 @@ def edit_profile(
             }
         },
     },
+    304: {"description": "Avatar non modificato"},
     422: {
         "model": Error
     }
 })
-def get_avatar(username: str = Query(...)) -> Response:
+async def get_avatar(
+    request: Request,
+    username: str = Query(...),
+    size: int = Query(AVATAR_DEFAULT_SIZE),
+) -> Response:
     """
     Retrieve the avatar of the user.
+    L'avatar dipende solo da username e size: la risposta può essere
+    tenuta in cache dal client per sempre.
     """
-    image = generator.generate(
-        data = username, 
-        width = 200, 
-        height = 200, 
-        padding = (20, 20, 20, 20),
-        output_format='png'
+    if size not in AVATAR_SIZES:
+        raise HTTPException(status_code=422, detail=f"Dimensione non valida, quelle disponibili sono {list(AVATAR_SIZES)}")
+
+    image, etag = await get_avatar_png(username, size)
+
+    return cached_response(
+        request, image, media_type="image/png", etag=etag,
+        headers={"Cache-Control": AVATAR_CACHE_CONTROL},
     )
 
-    return Response(content=image, media_type="image/png")
+
+
+
+
+@router.get("/avatars/", response_model=AvatarSprite, responses={
+    304: {"description": "Sprite non modificata"},
+    422: {
+        "model": Error
+    }
+})
+async def get_avatars(
+    request: Request,
+    username: Annotated[List[str], Query(min_length=1, max_length=AVATAR_BATCH_MAX)],
+    size: int = Query(64),
+) -> Response:
+    """
+    Gli avatar di più utenti in una sola risposta, per classifiche e liste:
+    una sprite PNG (in base64) e la posizione di ogni username al suo interno.
+    """
+    if size not in AVATAR_SIZES:
+        raise HTTPException(status_code=422, detail=f"Dimensione non valida, quelle disponibili sono {list(AVATAR_SIZES)}")
+
+    body, etag = await get_sprite(username, size)
+
+    return cached_response(request, body, etag=etag, headers={"Cache-Control": AVATAR_CACHE_CONTROL})
 
 
 
@@ -142,60 +177,90 @@ def get_avatar(username: str = Query(...)) -> Response:
 ##Questo endpoint ritorna le domande scritte dall'utente
 @router.get("/questions/")
 def get_user_questions(
-    current_user: Annotated[str, Depends(get_current_user)],
-    db: Annotated[mariadb.Connection, Depends(db_connection)]) -> List[QuestionBasic]:
-
-    if current_user is None:
+    principal: Annotated[Principal, Depends(get_current_principal)],
+    db: Annotated[LazyConnection, Depends(db_connection)],
+    response: Response,
+    limit: Annotated[int, Query(ge=1, le=HISTORY_PAGE_MAX)] = HISTORY_PAGE_SIZE,
+    cursor: int | None = None,
+) -> List[QuestionBasic]:
+    """
+    Domande scritte dall'utente, per id crescente, a pagine di limit.
+    Se ce ne sono altre l'header X-Next-Cursor contiene il cursore della pagina successiva.
+    """
+    if principal is None:
         return Response(status_code=401, content="Errore: l'utente deve essere autenticato per ottenere tutte le domande che ha scritto")
 
-    username = current_user
+    user_id = principal.user_id
 
-    user_id = get_current_user_id(username, db)
+    rows = history_page(db, QUESTIONS_QUERY, user_id, cursor, limit)
+    # fino a HISTORY_PAGE_MAX righe da validare e serializzare: la connessione non serve più
+    db.release()
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1]["id"])
 
-    get_query = """
-        SELECT q.id, q.question, q.topic
-        FROM questions q
-        WHERE q.user_id = ?
-        ORDER BY q.id ASC
-    """
-    rows = execute_query(db, get_query, (user_id,), dict=True)
-    
-    if rows is None:
-        raise HTTPException(status_code=404, detail="Nessuna domanda scritta dall'utente.")
-    
     return [QuestionBasic(**row) for row in rows]
 
 
+@router.get("/questions/ndjson", response_class=StreamingResponse, responses={
+    200: {"content": {"application/x-ndjson": {}}},
+})
+async def stream_user_questions(
+    principal: Annotated[Principal, Depends(get_current_principal)],
+    cursor: int | None = None,
+) -> StreamingResponse:
+    """Tutte le domande scritte dall'utente, una per riga (NDJSON), con memoria costante"""
+    if principal is None:
+        return Response(status_code=401, content="Errore: l'utente deve essere autenticato per ottenere tutte le domande che ha scritto")
+
+    user_id = principal.user_id
+
+    return StreamingResponse(stream_history(QUESTIONS_QUERY, user_id, cursor), media_type="application/x-ndjson")
+
+
 
 
 ##Questo endpoint ritorna le risposte scritte dall'utente
 @router.get("/answers/")
 def get_user_answers(
-    current_user: Annotated[str, Depends(get_current_user)],
-    db: Annotated[mariadb.Connection, Depends(db_connection)])-> List[AnswerBasic]:
-
-    if current_user is None:
+    principal: Annotated[Principal, Depends(get_current_principal)],
+    db: Annotated[LazyConnection, Depends(db_connection)],
+    response: Response,
+    limit: Annotated[int, Query(ge=1, le=HISTORY_PAGE_MAX)] = HISTORY_PAGE_SIZE,
+    cursor: int | None = None,
+) -> List[AnswerBasic]:
+    """
+    Risposte scritte dall'utente con il loro punteggio, per id crescente, a pagine di limit.
+    Se ce ne sono altre l'header X-Next-Cursor contiene il cursore della pagina successiva.
+    """
+    if principal is None:
         return Response(status_code=401, content="Unauthorized: User must be logged in to submit a human question.")
 
-    username = current_user
+    user_id = principal.user_id
 
-    user_id = get_current_user_id(username, db)
+    rows = history_page(db, ANSWERS_QUERY, user_id, cursor, limit)
+    db.release()
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1]["id"])
 
-    get_query = """
-        SELECT a.id, q.topic, q.question, a.answer, l.score
-        FROM answers a JOIN questions q ON a.question_id = q.id 
-        JOIN logs l ON (l.action_id = a.id AND l.action_type="answer")
-        WHERE a.user_id = ?
-        ORDER BY a.id ASC
-    """
-    rows = execute_query(db, get_query, (user_id,), dict=True)
-    
-    if rows is None:
-        raise HTTPException(status_code=404, detail="Nessuna risposta trovata per l'utente.")
-    
     return [AnswerBasic(**row) for row in rows]
 
 
+@router.get("/answers/ndjson", response_class=StreamingResponse, responses={
+    200: {"content": {"application/x-ndjson": {}}},
+})
+async def stream_user_answers(
+    principal: Annotated[Principal, Depends(get_current_principal)],
+    cursor: int | None = None,
+) -> StreamingResponse:
+    """Tutte le risposte scritte dall'utente, una per riga (NDJSON), con memoria costante"""
+    if principal is None:
+        return Response(status_code=401, content="Errore: l'utente deve essere autenticato per ottenere tutte le risposte che ha scritto")
+
+    user_id = principal.user_id
+
+    return StreamingResponse(stream_history(ANSWERS_QUERY, user_id, cursor), media_type="application/x-ndjson")
+
+
 
 def validate_password(password: str) -> bool:
     if len(password) < 8:
@@ -0,0 +1,111 @@
+"""
+Lease a tempo sulle domande da rispondere e sulle risposte da validare.
+
+Le rotte batch consegnano a un utente N elementi insieme; finché il lease non
+scade o l'elemento non viene inviato, gli altri utenti non li ricevono. Così
+chi prepara una coda di lavoro in locale non toglie elementi agli altri e le
+valutazioni si distribuiscono sulle risposte invece di concentrarsi sulla
+stessa risposta con meno rating.
+
+I lease sono in memoria: il backend gira in un solo processo (docker-compose.yaml).
+"""
+import heapq
+import os
+import threading
+import time
+
+
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", 300.0))
+
+
+class LeaseTable:
+    """Lease per id elemento: proprietario e scadenza (timestamp time.time())"""
+
+    def __init__(self, lease_seconds: float = LEASE_SECONDS, clock=time.time):
+        self.lease_seconds = lease_seconds
+        self._clock = clock
+        self._leases: dict[int, tuple[int, float]] = {}
+        # (scadenza, id) per eliminare i lease scaduti senza scorrerli tutti
+        self._expiries: list[tuple[float, int]] = []
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.released = 0
+        self.expired = 0
+        self.conflicts = 0
+
+    def acquire(self, item_id: int, user_id: int) -> float | None:
+        """
+        Assegna (o rinnova) il lease dell'elemento all'utente e ne ritorna la scadenza.
+        None se l'elemento è in lease a un altro utente: due richieste possono
+        sceglierlo insieme, solo la prima lo ottiene.
+        """
+        expires_at = self._clock() + self.lease_seconds
+        with self._lock:
+            self._expire()
+            lease = self._leases.get(item_id)
+            # dopo _expire i lease rimasti non sono scaduti
+            if lease is not None and lease[0] != user_id:
+                self.conflicts += 1
+                return None
+            self._leases[item_id] = (user_id, expires_at)
+            heapq.heappush(self._expiries, (expires_at, item_id))
+            self.acquired += 1
+        return expires_at
+
+    def release(self, item_id: int, user_id: int | None = None) -> None:
+        """Rilascia il lease; con user_id solo se è di quell'utente"""
+        with self._lock:
+            lease = self._leases.get(item_id)
+            if lease is not None and (user_id is None or lease[0] == user_id):
+                del self._leases[item_id]
+                self.released += 1
+
+    def held_by_other(self, item_id: int, user_id: int) -> bool:
+        with self._lock:
+            lease = self._leases.get(item_id)
+        return lease is not None and lease[0] != user_id and lease[1] > self._clock()
+
+    def skip_for(self, user_id: int, chosen: set[int] | None = None) -> "LeasedElsewhere":
+        return LeasedElsewhere(self, user_id, chosen if chosen is not None else set())
+
+    def _expire(self) -> None:
+        now = self._clock()
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, item_id = heapq.heappop(self._expiries)
+            lease = self._leases.get(item_id)
+            # se il lease è stato rinnovato la sua scadenza è un'altra voce dell'heap
+            if lease is not None and lease[1] == expires_at:
+                del self._leases[item_id]
+                self.expired += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire()
+            active = len(self._leases)
+        return {
+            "active": active,
+            "acquired": self.acquired,
+            "released": self.released,
+            "expired": self.expired,
+            "conflicts": self.conflicts,
+            "lease_seconds": self.lease_seconds,
+        }
+
+
+class LeasedElsewhere:
+    """
+    Elementi da saltare per un utente: quelli in lease ad altri utenti e quelli
+    già scelti nello stesso batch. Si usa con "in" come un insieme.
+    """
+
+    def __init__(self, leases: LeaseTable, user_id: int, chosen: set[int]):
+        self.leases = leases
+        self.user_id = user_id
+        self.chosen = chosen
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self.chosen or self.leases.held_by_other(item_id, self.user_id)
+
+
+question_leases = LeaseTable()
+answer_leases = LeaseTable()
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Literal
 from pydantic import BaseModel
 
@@ -12,6 +13,10 @@ class QuestionBasic(BaseModel):
     question: str
     topic: str
 
+class LeasedQuestion(QuestionBasic):
+    # fino a quando la domanda non viene proposta ad altri utenti
+    lease_expires_at: datetime
+
 class QuestionEvaluation(BaseModel):
     id: int 
     llm_id: int
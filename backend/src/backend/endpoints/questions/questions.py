@@ -1,48 +1,100 @@
+from datetime import datetime, timezone
 from typing import Annotated, Literal, Optional, List
-from fastapi import APIRouter, Depends, HTTPException, Response, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, BackgroundTasks
 import mariadb
 import logging
-from endpoints.questions.models import QuestionValues, QuestionBasic
-from db.mariadb import db_connection, execute_query
-from endpoints.auth.auth import get_current_user, get_current_user_id
-from endpoints.validate.models import RatingRequest
-from endpoints.questions.questions_nlp import background_evaluation_pipeline
-import asyncio
+from endpoints.questions.models import LeasedQuestion, QuestionValues, QuestionBasic
+from endpoints.questions.leases import answer_leases, question_leases
+from endpoints.questions.sampler import sampler
+from db.mariadb import db_connection, execute_query, execute_query_async, transaction_async
+from endpoints.auth.auth import get_current_principal
+from endpoints.auth.models import Principal
+from endpoints.validate.models import LeasedRatingRequest, RatingRequest
+from endpoints.validate.scheduler import scheduler
+from events.feed import record_event
+from jobs.queue import enqueue
 
 
 router = APIRouter(prefix="/questions", tags=["questions"])
 logger = logging.getLogger("app")
 
+SAMPLER_MAX_ATTEMPTS = 3
+SCHEDULER_MAX_ATTEMPTS = 3
+BATCH_MAX_SIZE = 50
+
+ANSWER_TO_VALIDATE_QUERY = """
+    SELECT a.id AS answer_id, a.question_id AS question_id, a.answer, q.question, q.topic
+    FROM answers AS a INNER JOIN questions AS q ON a.question_id = q.id
+    WHERE a.id = ?
+    AND (a.user_id IS NULL OR a.user_id != ?)
+    AND NOT EXISTS (
+        SELECT 1
+        FROM ratings AS r_check
+        WHERE r_check.answer_id = a.id AND r_check.user_id = ?)
+"""
+
+LEAST_RATED_ANSWER_QUERY = """
+    SELECT a.id AS answer_id, a.question_id AS question_id, a.answer, q.question, q.topic
+    FROM answers AS a INNER JOIN questions AS q ON a.question_id = q.id LEFT JOIN ratings AS r ON a.id = r.answer_id
+    WHERE (a.user_id IS NULL OR a.user_id != ?)
+    AND NOT EXISTS (
+        SELECT 1
+        FROM ratings AS r_check
+        WHERE r_check.answer_id = a.id AND r_check.user_id = ?)
+    GROUP BY a.id, a.question_id, q.question, a.answer, q.topic
+    ORDER BY COUNT(r.id) ASC, RAND()
+    LIMIT 1
+"""
+
+# Ritorna una domanda casuale a cui l'utente non ha ancora risposto
+FALLBACK_RANDOM_QUESTION_QUERY = """
+    SELECT q.id, q.question, q.topic
+    FROM questions q 
+    WHERE q.id NOT IN (
+        SELECT a.question_id
+        FROM answers a
+        WHERE a.user_id = ?
+    )
+    ORDER BY RAND()
+    LIMIT 1
+"""
+
 @router.post("/")
 async def submit_question(
     data: QuestionValues,
     db: Annotated[mariadb.Connection, Depends(db_connection)],
-    current_user: Annotated[Optional[str], Depends(get_current_user)] = None,
+    principal: Annotated[Optional[Principal], Depends(get_current_principal)] = None,
     type: Literal["human", "llm"] = "human"
 ) -> Response:
     
-    if type == "human" and current_user is None:
+    if type == "human" and principal is None:
         return Response(status_code=401, content="Errore: l'utente deve essere loggato per inserire una domanda")
     
-    logging.info(f"domanda: {data.question} autore (username): {current_user}")
+    logging.info(f"domanda: {data.question} autore (username): {principal.username if principal else None}")
     
-    username = current_user if type == "human" else None
-    
-    user_id = get_current_user_id(username, db)
+    user_id = principal.user_id if type == "human" else None
 
     insert_query = "INSERT INTO questions (question, topic, type, user_id) VALUES (?, ?, ?, ?)"
     params = (data.question, data.topic, type, user_id)
-    # ritorna all'id della domanda
-    question_id = execute_query(db, insert_query, params, fetch=False)
-    
-    if question_id is None:
-        logger.info(f"question_id={question_id} non valido")
-        raise HTTPException(status_code=500, detail="Errore interno: question_id non valido")
-    
-    # Lancia la task asincrona senza bloccare
-    asyncio.create_task(
-        background_evaluation_pipeline(data.question, data.topic, db, question_id)
-    )
+
+    # domanda, job di valutazione ed evento in un'unica transazione:
+    # una domanda salvata senza il suo job non verrebbe mai valutata
+    async with transaction_async(db):
+        # ritorna all'id della domanda
+        question_id = await execute_query_async(db, insert_query, params, fetch=False, commit=False)
+
+        if question_id is None:
+            logger.info(f"question_id={question_id} non valido")
+            raise HTTPException(status_code=500, detail="Errore interno: question_id non valido")
+
+        # la valutazione viene eseguita dal worker (jobs/worker.py)
+        await enqueue(db, "question", {
+            "question_id": question_id,
+            "question": data.question,
+            "topic": data.topic,
+            "user_id": user_id,
+        }, commit=False)
+        await record_event(user_id, "question", question_id, "queued", conn=db, commit=False)
 
     return Response(status_code=201)
 
@@ -50,7 +102,7 @@ async def submit_question(
 @router.get("/qa_to_validate")
 def get_single_answer_to_question(
     db: Annotated[mariadb.Connection, Depends(db_connection)],
-    current_user: Annotated[Optional[str], Depends(get_current_user)] = None,
+    principal: Annotated[Optional[Principal], Depends(get_current_principal)] = None,
     type: Literal["human", "llm"] = "human",
 ) -> RatingRequest:
     
@@ -59,30 +111,32 @@ def get_single_answer_to_question(
     corrente non ha creato né già valutato.
     Preferisce la risposta con il minor numero di rating.
     """
-    if type == "human" and current_user is None:
+    if type == "human" and principal is None:
         raise HTTPException(
             status_code=401,
             detail="Errore: l'utente deve essere loggato",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    username = current_user
-    user_id = get_current_user_id(username, db)
-    
-    select_query = """
-    SELECT a.id AS answer_id, a.question_id AS question_id, a.answer, q.question, q.topic
-    FROM answers AS a INNER JOIN questions AS q ON a.question_id = q.id LEFT JOIN ratings AS r ON a.id = r.answer_id
-    WHERE (a.user_id IS NULL OR a.user_id != ?)
-    AND NOT EXISTS (
-        SELECT 1
-        FROM ratings AS r_check
-        WHERE r_check.answer_id = a.id AND r_check.user_id = ?)
-    GROUP BY a.id, a.question_id, q.question, a.answer, q.topic
-    ORDER BY COUNT(r.id) ASC, RAND()
-    LIMIT 1;"""
-    
-    params = (user_id, user_id)
+    user_id = principal.user_id if principal else None
+
+    row = None
+    if user_id is not None:
+        # la risposta viene scelta in memoria (endpoints/validate/scheduler.py); la query
+        # la legge per chiave primaria e ricontrolla autore e rating dell'utente
+        scheduler.ensure_fresh(db)
+        for _ in range(SCHEDULER_MAX_ATTEMPTS):
+            answer_id = scheduler.next_for(scheduler.excluded(user_id, db), answer_leases.skip_for(user_id))
+            if answer_id is None:
+                break
+            row = execute_query(db, ANSWER_TO_VALIDATE_QUERY, (answer_id, user_id, user_id), fetchone=True, dict=True)
+            if row is not None:
+                break
+            # valutata tramite un altro processo o eliminata: non la riproponiamo
+            scheduler.exclude(user_id, answer_id)
 
-    row = execute_query(db, select_query, params, fetch=False, fetchone=True, dict=True)
+    if row is None and (user_id is None or answer_id is not None):
+        # utenti senza id (type=llm) o troppi scarti: query esatta
+        row = execute_query(db, LEAST_RATED_ANSWER_QUERY, (user_id, user_id), fetchone=True, dict=True)
     
     if not row:
         raise HTTPException(status_code=404, detail="Non ci sono risposte adatte a quanto pare...")
@@ -95,38 +149,50 @@ def get_single_answer_to_question(
 @router.get("/random/to_answer")
 def get_random_question_to_answer(
     db: Annotated[mariadb.Connection, Depends(db_connection)],
-    current_user: Annotated[Optional[str], Depends(get_current_user)] = None,
+    principal: Annotated[Optional[Principal], Depends(get_current_principal)] = None,
     type: Literal["human", "llm"] = "human"
 ) -> QuestionBasic:
     """
     Ritorna ad una domanda a cui l'utente non ha mai risposto, anche se è stata scritta dall'utente stesso
     """
-    if current_user is None and type == "human":
+    if principal is None and type == "human":
         raise HTTPException(
             status_code=401,
             detail="Errore: L'utente deve aver eseguito il login per poter rispondere ad una domanda.",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    username = current_user if type == "human" else ""
-
-    user_id = get_current_user_id(username, db)
+    user_id = principal.user_id if type == "human" else None
 
-    # Ritorna una domanda casuale a cui l'utente non ha ancora risposto
+    # l'id viene estratto in memoria (endpoints/questions/sampler.py); la query controlla
+    # per chiave primaria e indice UNIQUE che la domanda esista e che l'utente non ci abbia
+    # già risposto, ad esempio tramite un altro processo del backend
+    sampler.ensure_fresh(db)
     select_query = """
     SELECT q.id, q.question, q.topic
-    FROM questions q 
-    WHERE q.id NOT IN (
-        SELECT a.question_id
+    FROM questions q
+    WHERE q.id = ?
+    AND NOT EXISTS (
+        SELECT 1
         FROM answers a
-        WHERE a.user_id = ?
+        WHERE a.question_id = q.id AND a.user_id = ?
     )
-    ORDER BY RAND()
-    LIMIT 1
     """
-    
-    params = (user_id,)
-    row = execute_query(db, select_query, params, fetchone=True, dict=True)
+
+    row = None
+    for _ in range(SAMPLER_MAX_ATTEMPTS):
+        question_id = sampler.sample(sampler.answered(user_id, db), user_id, question_leases.skip_for(user_id))
+        if question_id is None:
+            break
+        row = execute_query(db, select_query, (question_id, user_id), fetchone=True, dict=True)
+        if row is not None:
+            break
+        # risposta data tramite un altro processo o domanda eliminata: non la riproponiamo
+        sampler.mark_answered(user_id, question_id)
+
+    if row is None and question_id is not None:
+        # dopo troppi scarti torniamo alla query esatta
+        row = execute_query(db, FALLBACK_RANDOM_QUESTION_QUERY, (user_id,), fetchone=True, dict=True)
 
     if row is None:
         raise HTTPException(status_code=404, detail="Nessuna domanda disponibile.")
@@ -134,3 +200,128 @@ def get_random_question_to_answer(
 
 
 
+def lease_expiry(expires_at: float) -> datetime:
+    return datetime.fromtimestamp(expires_at, tz=timezone.utc)
+
+
+def placeholders(values) -> str:
+    return ", ".join("?" for _ in values)
+
+
+def get_batch_user_id(principal: Principal) -> int:
+    user_id = principal.user_id
+    if user_id is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Errore: l'utente deve essere loggato",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user_id
+
+
+@router.get("/qa_to_validate/batch")
+def get_answers_to_validate(
+    db: Annotated[mariadb.Connection, Depends(db_connection)],
+    principal: Annotated[Principal, Depends(get_current_principal)],
+    size: Annotated[int, Query(ge=1, le=BATCH_MAX_SIZE)] = 10,
+) -> List[LeasedRatingRequest]:
+    """
+    Come /questions/qa_to_validate, ma restituisce fino a size tuple in una volta.
+    Ogni risposta resta riservata all'utente fino a lease_expires_at (o fino a quando
+    non la valuta): nel frattempo non viene proposta ad altri.
+    """
+    user_id = get_batch_user_id(principal)
+
+    scheduler.ensure_fresh(db)
+    excluded = scheduler.excluded(user_id, db)
+    chosen: set[int] = set()
+    skip = answer_leases.skip_for(user_id, chosen)
+    for _ in range(size):
+        answer_id = scheduler.next_for(excluded, skip)
+        if answer_id is None:
+            break
+        chosen.add(answer_id)
+
+    if not chosen:
+        raise HTTPException(status_code=404, detail="Non ci sono risposte adatte a quanto pare...")
+
+    select_query = f"""
+    SELECT a.id AS answer_id, a.question_id AS question_id, a.answer, q.question, q.topic
+    FROM answers AS a INNER JOIN questions AS q ON a.question_id = q.id
+    WHERE a.id IN ({placeholders(chosen)})
+    AND (a.user_id IS NULL OR a.user_id != ?)
+    AND NOT EXISTS (
+        SELECT 1
+        FROM ratings AS r_check
+        WHERE r_check.answer_id = a.id AND r_check.user_id = ?)
+    """
+    rows = execute_query(db, select_query, (*chosen, user_id, user_id), dict=True) or []
+
+    # quelle non più valide (valutate tramite un altro processo) non vengono riproposte
+    for answer_id in chosen - {row["answer_id"] for row in rows}:
+        scheduler.exclude(user_id, answer_id)
+
+    # quelle riservate nel frattempo da un'altra richiesta restano fuori dal batch
+    batch = []
+    for row in rows:
+        expires_at = answer_leases.acquire(row["answer_id"], user_id)
+        if expires_at is not None:
+            batch.append(LeasedRatingRequest(**row, lease_expires_at=lease_expiry(expires_at)))
+
+    if not batch:
+        raise HTTPException(status_code=404, detail="Non ci sono risposte adatte a quanto pare...")
+
+    return batch
+
+
+@router.get("/random/to_answer/batch")
+def get_random_questions_to_answer(
+    db: Annotated[mariadb.Connection, Depends(db_connection)],
+    principal: Annotated[Principal, Depends(get_current_principal)],
+    size: Annotated[int, Query(ge=1, le=BATCH_MAX_SIZE)] = 10,
+) -> List[LeasedQuestion]:
+    """
+    Come /questions/random/to_answer, ma restituisce fino a size domande diverse in una volta.
+    Ogni domanda resta riservata all'utente fino a lease_expires_at (o fino a quando
+    non risponde): nel frattempo non viene proposta ad altri.
+    """
+    user_id = get_batch_user_id(principal)
+
+    sampler.ensure_fresh(db)
+    answered = sampler.answered(user_id, db)
+    chosen: set[int] = set()
+    skip = question_leases.skip_for(user_id, chosen)
+    for _ in range(size):
+        question_id = sampler.sample(answered, user_id, skip)
+        if question_id is None:
+            break
+        chosen.add(question_id)
+
+    if not chosen:
+        raise HTTPException(status_code=404, detail="Nessuna domanda disponibile.")
+
+    select_query = f"""
+    SELECT q.id, q.question, q.topic
+    FROM questions q
+    WHERE q.id IN ({placeholders(chosen)})
+    AND NOT EXISTS (
+        SELECT 1
+        FROM answers a
+        WHERE a.question_id = q.id AND a.user_id = ?
+    )
+    """
+    rows = execute_query(db, select_query, (*chosen, user_id), dict=True) or []
+
+    for question_id in chosen - {row["id"] for row in rows}:
+        sampler.mark_answered(user_id, question_id)
+
+    batch = []
+    for row in rows:
+        expires_at = question_leases.acquire(row["id"], user_id)
+        if expires_at is not None:
+            batch.append(LeasedQuestion(**row, lease_expires_at=lease_expiry(expires_at)))
+
+    if not batch:
+        raise HTTPException(status_code=404, detail="Nessuna domanda disponibile.")
+
+    return batch
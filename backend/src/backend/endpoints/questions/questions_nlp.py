@@ -1,74 +1,31 @@
-import asyncio
-import httpx
-import os
-from db.mariadb import db_connection, execute_query
-from typing import Annotated,  Optional
-from fastapi import Depends, HTTPException
-import mariadb
+from db.mariadb import execute_background_query_async
+from events.feed import record_event
+from nlp.client import gather_or_cancel, post_to_nlp
 import logging
 
-NLP_PORT = int(os.getenv("NLP_PORT", 8071))
-NLP_IP = os.getenv("NLP_IP", "143.198.37.78")
-
-BASE_URL = f"http://{NLP_IP}:{NLP_PORT}"
-
 TEST_LLM_ID = 1
 
-semaphore = asyncio.Semaphore(1)
-
-async def post_to_nlp(url: str, payload: dict[str, str]):
-    resp = None
 
-    try:
-        async with semaphore:
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(url, json=payload, timeout=300.0)
-                resp.raise_for_status()
-
-    except httpx.HTTPStatusError as e:
-         raise HTTPException(status_code=e.response.status_code, detail=f"Errore HTTP dal servizio LLM: {e}")
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=502, detail=f"Errore di rete contattando il servizio LLM: {e}")
+async def evaluate_cultural_background(question: str) -> tuple[int, str | None]:
     
-    return resp
-
-
-
-async def evaluate_cultural_background(
-    question: str, 
-    db: Annotated[mariadb.Connection, Depends(db_connection)],
-    question_id: int
-):
-    
-    url = f"{BASE_URL}/green_cultural"
     payload = {"question": question}
 
     # aspettiamo che la richiesta termini
-    resp = await post_to_nlp(url, payload)
-        
-    data = resp.json()
+    data = await post_to_nlp("green_cultural", payload)
     
     # cultural_specificity nel DB è l'equivalente di score
     cultural_specificity = data.get("score")
     # cultural_specificity_notes nel DB è l'equivalente di feedback
     cultural_specificity_notes = data.get("feedback")
 
-    insert_query = """
-        INSERT INTO questions_evaluation (question_id, llm_id, cultural_specificity, cultural_specificity_notes) VALUES (?, ?, ?, ?)
-    """
-
-    execute_query(db, insert_query, (question_id, TEST_LLM_ID, cultural_specificity, cultural_specificity_notes), fetch=False)
+    return cultural_specificity, cultural_specificity_notes
 
 
 
-async def answer_question(question_id: int, question: str, level: int, 
-                            db: Annotated[mariadb.Connection, Depends(db_connection)], humanize=True):
-    url = f"{BASE_URL}/cyan"
+async def answer_question(question_id: int, question: str, level: int, humanize=True, user_id: int | None = None):
     payload = {"argomento": question, "livello": level}
 
-    resp = await post_to_nlp(url, payload)
-
-    data = resp.json()
+    data = await post_to_nlp("cyan", payload)
     answer = data.get("risposta")
 
     # inseriamo la rirsposta su hunanize 
@@ -78,21 +35,26 @@ async def answer_question(question_id: int, question: str, level: int,
         logging.info(f"Ecco la risposta prima:\n{answer}\ndopo:{huamnized_answer}")
         answer = huamnized_answer
     
+    # il job può essere rieseguito: non inseriamo una seconda risposta dello stesso LLM
     insert_query = """
         INSERT INTO answers (llm_id, question_id, answer, type)
-        VALUES (?, ?, ?, 'llm')
+        SELECT ?, ?, ?, 'llm'
+        FROM DUAL
+        WHERE NOT EXISTS (
+            SELECT 1 FROM answers WHERE question_id = ? AND llm_id = ? AND type = 'llm'
+        )
     """
-    execute_query(db, insert_query, (TEST_LLM_ID, question_id, answer), fetch=False)
+    params = (TEST_LLM_ID, question_id, answer, question_id, TEST_LLM_ID)
+    await execute_background_query_async(insert_query, params, fetch=False)
+
+    await record_event(user_id, "question", question_id, "llm_answer_generated", {"llm_id": TEST_LLM_ID})
 
 
 
 async def humanize_answer(llm_response: str, humanization_level: int = 1) -> str:
-    url = f"{BASE_URL}/magenta"
     payload = {"llm_response": llm_response, "level": humanization_level}
 
-    resp = await post_to_nlp(url, payload)
-
-    data = resp.json()
+    data = await post_to_nlp("magenta", payload)
     humanized_response = data.get("humanized_response")
 
     return humanized_response
@@ -101,50 +63,55 @@ async def humanize_answer(llm_response: str, humanization_level: int = 1) -> str
 async def evaluate_coherence_qt(
         question_id: int,
         question: str,
-        theme: str,
-        db: Annotated[mariadb.Connection, Depends(db_connection)]
-):
-    url = f"{BASE_URL}/green_coherence_QT"
+        theme: str
+) -> bool:
     payload = {
         "question": question,
         "theme": theme
     }
 
-    resp = await post_to_nlp(url, payload)
-    
-    data = resp.json()
+    data = await post_to_nlp("green_coherence_QT", payload)
     value = True if data.get("bool") == "Vero" else False
 
     logging.info(f"question=[id:{question_id} text:{question}]\nCoherence evaluation result: {data}")
 
-    # questa update_query va in realtà eseguita su 
-    #  questions_evaluation
+    return value
 
-    update_query = """
-        UPDATE questions_evaluation SET coherence_qt = ?
-        WHERE id = ?
-    """
 
-    execute_query(db, update_query, (value, question_id), fetch=False)
+async def background_evaluation_pipeline(question: str, topic: str, question_id: int, user_id: int | None = None):
+    """
+    Valuta una domanda. Le connessioni al DB vengono prese dal pool di
+    background solo attorno alle scritture, mai durante le chiamate NLP.
+    """
 
+    # le due valutazioni sono indipendenti: partono insieme, ciascuna viene
+    # notificata al client (/events/evaluations) appena termina e scriviamo
+    # sul DB solo quando sono terminate entrambe
+    async def scored():
+        cultural_specificity, cultural_specificity_notes = await evaluate_cultural_background(question)
+        await record_event(user_id, "question", question_id, "scored", {"cultural_specificity": cultural_specificity})
+        return cultural_specificity, cultural_specificity_notes
 
-async def background_evaluation_pipeline(question: str, topic: str, db: mariadb.Connection, question_id: int):
+    async def coherence_checked():
+        coherence_qt = await evaluate_coherence_qt(question_id, question, topic)
+        await record_event(user_id, "question", question_id, "coherence_checked", {"coherence_qt": coherence_qt})
+        return coherence_qt
 
-    await evaluate_cultural_background(question, db, question_id)
-    await evaluate_coherence_qt(question_id, question, topic, db)
+    (cultural_specificity, cultural_specificity_notes), coherence_qt = await gather_or_cancel(
+        scored(), coherence_checked(),
+    )
 
     logging.info("Eseguiti i due endpoint di nlp")
 
-    query_evaluate = """
-        SELECT cultural_specificity, coherence_qt
-        FROM questions_evaluation
-        WHERE id = ?
+    # IGNORE: se il job viene rieseguito la valutazione è già presente (UNIQUE question_id, llm_id)
+    insert_query = """
+        INSERT IGNORE INTO questions_evaluation (question_id, llm_id, cultural_specificity, cultural_specificity_notes, coherence_qt)
+        VALUES (?, ?, ?, ?, ?)
     """
-    params_evaluate = (question_id,)
-    
-    row = execute_query(db, query_evaluate, params_evaluate, fetchone=True, dict=True)
+    params = (question_id, TEST_LLM_ID, cultural_specificity, cultural_specificity_notes, coherence_qt)
 
-    # la risposta alla domanda viene generata solamente se certi criteri sono rispettati
-    if row and row['cultural_specificity'] >= 4 and row['coherence_qt'] == 1:
-        await answer_question(question_id, question, 1, db)
+    await execute_background_query_async(insert_query, params, fetch=False)
 
+    # la risposta alla domanda viene generata solamente se certi criteri sono rispettati
+    if (cultural_specificity or 0) >= 4 and coherence_qt:
+        await answer_question(question_id, question, 1, user_id=user_id)
@@ -0,0 +1,208 @@
+"""
+Campionamento casuale delle domande per /questions/random/to_answer.
+
+Al posto di ORDER BY RAND() (scansione e ordinamento di tutta la tabella a
+ogni chiamata) teniamo in memoria un array compatto degli id delle domande
+e, per gli utenti attivi, l'insieme delle domande a cui hanno già risposto.
+Si estrae un id uniforme dall'array e lo si scarta se l'utente ci ha già
+risposto (rejection sampling): il risultato resta uniforme sulle domande
+ammissibili e il costo atteso è O(1). Per gli utenti che hanno risposto a
+quasi tutte le domande si passa a una lista delle sole domande ammissibili.
+"""
+import os
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+import mariadb
+
+from db.mariadb import execute_query
+from lru import LRUCache
+
+
+SAMPLER_REFRESH_INTERVAL = float(os.getenv("SAMPLER_REFRESH_INTERVAL", 5.0))
+SAMPLER_REBUILD_INTERVAL = float(os.getenv("SAMPLER_REBUILD_INTERVAL", 600.0))
+SAMPLER_MAX_PROBES = int(os.getenv("SAMPLER_MAX_PROBES", 64))
+SAMPLER_MAX_USERS = int(os.getenv("SAMPLER_MAX_USERS", 10_000))
+SAMPLER_ANSWERED_TTL = float(os.getenv("SAMPLER_ANSWERED_TTL", 300.0))
+# id riletti a ogni aggiornamento prima dell'ultimo letto: gli id non vengono committati in ordine
+SAMPLER_TAIL_OVERLAP = int(os.getenv("SAMPLER_TAIL_OVERLAP", 500))
+
+
+class QuestionSampler:
+    """
+    Array degli id delle domande più gli insiemi delle domande già risposte per utente.
+
+    L'array viene aggiornato ogni SAMPLER_REFRESH_INTERVAL secondi leggendo gli id
+    nuovi più gli ultimi SAMPLER_TAIL_OVERLAP già letti (una domanda con id più basso
+    può essere committata dopo), e ricostruito da zero ogni SAMPLER_REBUILD_INTERVAL
+    secondi per recuperare eventuali buchi e cancellazioni.
+    """
+
+    def __init__(
+        self,
+        max_probes: int = SAMPLER_MAX_PROBES,
+        max_users: int = SAMPLER_MAX_USERS,
+        answered_ttl: float = SAMPLER_ANSWERED_TTL,
+        rng: random.Random | None = None,
+    ):
+        self.max_probes = max_probes
+        self.answered_ttl = answered_ttl
+        self._rng = rng or random.Random()
+        self._ids = array("q")
+        self._max_id = 0
+        self._answered = LRUCache(max_items=max_users)
+        # domande ammissibili degli utenti che hanno risposto a quasi tutto
+        self._candidates = LRUCache(max_items=max_users)
+        self._lock = threading.Lock()
+        self._loaded_at: float | None = None
+        self._refreshed_at = 0.0
+        self.samples = 0
+        self.probes = 0
+        self.scans = 0
+
+    # --- array degli id ---
+
+    def load(self, ids) -> None:
+        """Sostituisce l'array con gli id passati (in ordine crescente)"""
+        new_ids = array("q", ids)
+        self._ids = new_ids
+        self._max_id = new_ids[-1] if new_ids else 0
+        self._loaded_at = self._refreshed_at = time.monotonic()
+
+    def extend(self, ids) -> None:
+        """Aggiunge gli id non ancora presenti, mantenendo l'array ordinato"""
+        late = False
+        for question_id in ids:
+            if question_id > self._max_id:
+                self._ids.append(question_id)
+                self._max_id = question_id
+                continue
+            i = bisect_left(self._ids, question_id)
+            if i == len(self._ids) or self._ids[i] != question_id:
+                # committata dopo domande con id più alto: raro, l'inserimento costa O(n)
+                self._ids.insert(i, question_id)
+                late = True
+        if late:
+            # le liste degli utenti considerano nuovi solo gli id oltre il loro max_id
+            self._candidates.clear()
+        self._refreshed_at = time.monotonic()
+
+    def ensure_fresh(self, conn: mariadb.Connection) -> None:
+        """
+        Carica l'array al primo uso e lo aggiorna quando è vecchio.
+        Se un altro thread sta già aggiornando non lo aspettiamo: basta l'array attuale.
+        """
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._refreshed_at < SAMPLER_REFRESH_INTERVAL:
+            return
+
+        if not self._lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if self._loaded_at is None or now - self._loaded_at >= SAMPLER_REBUILD_INTERVAL:
+                rows = execute_query(conn, "SELECT id FROM questions ORDER BY id")
+                self.load(row[0] for row in rows or [])
+            elif now - self._refreshed_at >= SAMPLER_REFRESH_INTERVAL:
+                rows = execute_query(
+                    conn, "SELECT id FROM questions WHERE id > ? ORDER BY id",
+                    (max(0, self._max_id - SAMPLER_TAIL_OVERLAP),),
+                )
+                self.extend(row[0] for row in rows or [])
+        finally:
+            self._lock.release()
+
+    # --- domande già risposte ---
+
+    def answered(self, user_id: int | None, conn: mariadb.Connection) -> set[int]:
+        """Domande a cui l'utente ha già risposto, lette dal DB solo se non sono in memoria"""
+        if user_id is None:
+            return set()
+
+        answered = self._answered.get(user_id)
+        if answered is None:
+            rows = execute_query(conn, "SELECT question_id FROM answers WHERE user_id = ?", (user_id,))
+            answered = {row[0] for row in rows or []}
+            self._answered.put(user_id, answered, expires_at=time.time() + self.answered_ttl)
+        return answered
+
+    def mark_answered(self, user_id: int | None, question_id: int) -> None:
+        if user_id is None:
+            return
+        answered = self._answered.get(user_id)
+        if answered is not None:
+            answered.add(question_id)
+
+    # --- campionamento ---
+
+    def sample(self, answered: set[int], user_id: int | None = None, skip=()) -> int | None:
+        """
+        Un id uniforme tra quelli non in answered né in skip. Dopo max_probes estrazioni
+        fallite (l'utente ha risposto a quasi tutto) calcola una volta la lista
+        delle domande ancora ammissibili e la tiene in memoria per l'utente:
+        le estrazioni successive pescano da quella lista.
+        skip (ad esempio le domande in lease ad altri utenti) cambia di continuo
+        e non entra nella lista.
+        """
+        ids = self._ids
+        n = len(ids)
+        if n == 0:
+            return None
+
+        self.samples += 1
+        cached = self._candidates.get(user_id) if user_id is not None else None
+        if cached is not None:
+            question_id = self._sample_candidates(cached, answered, skip)
+            if question_id is not None or not cached[0]:
+                return question_id
+            # la lista è troppo vecchia rispetto alle risposte date nel frattempo
+            self._candidates.pop(user_id)
+
+        for _ in range(self.max_probes):
+            self.probes += 1
+            question_id = ids[self._rng.randrange(n)]
+            if question_id not in answered and question_id not in skip:
+                return question_id
+
+        self.scans += 1
+        candidates = [question_id for question_id in ids if question_id not in answered]
+        if user_id is not None:
+            self._candidates.put(user_id, (candidates, self._max_id), expires_at=time.time() + self.answered_ttl)
+        eligible = [question_id for question_id in candidates if question_id not in skip]
+        return self._rng.choice(eligible) if eligible else None
+
+    def _sample_candidates(self, cached: tuple[list[int], int], answered: set[int], skip) -> int | None:
+        """
+        Estrae dalla lista di un utente più le domande arrivate dopo che è stata calcolata
+        (un suffisso dell'array, che è ordinato), scartando quelle risposte nel frattempo.
+        """
+        candidates, max_id = cached
+        ids = self._ids
+        start = bisect_right(ids, max_id)
+        total = len(candidates) + len(ids) - start
+        if total == 0:
+            return None
+
+        for _ in range(self.max_probes):
+            self.probes += 1
+            i = self._rng.randrange(total)
+            question_id = candidates[i] if i < len(candidates) else ids[start + i - len(candidates)]
+            if question_id not in answered and question_id not in skip:
+                return question_id
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "questions": len(self._ids),
+            "max_id": self._max_id,
+            "samples": self.samples,
+            "avg_probes": self.probes / self.samples if self.samples else 0.0,
+            "scans": self.scans,
+            "dense_users": len(self._candidates),
+            "users": self._answered.stats(),
+        }
+
+
+sampler = QuestionSampler()
@@ -3,7 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException, Response, BackgroundTasks
 import mariadb
 from endpoints.reports.models import Report
 from db.mariadb import db_connection, execute_query
-from endpoints.auth.auth import get_current_user, get_current_user_id
+from endpoints.auth.auth import get_current_principal
+from endpoints.auth.models import Principal
 
 
 router = APIRouter(prefix="/reports", tags=["reports"])
@@ -12,16 +13,16 @@ router = APIRouter(prefix="/reports", tags=["reports"])
 def submit_report(
     data: Report,
     db: Annotated[mariadb.Connection, Depends(db_connection)],
-    current_user: Annotated[Optional[str], Depends(get_current_user)] = None) -> Response:
+    principal: Annotated[Optional[Principal], Depends(get_current_principal)] = None) -> Response:
 
-    if current_user is None:
+    if principal is None:
         return Response(status_code=401, content="Errore: l'utente deve essere loggato per inviare un report")
     
     ##Si cancellerà perché la gestiremo nel frontend
     if data.question_id is None and data.answer_id is None:
         raise HTTPException(status_code=400, detail="Devi specificare question_id o answer_id")
 
-    user_id = get_current_user_id(current_user, db)
+    user_id = principal.user_id
 
     insert_query = "INSERT INTO reports (user_id, reason, question_id, answer_id) VALUES (?, ?, ?, ?)"
 
@@ -0,0 +1,118 @@
+from typing import Annotated
+from fastapi import APIRouter, Depends, Query
+import mariadb
+
+from crypto.executor import password_executor
+from db.mariadb import db_connection, lazy_connection_stats
+from db.pool import background_gate, gate
+from endpoints.auth.auth import auth_stats
+from endpoints.profile.avatars import avatar_stats
+from endpoints.gamification.ranking import ranking
+from endpoints.gamification.snapshot import snapshot
+from endpoints.questions.leases import answer_leases, question_leases
+from endpoints.questions.sampler import sampler
+from endpoints.validate.scheduler import scheduler
+from events.feed import feed_stats
+from jobs.queue import queue_depth
+from nlp.cache import cache_stats
+from nlp.client import batching_stats, breaker_stats
+from nlp.limits import limiter_stats
+
+
+router = APIRouter(prefix="/status", tags=["status"])
+
+
+@router.get("/nlp")
+def get_nlp_status() -> dict:
+    """
+    Stato delle chiamate verso il servizio NLP, per endpoint:
+    limite di concorrenza, richieste in corso, profondità della coda e tempi di attesa.
+    Include hit e miss della cache dei risultati, l'effetto di batching e deduplica
+    e lo stato dei circuit breaker.
+    """
+    return {
+        "limiters": limiter_stats(),
+        "breakers": breaker_stats(),
+        "cache": cache_stats(),
+        "batching": batching_stats(),
+    }
+
+
+@router.get("/jobs")
+def get_jobs_status(db: Annotated[mariadb.Connection, Depends(db_connection)]) -> dict:
+    """Job di valutazione in coda, in esecuzione e falliti"""
+    return {"queue": queue_depth(db)}
+
+
+@router.get("/events")
+def get_events_status() -> dict:
+    """Client SSE connessi ed eventi di valutazione pubblicati, consegnati e scartati"""
+    return feed_stats()
+
+
+@router.get("/sampling")
+def get_sampling_status() -> dict:
+    """
+    Stato del campionamento in memoria delle domande da rispondere e delle risposte
+    da validare, con i lease assegnati dalle rotte batch
+    """
+    return {
+        "questions": sampler.stats(),
+        "answers": scheduler.stats(),
+        "leases": {"questions": question_leases.stats(), "answers": answer_leases.stats()},
+    }
+
+
+@router.get("/leaderboard")
+def get_leaderboard_status() -> dict:
+    """
+    Età e versione dell'istantanea delle prime posizioni della classifica
+    e stato dell'indice delle posizioni
+    """
+    return {"snapshot": snapshot.stats(), "ranking": ranking.stats()}
+
+
+@router.get("/leaderboard/consistency")
+def check_leaderboard_consistency(
+    db: Annotated[mariadb.Connection, Depends(db_connection)],
+    sample: Annotated[int, Query(ge=1, le=100)] = 20,
+) -> dict:
+    """
+    Confronta la posizione di sample utenti a caso nell'indice in memoria con quella
+    calcolata in SQL. Ogni controllo costa una query O(n): non va chiamata di frequente.
+    """
+    return ranking.check_consistency(db, sample)
+
+
+@router.get("/avatars")
+def get_avatars_status() -> dict:
+    """Hit della cache degli avatar in memoria e su disco e rendering eseguiti"""
+    return avatar_stats()
+
+
+@router.get("/auth")
+def get_auth_status() -> dict:
+    """
+    Hit rate della cache dei token verificati e, per ogni rotta, da dove è stato
+    preso l'id dell'utente: dal token (claim uid), dalla cache username -> id
+    o dal DB. saved sono le query evitate.
+    """
+    return auth_stats()
+
+
+@router.get("/passwords")
+def get_passwords_status() -> dict:
+    """Coda dell'executor di hashing delle password: operazioni in corso, completate e rifiutate (503)"""
+    return password_executor.stats()
+
+
+@router.get("/db")
+def get_db_status() -> dict:
+    """
+    Pool delle connessioni delle richieste: connessioni in uso e richieste in attesa,
+    attese rifiutate subito (shed) o scadute (timeouts) con 503, tempi di attesa e di uso.
+    lazy conta le richieste che non hanno mai preso una connessione (skipped)
+    e quelle che l'hanno restituita prima della risposta (released_early).
+    background è lo stesso per il pool del worker e dei refresh periodici.
+    """
+    return {"pool": gate.stats(), "lazy": lazy_connection_stats(), "background": background_gate.stats()}
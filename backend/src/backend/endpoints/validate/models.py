@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
 
 class RatingRequest(BaseModel):
@@ -8,6 +9,11 @@ class RatingRequest(BaseModel):
     topic: str
 
 
+class LeasedRatingRequest(RatingRequest):
+    # fino a quando la risposta non viene proposta ad altri utenti
+    lease_expires_at: datetime
+
+
 class RatingValues(BaseModel):
     #Non c'è bisogno di fare check del valore del rating perchè l'idea è che selezioni solo 1 valore tra 1 e 5
     rating: int
@@ -0,0 +1,335 @@
+"""
+Scelta della risposta da validare per /questions/qa_to_validate.
+
+Al posto della query che raggruppa tutte le risposte con i loro rating e le
+ordina per numero di rating e RAND() a ogni richiesta, teniamo in memoria le
+risposte divise in bucket per numero di rating. Per un utente si parte dal
+bucket con meno rating e si estrae a caso una risposta che non ha scritto e
+non ha già valutato.
+
+Lo stato si aggiorna subito con le risposte e i rating inseriti da questo
+processo, legge ogni pochi secondi quelli nuovi scritti da altri processi e
+viene ricostruito da zero all'avvio del backend e poi ogni
+SCHEDULER_RECONCILE_INTERVAL secondi (reconcile_periodically).
+
+Gli id autoincrementali non vengono committati in ordine: un rating con id
+più basso può comparire dopo uno con id più alto. Per questo la lettura dei
+nuovi rating ricomincia SCHEDULER_TAIL_OVERLAP id prima dell'ultimo letto e
+salta quelli già contati (_applied).
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from array import array
+
+import mariadb
+
+from db.mariadb import background_connection, execute_query, run_blocking
+from lru import LRUCache
+
+
+SCHEDULER_REFRESH_INTERVAL = float(os.getenv("SCHEDULER_REFRESH_INTERVAL", 2.0))
+SCHEDULER_RECONCILE_INTERVAL = float(os.getenv("SCHEDULER_RECONCILE_INTERVAL", 300.0))
+SCHEDULER_MAX_PROBES = int(os.getenv("SCHEDULER_MAX_PROBES", 16))
+SCHEDULER_MAX_USERS = int(os.getenv("SCHEDULER_MAX_USERS", 10_000))
+SCHEDULER_EXCLUDED_TTL = float(os.getenv("SCHEDULER_EXCLUDED_TTL", 300.0))
+# id riletti a ogni aggiornamento prima dell'ultimo letto, per i commit fuori ordine
+SCHEDULER_TAIL_OVERLAP = int(os.getenv("SCHEDULER_TAIL_OVERLAP", 500))
+
+logger = logging.getLogger("app")
+
+# risposte scritte o già valutate dall'utente
+EXCLUDED_QUERY = """
+    SELECT id FROM answers WHERE user_id = ?
+    UNION
+    SELECT answer_id FROM ratings WHERE user_id = ?
+"""
+
+# numero di rating per risposta, fino agli id massimi letti subito prima
+COUNTS_QUERY = """
+    SELECT a.id, COUNT(r.id)
+    FROM answers AS a LEFT JOIN ratings AS r ON r.answer_id = a.id AND r.id <= ?
+    WHERE a.id <= ?
+    GROUP BY a.id
+"""
+
+
+class AnswerScheduler:
+    """
+    Risposte divise in bucket per numero di rating.
+
+    I conteggi e le posizioni nei bucket sono array indicizzati per id della
+    risposta (gli id sono autoincrementali, quindi densi): spostare una
+    risposta da un bucket all'altro quando riceve un rating costa O(1).
+    """
+
+    def __init__(
+        self,
+        max_probes: int = SCHEDULER_MAX_PROBES,
+        max_users: int = SCHEDULER_MAX_USERS,
+        excluded_ttl: float = SCHEDULER_EXCLUDED_TTL,
+        tail_overlap: int = SCHEDULER_TAIL_OVERLAP,
+        rng: random.Random | None = None,
+    ):
+        self.max_probes = max_probes
+        self.excluded_ttl = excluded_ttl
+        self.tail_overlap = tail_overlap
+        self._rng = rng or random.Random()
+        # -1 = risposta non presente
+        self._count = array("i")
+        self._pos = array("i")
+        self._buckets: dict[int, array] = {}
+        self._size = 0
+        self._max_answer_id = 0
+        self._max_rating_id = 0
+        # i rating con id <= _counted_upto sono nei conteggi dell'ultima ricostruzione,
+        # quelli successivi già contati uno per uno sono in _applied
+        self._counted_upto = 0
+        self._applied: set[int] = set()
+        self._excluded = LRUCache(max_items=max_users)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._loaded_at: float | None = None
+        self._refreshed_at = 0.0
+        self.picks = 0
+        self.probes = 0
+        self.scans = 0
+
+    # --- bucket ---
+
+    def _grow(self, answer_id: int) -> None:
+        missing = answer_id + 1 - len(self._count)
+        if missing > 0:
+            self._count.extend(array("i", [-1]) * missing)
+            self._pos.extend(array("i", [-1]) * missing)
+
+    def _attach(self, answer_id: int, count: int) -> None:
+        bucket = self._buckets.get(count)
+        if bucket is None:
+            bucket = self._buckets[count] = array("i")
+        self._pos[answer_id] = len(bucket)
+        self._count[answer_id] = count
+        bucket.append(answer_id)
+
+    def _detach(self, answer_id: int) -> int:
+        count = self._count[answer_id]
+        bucket = self._buckets[count]
+        position = self._pos[answer_id]
+        last = bucket[-1]
+        bucket[position] = last
+        self._pos[last] = position
+        bucket.pop()
+        if not bucket:
+            del self._buckets[count]
+        return count
+
+    def _known(self, answer_id: int) -> bool:
+        return answer_id < len(self._count) and self._count[answer_id] >= 0
+
+    # --- aggiornamenti ---
+
+    def load(self, counts, max_answer_id: int, max_rating_id: int) -> None:
+        """Ricostruisce lo stato da coppie (id risposta, numero di rating)"""
+        fresh = AnswerScheduler()
+        fresh._grow(max_answer_id)
+        for answer_id, count in counts:
+            fresh._attach(answer_id, count)
+            fresh._size += 1
+
+        with self._lock:
+            self._count, self._pos, self._buckets = fresh._count, fresh._pos, fresh._buckets
+            self._size = fresh._size
+            self._max_answer_id = max_answer_id
+            self._max_rating_id = self._counted_upto = max_rating_id
+            # i rating con id <= max_rating_id sono già nei conteggi letti, quelli successivi
+            # verranno contati quando li rileggiamo: gli aggiornamenti locali vanno dimenticati
+            self._applied = set()
+            self._loaded_at = self._refreshed_at = time.monotonic()
+
+    def add_answer(self, answer_id: int, author_id: int | None = None) -> None:
+        with self._lock:
+            if not self._known(answer_id):
+                self._grow(answer_id)
+                self._attach(answer_id, 0)
+                self._size += 1
+        self.exclude(author_id, answer_id)
+
+    def record_rating(self, answer_id: int, user_id: int | None, rating_id: int | None = None) -> None:
+        """Conta un rating; rating_id evita di contarlo di nuovo quando viene riletto dal DB"""
+        self.exclude(user_id, answer_id)
+        with self._lock:
+            if rating_id is not None:
+                # committato prima della ricostruzione: è già nei conteggi letti dal DB.
+                # Niente confronto con _max_rating_id: un id più basso può essere committato dopo
+                if rating_id <= self._counted_upto or rating_id in self._applied:
+                    return
+                self._applied.add(rating_id)
+            self._increment(answer_id)
+
+    def _increment(self, answer_id: int) -> None:
+        if self._known(answer_id):
+            count = self._detach(answer_id) + 1
+        else:
+            # risposta inserita da un altro processo e non ancora letta
+            self._grow(answer_id)
+            self._size += 1
+            count = 1
+        self._attach(answer_id, count)
+
+    def _apply_tail(self, answer_ids, ratings) -> None:
+        with self._lock:
+            for answer_id in answer_ids:
+                if not self._known(answer_id):
+                    self._grow(answer_id)
+                    self._attach(answer_id, 0)
+                    self._size += 1
+                self._max_answer_id = max(self._max_answer_id, answer_id)
+
+            for rating_id, answer_id, user_id in ratings:
+                if rating_id not in self._applied:
+                    self._applied.add(rating_id)
+                    self._increment(answer_id)
+                    self.exclude(user_id, answer_id)
+                self._max_rating_id = max(self._max_rating_id, rating_id)
+
+            # gli id sotto la finestra non verranno più riletti
+            floor = self._rating_floor()
+            self._applied = {rating_id for rating_id in self._applied if rating_id > floor}
+            self._refreshed_at = time.monotonic()
+
+    def _rating_floor(self) -> int:
+        """I rating con id maggiore vengono riletti a ogni aggiornamento"""
+        return max(self._counted_upto, self._max_rating_id - self.tail_overlap)
+
+    def _tail(self, conn: mariadb.Connection) -> None:
+        answers = execute_query(
+            conn, "SELECT id FROM answers WHERE id > ? ORDER BY id",
+            (max(0, self._max_answer_id - self.tail_overlap),),
+        )
+        ratings = execute_query(
+            conn, "SELECT id, answer_id, user_id FROM ratings WHERE id > ? ORDER BY id", (self._rating_floor(),)
+        )
+        self._apply_tail((row[0] for row in answers or []), ratings or [])
+
+    def ensure_fresh(self, conn: mariadb.Connection) -> None:
+        """
+        Ricostruisce lo stato al primo uso e ogni SCHEDULER_RECONCILE_INTERVAL secondi,
+        altrimenti legge solo le risposte e i rating nuovi.
+        Se un altro thread sta già aggiornando non lo aspettiamo.
+        """
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._refreshed_at < SCHEDULER_REFRESH_INTERVAL:
+            return
+
+        if not self._refresh_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            # di norma la ricostruzione periodica la fa reconcile_periodically;
+            # qui la facciamo solo al primo uso o se il timer non è attivo
+            if self._loaded_at is None or now - self._loaded_at >= 2 * SCHEDULER_RECONCILE_INTERVAL:
+                self._reconcile(conn)
+            elif now - self._refreshed_at >= SCHEDULER_REFRESH_INTERVAL:
+                self._tail(conn)
+        finally:
+            self._refresh_lock.release()
+
+    def reconcile(self, conn: mariadb.Connection) -> None:
+        """Ricostruisce i bucket dal DB"""
+        with self._refresh_lock:
+            self._reconcile(conn)
+
+    def _reconcile(self, conn: mariadb.Connection) -> None:
+        max_answer_id = execute_query(conn, "SELECT COALESCE(MAX(id), 0) FROM answers", fetchone=True)[0]
+        max_rating_id = execute_query(conn, "SELECT COALESCE(MAX(id), 0) FROM ratings", fetchone=True)[0]
+        # gli ultimi tail_overlap rating li conta _tail, che rilegge anche quelli committati in ritardo
+        counted_upto = max(0, max_rating_id - self.tail_overlap)
+        rows = execute_query(conn, COUNTS_QUERY, (counted_upto, max_answer_id))
+        self.load(rows or [], max_answer_id, counted_upto)
+        self._tail(conn)
+
+    # --- risposte escluse per utente ---
+
+    def excluded(self, user_id: int, conn: mariadb.Connection) -> set[int]:
+        """Risposte scritte o già valutate dall'utente, lette dal DB solo se non sono in memoria"""
+        excluded = self._excluded.get(user_id)
+        if excluded is None:
+            rows = execute_query(conn, EXCLUDED_QUERY, (user_id, user_id))
+            excluded = {row[0] for row in rows or []}
+            self._excluded.put(user_id, excluded, expires_at=time.time() + self.excluded_ttl)
+        return excluded
+
+    def exclude(self, user_id: int | None, answer_id: int) -> None:
+        if user_id is None:
+            return
+        excluded = self._excluded.get(user_id)
+        if excluded is not None:
+            excluded.add(answer_id)
+
+    # --- scelta ---
+
+    def next_for(self, excluded: set[int], skip=()) -> int | None:
+        """
+        Una risposta a caso tra quelle con meno rating non presenti in excluded né in skip.
+        In ogni bucket prova max_probes estrazioni; se falliscono tutte l'utente ha
+        escluso quasi tutto il bucket, che quindi non è più grande delle sue
+        esclusioni, e lo scorriamo per intero prima di passare al successivo.
+        """
+        with self._lock:
+            self.picks += 1
+            for count in sorted(self._buckets):
+                bucket = self._buckets[count]
+                for _ in range(self.max_probes):
+                    self.probes += 1
+                    answer_id = bucket[self._rng.randrange(len(bucket))]
+                    if answer_id not in excluded and answer_id not in skip:
+                        return answer_id
+
+                self.scans += 1
+                candidates = [
+                    answer_id for answer_id in bucket
+                    if answer_id not in excluded and answer_id not in skip
+                ]
+                if candidates:
+                    return self._rng.choice(candidates)
+        return None
+
+    def count(self, answer_id: int) -> int | None:
+        return self._count[answer_id] if self._known(answer_id) else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            buckets = {count: len(bucket) for count, bucket in sorted(self._buckets.items())[:10]}
+        return {
+            "answers": self._size,
+            "max_answer_id": self._max_answer_id,
+            "max_rating_id": self._max_rating_id,
+            "least_rated_buckets": buckets,
+            "picks": self.picks,
+            "avg_probes": self.probes / self.picks if self.picks else 0.0,
+            "scans": self.scans,
+            "users": self._excluded.stats(),
+        }
+
+
+scheduler = AnswerScheduler()
+
+
+def _reconcile_in_background() -> None:
+    with background_connection() as conn:
+        scheduler.reconcile(conn)
+
+
+async def reconcile_periodically() -> None:
+    """
+    Ricostruisce i bucket all'avvio del backend, così la prima richiesta non paga
+    la ricostruzione, e poi ogni SCHEDULER_RECONCILE_INTERVAL secondi.
+    """
+    while True:
+        try:
+            await run_blocking(_reconcile_in_background)
+        except Exception:
+            logger.exception("Errore durante la ricostruzione dello scheduler delle risposte")
+        await asyncio.sleep(SCHEDULER_RECONCILE_INTERVAL)
@@ -2,8 +2,12 @@ from fastapi import APIRouter, Depends, HTTPException, Response
 from typing import Literal, Optional
 import mariadb
 from db.mariadb import db_connection, execute_query
-from endpoints.auth.auth import get_current_user, get_current_user_id
+from endpoints.auth.auth import get_current_principal
+from endpoints.auth.models import Principal
+from endpoints.gamification.snapshot import snapshot
+from endpoints.questions.leases import answer_leases
 from endpoints.validate.models import RatingValues
+from endpoints.validate.scheduler import scheduler
 
 router = APIRouter(prefix="/validation", tags=["validation"])
 
@@ -13,20 +17,18 @@ router = APIRouter(prefix="/validation", tags=["validation"])
 def rate_answers(
     data: RatingValues,
     db: mariadb.Connection = Depends(db_connection),
-    current_user: Optional[str] = Depends(get_current_user),
+    principal: Optional[Principal] = Depends(get_current_principal),
     type: Literal["human", "llm"] = "human"
 ) -> Response:
 
-    if type == "human" and current_user is None:
+    if type == "human" and principal is None:
         raise HTTPException(
             status_code=401,
             detail="Errore: l'utente deve essere loggato per poter fare valutazioni",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    username = current_user if type == "human" else None
-
-    user_id = get_current_user_id(username, db)
+    user_id = principal.user_id if type == "human" else None
 
     insert_query = """
         INSERT INTO ratings (answer_id, question_id, user_id, rating, flag_ia)
@@ -34,7 +36,11 @@ def rate_answers(
     """
     params = (data.answer_id, data.question_id, user_id,data.rating, data.flag_ia)
     
-    execute_query(db, insert_query, params, fetch=False)
+    rating_id = execute_query(db, insert_query, params, fetch=False)
+    scheduler.record_rating(data.answer_id, user_id, rating_id)
+    answer_leases.release(data.answer_id, user_id)
+    # il rating cambia il punteggio di chi valuta e dell'autore della risposta
+    snapshot.invalidate()
 
     return Response(status_code=201)
 
@@ -0,0 +1,37 @@
+import hashlib
+
+from fastapi import Request, Response
+
+
+def make_etag(body: bytes, weak: bool = False) -> str:
+    digest = hashlib.sha1(body).hexdigest()[:20]
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Confronto debole con l'header If-None-Match, come richiesto per le GET (RFC 9110)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
+
+
+def cached_response(
+    request: Request,
+    body: bytes,
+    media_type: str = "application/json",
+    etag: str | None = None,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    """
+    Risposta con ETag: se il client ha già questa versione (If-None-Match)
+    ritorna 304 senza corpo.
+    """
+    etag = etag or make_etag(body)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", **(headers or {})}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
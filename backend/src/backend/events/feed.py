@@ -0,0 +1,195 @@
+"""
+Eventi di valutazione: le pipeline (nel worker) li scrivono nella tabella
+evaluation_events, un solo task per processo del backend li legge e li
+pubblica sull'hub in memoria, a cui sono iscritti i client SSE.
+Il numero di query non dipende quindi dal numero di client connessi.
+
+Gli id di evaluation_events non vengono committati in ordine (il worker
+scrive da più connessioni): a ogni lettura si rileggono anche gli ultimi
+EVENTS_TAIL_OVERLAP id e si pubblicano solo gli eventi non ancora visti.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+
+import mariadb
+
+from db.mariadb import execute_background_query_async, execute_query_async
+from events.hub import hub
+
+
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", 0.5))
+EVENTS_BATCH_SIZE = int(os.getenv("EVENTS_BATCH_SIZE", 500))
+EVENTS_RETENTION_HOURS = int(os.getenv("EVENTS_RETENTION_HOURS", 24))
+# id riletti prima dell'ultimo pubblicato, per gli eventi committati fuori ordine
+EVENTS_TAIL_OVERLAP = int(os.getenv("EVENTS_TAIL_OVERLAP", 200))
+
+logger = logging.getLogger("app")
+
+_task: asyncio.Task | None = None
+
+EVENT_COLUMNS = "id, user_id, kind, item_id, stage, data, created_at"
+
+
+async def record_event(
+    user_id: int | None,
+    kind: str,
+    item_id: int,
+    stage: str,
+    data: dict | None = None,
+    conn: mariadb.Connection | None = None,
+    commit: bool = True,
+) -> None:
+    """
+    Registra il passaggio di stato di una domanda o di una risposta.
+    Se conn non è passata usa una connessione del pool di background;
+    con commit=False l'evento fa parte della transazione aperta su conn.
+    Le domande e risposte generate dagli LLM non hanno un utente: niente evento.
+    """
+    if user_id is None:
+        return
+
+    insert_query = """
+        INSERT INTO evaluation_events (user_id, kind, item_id, stage, data, created_at)
+        VALUES (?, ?, ?, ?, ?, NOW(3))
+    """
+    params = (user_id, kind, item_id, stage, json.dumps(data or {}))
+
+    if conn is None:
+        await execute_background_query_async(insert_query, params, fetch=False)
+    else:
+        await execute_query_async(conn, insert_query, params, fetch=False, commit=commit)
+
+
+def to_event(row: dict) -> dict:
+    data = row["data"]
+    created_at = row["created_at"]
+    return {
+        "id": row["id"],
+        "user_id": row["user_id"],
+        "kind": row["kind"],
+        "item_id": row["item_id"],
+        "stage": row["stage"],
+        "data": json.loads(data) if isinstance(data, (str, bytes)) else (data or {}),
+        "created_at": created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+    }
+
+
+async def missed_events(conn: mariadb.Connection, user_id: int, last_id: int) -> list[dict]:
+    """Eventi successivi a last_id, per i client che si riconnettono con Last-Event-ID"""
+    select_query = f"""
+        SELECT {EVENT_COLUMNS}
+        FROM evaluation_events
+        WHERE user_id = ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+    """
+    rows = await execute_query_async(conn, select_query, (user_id, last_id, EVENTS_BATCH_SIZE), dict=True)
+    return [to_event(row) for row in rows or []]
+
+
+class TailWindow:
+    """
+    Finestra di lettura di tail_events: gli ultimi overlap id prima del più alto
+    letto vengono riletti, e gli eventi già pubblicati in quella finestra scartati.
+    Gli id fino a floor (l'id massimo all'avvio) non vengono mai pubblicati.
+    """
+
+    def __init__(self, floor: int, overlap: int = EVENTS_TAIL_OVERLAP):
+        self.floor = floor
+        self.last_id = floor
+        self.overlap = overlap
+        self._published: set[int] = set()
+
+    def start(self) -> int:
+        """Si leggono gli eventi con id maggiore"""
+        return max(self.floor, self.last_id - self.overlap)
+
+    def fresh(self, rows: list[dict]) -> list[dict]:
+        """Le righe non ancora pubblicate, che da qui in poi risultano pubblicate"""
+        new = [row for row in rows if row["id"] not in self._published]
+        for row in new:
+            self._published.add(row["id"])
+            self.last_id = max(self.last_id, row["id"])
+        start = self.start()
+        self._published = {event_id for event_id in self._published if event_id > start}
+        return new
+
+
+async def tail_events() -> None:
+    """
+    Legge i nuovi eventi (più la finestra di TailWindow) e li pubblica sull'hub.
+    Parte dall'id massimo corrente: lo storico viene recuperato solo da chi lo chiede.
+    """
+    window = None
+    select_query = f"""
+        SELECT {EVENT_COLUMNS}
+        FROM evaluation_events
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    """
+
+    while True:
+        try:
+            if window is None:
+                row = await execute_background_query_async(
+                    "SELECT COALESCE(MAX(id), 0) FROM evaluation_events", fetchone=True
+                )
+                # una finestra grande quanto il lotto potrebbe riempirlo di eventi
+                # già visti, e la lettura non avanzerebbe più
+                window = TailWindow(row[0], min(EVENTS_TAIL_OVERLAP, EVENTS_BATCH_SIZE // 2))
+
+            rows = await execute_background_query_async(select_query, (window.start(), EVENTS_BATCH_SIZE), dict=True)
+            new = window.fresh(rows or [])
+            for row in new:
+                hub.publish(to_event(row))
+
+            # se il lotto era pieno ci sono altri eventi: li leggiamo subito
+            if new and len(rows) == EVENTS_BATCH_SIZE:
+                continue
+
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Errore durante la lettura degli eventi di valutazione")
+
+        await asyncio.sleep(EVENTS_POLL_INTERVAL)
+
+
+def start_feed() -> None:
+    """Avvia il task di lettura, se non è già attivo"""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(tail_events())
+
+
+async def stop_feed() -> None:
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+
+
+async def purge_events() -> None:
+    """Elimina gli eventi più vecchi di EVENTS_RETENTION_HOURS"""
+    delete_query = """
+        DELETE FROM evaluation_events
+        WHERE created_at < DATE_SUB(NOW(3), INTERVAL ? HOUR)
+    """
+    await execute_background_query_async(delete_query, (EVENTS_RETENTION_HOURS,), fetch=False)
+
+
+def feed_stats() -> dict:
+    return {
+        "running": _task is not None and not _task.done(),
+        "poll_interval": EVENTS_POLL_INTERVAL,
+        **hub.stats(),
+    }
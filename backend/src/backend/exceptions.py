@@ -5,6 +5,8 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel, ValidationError
 import logging
 import functools
+import inspect
+from crypto.executor import ExecutorFull
 
 class Error(BaseModel):
     detail: str
@@ -13,24 +15,38 @@ class Error(BaseModel):
 def handle_exceptions(default_status_code=500, log_errors=True):
     """
     Decoratore per convertire eccezioni comuni in HTTPException.
+    Funziona sia con funzioni sincrone che con coroutine.
     """
 
+    def convert(func, e: Exception):
+        if isinstance(e, (HTTPException, ExecutorFull)):
+            # ExecutorFull diventa un 503 in executor_full_exception_handler
+            raise e
+
+        if isinstance(e, (ValidationError, ValueError)):
+            raise HTTPException(status_code=422, detail=str(e))
+
+        if log_errors:
+            logging.exception(f"Unexpected error in function '{func.__name__}'")
+        raise HTTPException(status_code=default_status_code, detail="Errore interno al server")
+
     def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    convert(func, e)
+
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             try:
                 return func(*args, **kwargs)
-
-            except HTTPException as http_exc:
-                raise http_exc
-
-            except (ValidationError, ValueError) as e:
-                raise HTTPException(status_code=422, detail=str(e))
-
             except Exception as e:
-                if log_errors:
-                    logging.exception(f"Unexpected error in function '{func.__name__}'")
-                raise HTTPException(status_code=default_status_code, detail="Errore interno al server")
+                convert(func, e)
 
         return wrapper
 
@@ -54,4 +70,12 @@ def request_validation_exception_handler(request: Request, exc: RequestValidatio
     if field:
         response["field"] = field
 
-    return JSONResponse(status_code=422, content=response)
\ No newline at end of file
+    return JSONResponse(status_code=422, content=response)
+
+
+def executor_full_exception_handler(request: Request, exc: ExecutorFull):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servizio momentaneamente sovraccarico, riprova più tardi"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
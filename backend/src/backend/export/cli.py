@@ -0,0 +1,56 @@
+"""
+Export del dataset da riga di comando, con una connessione propria al DB:
+
+    python -m export.cli --format parquet --output dataset.parquet
+    python -m export.cli --since-id 120000 > nuove_risposte.ndjson
+
+Alla fine stampa su stderr le righe esportate e l'ultimo answer_id, da passare
+come --since-id all'export incrementale successivo.
+"""
+import argparse
+import sys
+import time
+
+import mariadb
+
+from db.pool import settings_from_env
+from export.dataset import ENCODERS, EXPORT_CHUNK_SIZE, export_step
+
+
+def run(output, encoder, since_id: int, chunk_size: int) -> tuple[int, int]:
+    last_id, total = since_id, 0
+    conn = mariadb.connect(**settings_from_env())
+    try:
+        while True:
+            data, last_id, count = export_step(conn, encoder, last_id, chunk_size)
+            output.write(data)
+            total += count
+            if count < chunk_size:
+                break
+    finally:
+        conn.close()
+    output.write(encoder.close())
+    return total, last_id
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=sorted(ENCODERS), default="ndjson")
+    parser.add_argument("--since-id", type=int, default=0, help="esporta solo le risposte con id maggiore")
+    parser.add_argument("--output", default="-", help="file di destinazione, - per stdout")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    try:
+        encoder = ENCODERS[args.format]()
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    if args.output == "-":
+        total, last_id = run(sys.stdout.buffer, encoder, args.since_id, args.chunk_size)
+    else:
+        with open(args.output, "wb") as output:
+            total, last_id = run(output, encoder, args.since_id, args.chunk_size)
+
+    print(f"{total} righe esportate in {time.perf_counter() - start:.1f}s, ultimo answer_id {last_id}", file=sys.stderr)
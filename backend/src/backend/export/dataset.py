@@ -0,0 +1,200 @@
+"""
+Export del dataset di addestramento: una riga per risposta, con la domanda,
+le valutazioni degli LLM (mediate se ce n'è più di una) e i rating degli utenti
+aggregati.
+
+Le righe vengono lette a blocchi di EXPORT_CHUNK_SIZE risposte per id crescente
+(id > ultimo id letto): ogni blocco costa una query sulle risposte più tre query
+di aggregazione limitate agli id del blocco, la memoria resta quella di un blocco
+qualunque sia la dimensione del dataset, e si può riprendere da un id qualsiasi
+(export incrementali con since_id).
+
+Formati: NDJSON, oppure Parquet se pyarrow è installato (dipendenza opzionale:
+pip install pyarrow). Il Parquet viene scritto un row group per blocco.
+"""
+import json
+import os
+from decimal import Decimal
+from typing import Callable
+
+import mariadb
+
+from db.mariadb import execute_query
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))
+
+ANSWERS_QUERY = """
+    SELECT a.id AS answer_id, a.question_id, q.topic, q.type AS question_type, q.question,
+           a.type AS answer_type, a.llm_id AS answer_llm_id, a.answer
+    FROM answers a JOIN questions q ON q.id = a.question_id
+    WHERE a.id > ?
+    ORDER BY a.id ASC
+    LIMIT ?
+"""
+
+QUESTIONS_EVALUATION_QUERY = """
+    SELECT question_id, AVG(cultural_specificity), MIN(coherence_qt)
+    FROM questions_evaluation
+    WHERE question_id IN ({})
+    GROUP BY question_id
+"""
+
+ANSWERS_EVALUATION_QUERY = """
+    SELECT answer_id, AVG(validity), MIN(coherence_qa)
+    FROM answers_evaluation
+    WHERE answer_id BETWEEN ? AND ?
+    GROUP BY answer_id
+"""
+
+RATINGS_QUERY = """
+    SELECT answer_id, COUNT(*), AVG(rating), SUM(flag_ia)
+    FROM ratings
+    WHERE answer_id BETWEEN ? AND ?
+    GROUP BY answer_id
+"""
+
+# colonne del dataset, nell'ordine; i tipi sono quelli del file Parquet
+FIELDS = [
+    ("answer_id", "int64"),
+    ("question_id", "int64"),
+    ("topic", "string"),
+    ("question_type", "string"),
+    ("question", "string"),
+    ("answer_type", "string"),
+    ("answer_llm_id", "int64"),
+    ("answer", "string"),
+    # media sulle valutazioni dei diversi LLM; coerenza vera solo se lo è per tutti
+    ("cultural_specificity", "float64"),
+    ("coherence_qt", "bool"),
+    ("validity", "float64"),
+    ("coherence_qa", "bool"),
+    ("ratings", "int64"),
+    ("rating_avg", "float64"),
+    # quanti utenti hanno segnalato la risposta come scritta da un'IA
+    ("flag_ia", "int64"),
+]
+
+
+def _number(value, kind=float):
+    # AVG e SUM tornano Decimal, che json e pyarrow non accettano così come sono
+    return kind(value) if isinstance(value, Decimal) else value
+
+
+def _flag(value) -> bool | None:
+    return None if value is None else bool(value)
+
+
+def fetch_chunk(conn: mariadb.Connection, after: int, size: int = EXPORT_CHUNK_SIZE) -> list[dict]:
+    """Le prime size righe del dataset con answer_id > after"""
+    rows = execute_query(conn, ANSWERS_QUERY, (after, size), dict=True) or []
+    if not rows:
+        return rows
+
+    first, last = rows[0]["answer_id"], rows[-1]["answer_id"]
+    question_ids = sorted({row["question_id"] for row in rows})
+
+    questions = {
+        question_id: (_number(specificity), _flag(coherence))
+        for question_id, specificity, coherence in execute_query(
+            conn, QUESTIONS_EVALUATION_QUERY.format(", ".join("?" * len(question_ids))), tuple(question_ids)
+        ) or []
+    }
+    answers = {
+        answer_id: (_number(validity), _flag(coherence))
+        for answer_id, validity, coherence in execute_query(conn, ANSWERS_EVALUATION_QUERY, (first, last)) or []
+    }
+    ratings = {
+        answer_id: (count, _number(average), _number(flags, int))
+        for answer_id, count, average, flags in execute_query(conn, RATINGS_QUERY, (first, last)) or []
+    }
+
+    for row in rows:
+        row["cultural_specificity"], row["coherence_qt"] = questions.get(row["question_id"], (None, None))
+        row["validity"], row["coherence_qa"] = answers.get(row["answer_id"], (None, None))
+        row["ratings"], row["rating_avg"], row["flag_ia"] = ratings.get(row["answer_id"], (0, None, 0))
+    return rows
+
+
+class NdjsonEncoder:
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def encode(self, rows: list[dict]) -> bytes:
+        return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode()
+
+    def close(self) -> bytes:
+        return b""
+
+
+class _Sink:
+    """File in sola scrittura che accumula i byte finché non vengono letti con drain"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # ParquetWriter usa la posizione per gli offset nel footer: va contata dall'inizio del file
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ParquetEncoder:
+    media_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+
+    def __init__(self):
+        if pa is None:
+            raise RuntimeError("Export Parquet non disponibile: pyarrow non è installato")
+        self.schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in FIELDS])
+        self._sink = _Sink()
+        self._writer = pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+
+    def encode(self, rows: list[dict]) -> bytes:
+        self._writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+ENCODERS: dict[str, Callable[[], NdjsonEncoder | ParquetEncoder]] = {
+    "ndjson": NdjsonEncoder,
+    "parquet": ParquetEncoder,
+}
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def export_step(conn: mariadb.Connection, encoder, after: int, size: int = EXPORT_CHUNK_SIZE) -> tuple[bytes, int, int]:
+    """Legge ed encoda un blocco: (byte, ultimo answer_id, righe)"""
+    rows = fetch_chunk(conn, after, size)
+    if not rows:
+        return b"", after, 0
+    return encoder.encode(rows), rows[-1]["answer_id"], len(rows)
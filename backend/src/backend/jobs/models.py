@@ -0,0 +1,12 @@
+from typing import Literal
+from pydantic import BaseModel
+
+
+class Job(BaseModel):
+    id: int
+    kind: Literal["question", "answer"]
+    payload: dict
+    attempts: int
+    max_attempts: int
+    # secondi trascorsi dall'inserimento in coda al momento del lease
+    age: float = 0.0
@@ -0,0 +1,160 @@
+import json
+import os
+import random
+
+import mariadb
+
+from db.mariadb import execute_query, execute_query_async
+from jobs.models import Job
+
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", 5.0))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", 600.0))
+
+
+async def enqueue(conn: mariadb.Connection, kind: str, payload: dict, commit: bool = True) -> int:
+    """
+    Inserisce un job di valutazione nella coda e ne ritorna l'id.
+    Con commit=False fa parte della transazione del chiamante (transaction_async),
+    così il job esiste se e solo se esiste la domanda o risposta da valutare.
+    """
+    insert_query = """
+        INSERT INTO evaluation_jobs (kind, payload, max_attempts, available_at, created_at)
+        VALUES (?, ?, ?, NOW(3), NOW(3))
+    """
+    params = (kind, json.dumps(payload), JOB_MAX_ATTEMPTS)
+    return await execute_query_async(conn, insert_query, params, fetch=False, commit=commit)
+
+
+def lease(conn: mariadb.Connection, owner: str, limit: int, lease_seconds: int) -> list[Job]:
+    """
+    Prende in carico fino a limit job pronti. Sono pronti i job in attesa
+    il cui backoff è scaduto e quelli il cui lease è scaduto perché il
+    worker che li aveva presi è morto; questi ultimi, se hanno già esaurito
+    i tentativi, vengono segnati come falliti invece di essere ripresi.
+    SKIP LOCKED fa sì che più worker non si contendano le stesse righe.
+    """
+    select_query = """
+        SELECT id, status, attempts, max_attempts
+        FROM evaluation_jobs
+        WHERE (status = 'pending' AND available_at <= NOW(3))
+           OR (status = 'running' AND leased_until < NOW(3))
+        ORDER BY available_at
+        LIMIT ?
+        FOR UPDATE SKIP LOCKED
+    """
+    rows = execute_query(conn, select_query, (limit,)) or []
+    exhausted = tuple(job_id for job_id, status, attempts, max_attempts in rows
+                      if status == "running" and attempts >= max_attempts)
+    ids = tuple(row[0] for row in rows if row[0] not in exhausted)
+
+    # tutto nella transazione aperta dalla SELECT ... FOR UPDATE, confermata alla fine
+    if exhausted:
+        failed_query = f"""
+            UPDATE evaluation_jobs
+            SET status = 'failed', finished_at = NOW(3), leased_until = NULL, last_error = ?
+            WHERE id IN ({", ".join("?" for _ in exhausted)})
+        """
+        error = "Lease scaduto durante l'ultimo tentativo"
+        execute_query(conn, failed_query, (error, *exhausted), fetch=False, commit=False)
+
+    if not ids:
+        conn.commit()
+        return []
+
+    placeholders = ", ".join("?" for _ in ids)
+
+    update_query = f"""
+        UPDATE evaluation_jobs
+        SET status = 'running',
+            attempts = attempts + 1,
+            lease_owner = ?,
+            leased_until = DATE_ADD(NOW(3), INTERVAL ? SECOND)
+        WHERE id IN ({placeholders})
+    """
+    execute_query(conn, update_query, (owner, lease_seconds, *ids), fetch=False)
+
+    jobs_query = f"""
+        SELECT id, kind, payload, attempts, max_attempts,
+               TIMESTAMPDIFF(MICROSECOND, created_at, NOW(3)) / 1000000 AS age
+        FROM evaluation_jobs
+        WHERE id IN ({placeholders})
+    """
+    jobs = execute_query(conn, jobs_query, ids, dict=True)
+    for job in jobs:
+        job["payload"] = json.loads(job["payload"])
+        job["age"] = float(job["age"])
+    return [Job(**job) for job in jobs]
+
+
+def ack(conn: mariadb.Connection, job: Job, owner: str) -> None:
+    """Segna il job come completato"""
+    update_query = """
+        UPDATE evaluation_jobs
+        SET status = 'done', finished_at = NOW(3), leased_until = NULL, last_error = NULL
+        WHERE id = ? AND lease_owner = ?
+    """
+    execute_query(conn, update_query, (job.id, owner), fetch=False)
+
+
+def backoff_delay(attempts: int) -> float:
+    """Backoff esponenziale con jitter: base * 2^(tentativi-1), fino a JOB_BACKOFF_MAX"""
+    delay = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return delay + random.uniform(0, JOB_BACKOFF_BASE)
+
+
+def retry(conn: mariadb.Connection, job: Job, owner: str, error: str, permanent: bool = False) -> str:
+    """
+    Rimette il job in coda con backoff esponenziale, oppure lo segna come
+    fallito se l'errore è permanente o i tentativi sono esauriti.
+    Ritorna lo stato finale del job.
+    """
+    if permanent or job.attempts >= job.max_attempts:
+        update_query = """
+            UPDATE evaluation_jobs
+            SET status = 'failed', finished_at = NOW(3), leased_until = NULL, last_error = ?
+            WHERE id = ? AND lease_owner = ?
+        """
+        execute_query(conn, update_query, (error, job.id, owner), fetch=False)
+        return "failed"
+
+    update_query = """
+        UPDATE evaluation_jobs
+        SET status = 'pending',
+            available_at = DATE_ADD(NOW(3), INTERVAL ? SECOND),
+            leased_until = NULL,
+            last_error = ?
+        WHERE id = ? AND lease_owner = ?
+    """
+    execute_query(conn, update_query, (backoff_delay(job.attempts), error, job.id, owner), fetch=False)
+    return "pending"
+
+
+def defer(conn: mariadb.Connection, job: Job, owner: str, delay: float, reason: str) -> None:
+    """
+    Rimanda il job di delay secondi senza consumare un tentativo:
+    serve quando il lavoro non è nemmeno partito (es. circuito NLP aperto).
+    """
+    update_query = """
+        UPDATE evaluation_jobs
+        SET status = 'pending',
+            attempts = GREATEST(attempts - 1, 0),
+            available_at = DATE_ADD(NOW(3), INTERVAL ? SECOND),
+            leased_until = NULL,
+            last_error = ?
+        WHERE id = ? AND lease_owner = ?
+    """
+    execute_query(conn, update_query, (delay, reason, job.id, owner), fetch=False)
+
+
+def queue_depth(conn: mariadb.Connection) -> list[dict]:
+    """Numero di job per tipo e stato, più l'età del job più vecchio"""
+    select_query = """
+        SELECT kind, status, COUNT(*) AS jobs,
+               TIMESTAMPDIFF(SECOND, MIN(created_at), NOW(3)) AS oldest_seconds
+        FROM evaluation_jobs
+        WHERE status IN ('pending', 'running', 'failed')
+        GROUP BY kind, status
+    """
+    return execute_query(conn, select_query, dict=True)
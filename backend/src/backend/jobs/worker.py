@@ -0,0 +1,264 @@
+"""
+Worker che svuota la coda delle valutazioni (tabella evaluation_jobs).
+
+Si avvia come processo separato dal backend:
+
+    python -m jobs.worker
+
+ed espone su WORKER_PORT le stesse rotte /status del backend, più /status/worker.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import deque
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import asynccontextmanager
+
+from db.mariadb import background_connection, run_blocking, shutdown_executor
+from db.pool import init_background_pool, init_pool, settings_from_env
+from endpoints.answers import answers_nlp
+from endpoints.questions import questions_nlp
+from endpoints.status import status
+from events.feed import purge_events, record_event
+from jobs.models import Job
+from jobs.queue import ack, defer, lease, retry
+from nlp.cache import purge
+from nlp.breaker import CircuitOpen
+from nlp.client import close_client, deadline, open_client
+
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 4))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 1.0))
+WORKER_SHUTDOWN_GRACE = float(os.getenv("WORKER_SHUTDOWN_GRACE", 30.0))
+WORKER_PORT = int(os.getenv("WORKER_PORT", 8004))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 900))
+
+logger = logging.getLogger("app")
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+stats = {
+    "running": 0,
+    "done": 0,
+    "retried": 0,
+    "deferred": 0,
+    "failed": 0,
+    # errori del DB nel segnare l'esito: il job resta running fino alla scadenza del lease
+    "settle_errors": 0,
+}
+
+# latenza end-to-end (dall'inserimento in coda al completamento) degli ultimi job, per tipo
+latencies: dict[str, deque[float]] = {kind: deque(maxlen=1000) for kind in ("question", "answer")}
+
+
+async def run_question_job(payload: dict) -> None:
+    await questions_nlp.background_evaluation_pipeline(
+        payload["question"], payload["topic"], payload["question_id"], payload.get("user_id")
+    )
+
+
+async def run_answer_job(payload: dict) -> None:
+    await answers_nlp.background_evaluation_pipeline(
+        payload["question_id"], payload["answer"], payload["answer_id"], payload.get("user_id")
+    )
+
+
+HANDLERS = {
+    "question": run_question_job,
+    "answer": run_answer_job,
+}
+
+ITEM_ID_FIELDS = {
+    "question": "question_id",
+    "answer": "answer_id",
+}
+
+
+def _lease_jobs(limit: int) -> list[Job]:
+    with background_connection() as conn:
+        return lease(conn, OWNER, limit, JOB_LEASE_SECONDS)
+
+
+def _ack_job(job: Job) -> bool:
+    with background_connection() as conn:
+        ack(conn, job, OWNER)
+    return True
+
+
+def _retry_job(job: Job, error: str, permanent: bool) -> str:
+    with background_connection() as conn:
+        return retry(conn, job, OWNER, error, permanent)
+
+
+def _defer_job(job: Job, delay: float, reason: str) -> None:
+    with background_connection() as conn:
+        defer(conn, job, OWNER, delay, reason)
+
+
+async def _settle(job: Job, func, *args):
+    """
+    Segna l'esito del job con func. Un errore del DB qui non deve uscire dal
+    task: il job verrà ripreso alla scadenza del lease, quindi ci limitiamo a registrarlo.
+    """
+    try:
+        return await run_blocking(func, job, *args)
+    except Exception:
+        stats["settle_errors"] += 1
+        logger.exception(f"Errore durante l'aggiornamento dello stato del job {job.id}")
+        return None
+
+
+async def _record_outcome(job: Job, stage: str) -> None:
+    # un errore nel registrare l'evento non deve cambiare l'esito del job
+    try:
+        await record_event(job.payload.get("user_id"), job.kind, job.payload[ITEM_ID_FIELDS[job.kind]], stage)
+    except Exception:
+        logger.exception(f"Errore durante la registrazione dell'evento {stage} del job {job.id}")
+
+
+async def process(job: Job) -> None:
+    stats["running"] += 1
+    start = time.monotonic()
+    outcome = None
+    try:
+        # le pipeline prendono da sole le connessioni di background che servono;
+        # deadline limita la durata complessiva di tutte le chiamate NLP del job
+        async with deadline():
+            await HANDLERS[job.kind](job.payload)
+
+    except CircuitOpen as e:
+        # il servizio NLP è giù: il job viene rimandato, non scartato
+        await _settle(job, _defer_job, e.retry_after, str(e))
+        stats["deferred"] += 1
+        logger.warning(f"job {job.id} ({job.kind}) rimandato di {e.retry_after:.0f}s: {e}")
+
+    except TimeoutError:
+        outcome = await _settle(job, _retry_job, "Deadline della pipeline superata", False)
+        stats["failed" if outcome == "failed" else "retried"] += 1
+        logger.warning(f"job {job.id} ({job.kind}) tentativo {job.attempts}: deadline superata -> {outcome}")
+
+    except HTTPException as e:
+        # i 4xx (es. domanda non trovata, payload rifiutato dall'NLP) non migliorano riprovando
+        permanent = 400 <= e.status_code < 500
+        outcome = await _settle(job, _retry_job, str(e.detail), permanent)
+        stats["failed" if outcome == "failed" else "retried"] += 1
+        logger.warning(f"job {job.id} ({job.kind}) tentativo {job.attempts}: {e.detail} -> {outcome}")
+
+    except Exception as e:
+        outcome = await _settle(job, _retry_job, repr(e), False)
+        stats["failed" if outcome == "failed" else "retried"] += 1
+        logger.exception(f"job {job.id} ({job.kind}) tentativo {job.attempts} -> {outcome}")
+
+    else:
+        # senza ack il job verrà rieseguito alla scadenza del lease: non lo contiamo come completato
+        if await _settle(job, _ack_job):
+            outcome = "completed"
+            stats["done"] += 1
+            latencies[job.kind].append(job.age + time.monotonic() - start)
+            logger.info(f"job {job.id} ({job.kind}) completato in {time.monotonic() - start:.1f}s")
+
+    finally:
+        stats["running"] -= 1
+
+    if outcome in ("completed", "failed"):
+        await _record_outcome(job, outcome)
+
+
+async def drain(stop: asyncio.Event) -> None:
+    """
+    Prende in carico job finché ci sono slot liberi, fino a WORKER_CONCURRENCY
+    job contemporanei. Quando la coda è vuota aspetta WORKER_POLL_INTERVAL.
+    """
+    tasks: set[asyncio.Task] = set()
+    stop_waiter = asyncio.create_task(stop.wait())
+
+    while not stop.is_set():
+        free = WORKER_CONCURRENCY - len(tasks)
+        jobs = []
+        if free > 0:
+            try:
+                jobs = await run_blocking(_lease_jobs, free)
+            except Exception:
+                logger.exception("Errore durante il lease dei job")
+
+        for job in jobs:
+            # teniamo un riferimento ai task, altrimenti il GC può raccoglierli
+            task = asyncio.create_task(process(job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if jobs and len(tasks) < WORKER_CONCURRENCY:
+            continue
+
+        # aspettiamo che si liberi uno slot, che arrivi lo stop o che scada il polling
+        await asyncio.wait({stop_waiter, *tasks}, timeout=WORKER_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+
+    if tasks:
+        logger.info(f"Attendo la fine di {len(tasks)} job in corso")
+        # i job non terminati restano in 'running' e vengono ripresi alla scadenza del lease
+        await asyncio.wait(tasks, timeout=WORKER_SHUTDOWN_GRACE)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = settings_from_env()
+    # il pool delle richieste serve solo alle rotte /status
+    init_pool(**settings)
+    init_background_pool(**settings)
+    await open_client()
+
+    try:
+        await purge()
+    except Exception:
+        logger.exception("Errore durante la pulizia della cache NLP")
+    try:
+        await purge_events()
+    except Exception:
+        logger.exception("Errore durante la pulizia degli eventi di valutazione")
+
+    stop = asyncio.Event()
+    drainer = asyncio.create_task(drain(stop))
+    yield
+    stop.set()
+    await drainer
+
+    await close_client()
+    shutdown_executor()
+
+
+app = FastAPI(lifespan=lifespan)
+
+app.title = "Worker CulturaLLM"
+app.description = "Worker per le valutazioni NLP in coda."
+
+app.include_router(status.router)
+
+
+@app.get("/status/worker", tags=["status"])
+def get_worker_status() -> dict:
+    return {
+        "owner": OWNER,
+        "concurrency": WORKER_CONCURRENCY,
+        **stats,
+        "latency": {kind: _summary(values) for kind, values in latencies.items()},
+    }
+
+
+def _summary(values: deque[float]) -> dict:
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "p50": ordered[int(0.50 * (len(ordered) - 1))],
+        "p99": ordered[int(0.99 * (len(ordered) - 1))],
+        "max": ordered[-1],
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=WORKER_PORT, log_config="log_config.yaml")
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class LRUCache:
+    """
+    Cache LRU thread-safe con scadenza per elemento.
+
+    Il limite può essere sul numero di elementi (max_items) e/o sul peso
+    totale (max_weight, con weigher che calcola il peso di un valore,
+    ad esempio i byte di un'immagine).
+    """
+
+    def __init__(
+        self,
+        max_items: int | None = None,
+        max_weight: int | None = None,
+        weigher: Callable[[Any], int] | None = None,
+    ):
+        self.max_items = max_items
+        self.max_weight = max_weight
+        self.weigher = weigher or (lambda value: 1)
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[Hashable, tuple[Any, float | None, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value, expires_at: float | None = None) -> None:
+        """Inserisce value; expires_at è un timestamp (time.time()) oltre il quale l'elemento scade"""
+        weight = self.weigher(value)
+        if self.max_weight is not None and weight > self.max_weight:
+            return
+
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, weight)
+            self.weight += weight
+
+            while self._over_limit():
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, weight = self._data.pop(key)
+        self.weight -= weight
+
+    def _over_limit(self) -> bool:
+        if self.max_items is not None and len(self._data) > self.max_items:
+            return True
+        return self.max_weight is not None and self.weight > self.max_weight
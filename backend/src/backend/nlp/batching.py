@@ -0,0 +1,107 @@
+"""
+Coalescing delle chiamate NLP.
+
+SingleFlight fa sì che payload identici già in volo non partano due volte:
+chi arriva dopo aspetta il risultato della prima richiesta.
+BatchDispatcher raccoglie per una breve finestra le richieste verso lo
+stesso endpoint e le invia come un'unica chiamata alla rotta batch,
+poi restituisce a ciascuna coroutine il proprio risultato.
+"""
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._flights: dict[Hashable, asyncio.Task] = {}
+        self.deduplicated = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]):
+        task = self._flights.get(key)
+        if task is not None:
+            self.deduplicated += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._flights[key] = task
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+
+        # shield: se il chiamante viene cancellato la richiesta continua per gli altri
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+
+class BatchDispatcher:
+
+    def __init__(
+        self,
+        endpoint: str,
+        send_batch: Callable[[list[dict]], Awaitable[list[dict]]],
+        window: float = 0.2,
+        max_size: int = 16,
+    ):
+        self.endpoint = endpoint
+        self.send_batch = send_batch
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        self.items = 0
+        self._pending: list[tuple[dict, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._sending: set[asyncio.Task] = set()
+
+    async def submit(self, payload: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((payload, future))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._send(batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: list[tuple[dict, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.send_batch([payload for payload, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"La rotta batch di {self.endpoint} ha restituito {len(results)} risultati su {len(batch)}"
+                )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window": self.window,
+            "max_size": self.max_size,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,123 @@
+import time
+from collections import deque
+
+
+class CircuitOpen(Exception):
+    """Il circuito verso l'endpoint è aperto: la chiamata non viene nemmeno tentata"""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f"Circuito aperto verso {endpoint}, nuovo tentativo fra {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per un endpoint NLP.
+
+    Tiene le chiamate degli ultimi `window` secondi; una chiamata conta come
+    fallita se va in errore o se dura più di `slow_call` secondi. Quando le
+    chiamate sono almeno `min_calls` e la quota di fallite supera `error_rate`
+    il circuito si apre e le chiamate falliscono subito con CircuitOpen.
+    Dopo `open_seconds` passa a half-open e lascia passare `probes` richieste
+    di prova: se riescono il circuito si chiude, altrimenti si riapre.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        endpoint: str,
+        window: float = 60.0,
+        min_calls: int = 5,
+        error_rate: float = 0.5,
+        slow_call: float = 60.0,
+        open_seconds: float = 30.0,
+        probes: int = 1,
+        clock=time.monotonic,
+    ):
+        self.endpoint = endpoint
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probes_in_flight = 0
+        self._calls: deque[tuple[float, bool]] = deque()
+
+    def before_call(self) -> None:
+        """Da chiamare prima di ogni richiesta: solleva CircuitOpen se non può partire"""
+        now = self.clock()
+
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.open_seconds - now
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpen(self.endpoint, remaining)
+            self.state = self.HALF_OPEN
+            self._probes_in_flight = 0
+
+        if self.state == self.HALF_OPEN:
+            if self._probes_in_flight >= self.probes:
+                self.rejected += 1
+                raise CircuitOpen(self.endpoint, self.open_seconds)
+            self._probes_in_flight += 1
+
+    def record(self, ok: bool, latency: float) -> None:
+        """Registra l'esito di una chiamata partita dopo before_call"""
+        now = self.clock()
+        failed = not ok or latency > self.slow_call
+
+        if self.state == self.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if failed:
+                self._open(now)
+            else:
+                self.state = self.CLOSED
+                self._calls.clear()
+            return
+
+        self._calls.append((now, failed))
+        self._trim(now)
+
+        if self.state == self.CLOSED and len(self._calls) >= self.min_calls:
+            failures = sum(1 for _, call_failed in self._calls if call_failed)
+            if failures / len(self._calls) >= self.error_rate:
+                self._open(now)
+
+    def abandon(self) -> None:
+        """La chiamata autorizzata da before_call non è mai partita (es. cancellata in coda)"""
+        if self.state == self.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def stats(self) -> dict:
+        now = self.clock()
+        self._trim(now)
+        failures = sum(1 for _, failed in self._calls if failed)
+        return {
+            "state": self.state,
+            "calls_in_window": len(self._calls),
+            "failure_rate": failures / len(self._calls) if self._calls else 0.0,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "retry_after": max(0.0, self.opened_at + self.open_seconds - now) if self.state == self.OPEN else 0.0,
+        }
+
+    def _open(self, now: float) -> None:
+        self.state = self.OPEN
+        self.opened_at = now
+        self.times_opened += 1
+        self._calls.clear()
+
+    def _trim(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
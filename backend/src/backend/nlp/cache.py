@@ -0,0 +1,131 @@
+"""
+Cache dei risultati del servizio NLP.
+
+La chiave è l'hash di endpoint, versione del modello e payload normalizzato.
+Ci sono due livelli: una LRU in memoria e la tabella nlp_cache su MariaDB,
+condivisa fra i processi e persistente fra i riavvii. Cambiando
+NLP_MODEL_VERSION tutte le voci precedenti smettono di essere usate.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import unicodedata
+
+from db.mariadb import execute_background_query_async
+from lru import LRUCache
+
+NLP_CACHE_SIZE = int(os.getenv("NLP_CACHE_SIZE", 2048))
+NLP_CACHE_TTL = int(os.getenv("NLP_CACHE_TTL", 7 * 24 * 3600))
+NLP_MODEL_VERSION = os.getenv("NLP_MODEL_VERSION", "1")
+
+# /magenta umanizza una risposta generata: non ha senso riusarne l'output
+CACHEABLE_ENDPOINTS = set(
+    os.getenv("NLP_CACHE_ENDPOINTS", "green_cultural,green_coherence_QT,green_validity,green_coherence_QA,cyan").split(",")
+)
+
+logger = logging.getLogger("app")
+
+_memory = LRUCache(max_items=NLP_CACHE_SIZE)
+
+stats = {
+    "memory_hits": 0,
+    "db_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "db_errors": 0,
+}
+
+
+def normalize(value):
+    """Rende uguali testi che differiscono solo per spazi, maiuscole o forma Unicode"""
+    if isinstance(value, str):
+        return " ".join(unicodedata.normalize("NFC", value).split()).casefold()
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    return value
+
+
+def cache_key(endpoint: str, payload: dict) -> str:
+    raw = json.dumps(
+        {"endpoint": endpoint, "version": NLP_MODEL_VERSION, "payload": normalize(payload)},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def get_cached(endpoint: str, payload: dict) -> dict | None:
+    if endpoint not in CACHEABLE_ENDPOINTS:
+        return None
+
+    key = cache_key(endpoint, payload)
+    data = _memory.get(key)
+    if data is not None:
+        stats["memory_hits"] += 1
+        return data
+
+    select_query = """
+        SELECT response, UNIX_TIMESTAMP(expires_at) AS expires_at
+        FROM nlp_cache
+        WHERE cache_key = ? AND expires_at > NOW()
+    """
+    try:
+        row = await execute_background_query_async(select_query, (key,), fetchone=True, dict=True)
+    except Exception:
+        logger.exception("Errore leggendo la cache NLP dal DB")
+        stats["db_errors"] += 1
+        row = None
+
+    if row is None:
+        stats["misses"] += 1
+        return None
+
+    data = json.loads(row["response"])
+    _memory.put(key, data, expires_at=float(row["expires_at"]))
+    stats["db_hits"] += 1
+    return data
+
+
+async def store(endpoint: str, payload: dict, data: dict) -> None:
+    if endpoint not in CACHEABLE_ENDPOINTS:
+        return
+
+    key = cache_key(endpoint, payload)
+    _memory.put(key, data, expires_at=time.time() + NLP_CACHE_TTL)
+
+    insert_query = """
+        INSERT INTO nlp_cache (cache_key, endpoint, model_version, response, created_at, expires_at)
+        VALUES (?, ?, ?, ?, NOW(), DATE_ADD(NOW(), INTERVAL ? SECOND))
+        ON DUPLICATE KEY UPDATE response = VALUES(response), created_at = VALUES(created_at), expires_at = VALUES(expires_at)
+    """
+    params = (key, endpoint, NLP_MODEL_VERSION, json.dumps(data), NLP_CACHE_TTL)
+    try:
+        await execute_background_query_async(insert_query, params, fetch=False)
+        stats["stores"] += 1
+    except Exception:
+        logger.exception("Errore salvando la cache NLP sul DB")
+        stats["db_errors"] += 1
+
+
+async def purge() -> None:
+    """Elimina le voci scadute e quelle di versioni del modello diverse da quella corrente"""
+    delete_query = """
+        DELETE FROM nlp_cache
+        WHERE expires_at <= NOW() OR model_version <> ?
+    """
+    await execute_background_query_async(delete_query, (NLP_MODEL_VERSION,), fetch=False)
+
+
+def cache_stats() -> dict:
+    lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+    hits = stats["memory_hits"] + stats["db_hits"]
+    return {
+        **stats,
+        "hit_rate": hits / lookups if lookups else 0.0,
+        "model_version": NLP_MODEL_VERSION,
+        "memory": _memory.stats(),
+    }
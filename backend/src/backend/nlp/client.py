@@ -0,0 +1,208 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+import httpx
+from fastapi import HTTPException
+
+from nlp.batching import BatchDispatcher, SingleFlight
+from nlp.breaker import CircuitBreaker
+from nlp.config import (
+    BASE_URL,
+    BATCH_ENDPOINTS,
+    NLP_BATCH_MAX_SIZE,
+    NLP_BATCH_WINDOW,
+    NLP_BREAKER_ERROR_RATE,
+    NLP_BREAKER_MIN_CALLS,
+    NLP_BREAKER_OPEN_SECONDS,
+    NLP_BREAKER_SLOW_CALL,
+    NLP_BREAKER_WINDOW,
+    NLP_CONNECT_TIMEOUT,
+    NLP_KEEPALIVE_EXPIRY,
+    NLP_MAX_CONNECTIONS,
+    NLP_MAX_KEEPALIVE,
+    NLP_PIPELINE_DEADLINE,
+    NLP_TIMEOUT,
+    SLOW_CALLS,
+    TIMEOUTS,
+)
+from nlp.cache import cache_key, get_cached, store
+from nlp.limits import get_limiter
+
+_client: httpx.AsyncClient | None = None
+
+# richieste identiche in volo e dispatcher dei batch, per endpoint
+_in_flight = SingleFlight()
+_dispatchers: dict[str, BatchDispatcher] = {}
+_breakers: dict[str, CircuitBreaker] = {}
+
+# istante (time.monotonic) entro cui deve finire la pipeline corrente
+_deadline: ContextVar[float | None] = ContextVar("nlp_deadline", default=None)
+
+
+async def open_client() -> httpx.AsyncClient:
+    """Crea il client HTTP condiviso, che resta aperto per tutta la vita dell'app"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            limits=httpx.Limits(
+                max_connections=NLP_MAX_CONNECTIONS,
+                max_keepalive_connections=NLP_MAX_KEEPALIVE,
+                keepalive_expiry=NLP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(NLP_TIMEOUT, connect=NLP_CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def get_client() -> httpx.AsyncClient:
+    # se la lifespan non è stata eseguita (es. TestClient senza with) lo apriamo al primo uso
+    return _client or await open_client()
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    if endpoint not in _breakers:
+        _breakers[endpoint] = CircuitBreaker(
+            endpoint,
+            window=NLP_BREAKER_WINDOW,
+            min_calls=NLP_BREAKER_MIN_CALLS,
+            error_rate=NLP_BREAKER_ERROR_RATE,
+            slow_call=SLOW_CALLS.get(endpoint, NLP_BREAKER_SLOW_CALL),
+            open_seconds=NLP_BREAKER_OPEN_SECONDS,
+        )
+    return _breakers[endpoint]
+
+
+@asynccontextmanager
+async def deadline(seconds: float = NLP_PIPELINE_DEADLINE):
+    """
+    Budget complessivo per le chiamate NLP del blocco: ogni chiamata usa come
+    timeout il minimo fra quello dell'endpoint e il tempo rimasto, e allo
+    scadere il blocco viene interrotto con TimeoutError.
+    """
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        async with asyncio.timeout(seconds):
+            yield
+    finally:
+        _deadline.reset(token)
+
+
+async def gather_or_cancel(*aws):
+    """
+    Come asyncio.gather per le fasi indipendenti di una pipeline, ma al primo
+    errore cancella le altre invece di lasciarle occupare la concorrenza verso
+    l'NLP per un risultato che verrà scartato. Rilancia l'eccezione originale,
+    non un ExceptionGroup come TaskGroup: il worker distingue CircuitOpen,
+    TimeoutError e HTTPException.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    except BaseException:
+        # cancellati dall'esterno, ad esempio da deadline
+        for task in tasks:
+            task.cancel()
+        raise
+
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+    for task in tasks:
+        if task.done() and not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
+async def _post(endpoint: str, url: str, body: dict):
+    breaker = get_breaker(endpoint)
+    # se il circuito è aperto solleva CircuitOpen senza fare la richiesta
+    breaker.before_call()
+
+    ok = False
+    start = None
+    try:
+        client = await get_client()
+        async with get_limiter(endpoint).slot():
+            timeout = TIMEOUTS.get(endpoint, NLP_TIMEOUT)
+            expires_at = _deadline.get()
+            if expires_at is not None:
+                timeout = min(timeout, expires_at - time.monotonic())
+                if timeout <= 0:
+                    raise TimeoutError(f"Budget della pipeline esaurito prima di chiamare {endpoint}")
+
+            start = time.monotonic()
+            resp = await client.post(url, json=body, timeout=httpx.Timeout(timeout, connect=NLP_CONNECT_TIMEOUT))
+            resp.raise_for_status()
+            ok = True
+
+    except httpx.HTTPStatusError as e:
+        # un 4xx dipende dalla richiesta, non dalla salute del servizio
+        ok = e.response.status_code < 500
+        raise HTTPException(status_code=e.response.status_code, detail=f"Errore HTTP dal servizio LLM: {e}")
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=502, detail=f"Errore di rete contattando il servizio LLM: {e}")
+
+    finally:
+        if start is None:
+            breaker.abandon()
+        else:
+            breaker.record(ok, time.monotonic() - start)
+
+    return resp.json()
+
+
+def get_dispatcher(endpoint: str) -> BatchDispatcher:
+    if endpoint not in _dispatchers:
+
+        async def send_batch(payloads: list[dict]) -> list[dict]:
+            data = await _post(endpoint, f"/{endpoint}/batch", {"items": payloads})
+            return data["results"]
+
+        _dispatchers[endpoint] = BatchDispatcher(endpoint, send_batch, NLP_BATCH_WINDOW, NLP_BATCH_MAX_SIZE)
+    return _dispatchers[endpoint]
+
+
+async def _call(endpoint: str, payload: dict) -> dict:
+    if endpoint in BATCH_ENDPOINTS:
+        data = await get_dispatcher(endpoint).submit(payload)
+    else:
+        data = await _post(endpoint, f"/{endpoint}", payload)
+
+    await store(endpoint, payload, data)
+    return data
+
+
+async def post_to_nlp(endpoint: str, payload: dict) -> dict:
+    """
+    Invia payload all'endpoint NLP indicato e ritorna il JSON della risposta.
+    Se lo stesso payload è già stato valutato, la risposta arriva dalla cache;
+    se è già in volo, si aspetta la richiesta in corso invece di ripeterla.
+    """
+    cached = await get_cached(endpoint, payload)
+    if cached is not None:
+        return cached
+
+    return await _in_flight.run(cache_key(endpoint, payload), lambda: _call(endpoint, payload))
+
+
+def batching_stats() -> dict:
+    return {
+        "deduplicated": _in_flight.deduplicated,
+        "in_flight": len(_in_flight),
+        "dispatchers": {endpoint: dispatcher.stats() for endpoint, dispatcher in _dispatchers.items()},
+    }
+
+
+def breaker_stats() -> dict:
+    return {endpoint: breaker.stats() for endpoint, breaker in _breakers.items()}
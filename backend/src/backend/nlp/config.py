@@ -0,0 +1,56 @@
+import os
+
+NLP_PORT = int(os.getenv("NLP_PORT", 8071))
+NLP_IP = os.getenv("NLP_IP", "143.198.37.78")
+
+BASE_URL = f"http://{NLP_IP}:{NLP_PORT}"
+
+# endpoint esposti dal servizio NLP
+ENDPOINTS = (
+    "green_cultural",
+    "green_coherence_QT",
+    "cyan",
+    "magenta",
+    "green_validity",
+    "green_coherence_QA",
+)
+
+
+def env_per_endpoint(prefix: str, endpoint: str, default, cast=float):
+    """
+    Legge una configurazione specifica per endpoint, ad esempio
+    NLP_TIMEOUT_GREEN_COHERENCE_QT, altrimenti ritorna il default.
+    """
+    value = os.getenv(f"{prefix}_{endpoint.upper()}")
+    return cast(value) if value is not None else default
+
+
+NLP_MAX_CONNECTIONS = int(os.getenv("NLP_MAX_CONNECTIONS", 20))
+NLP_MAX_KEEPALIVE = int(os.getenv("NLP_MAX_KEEPALIVE", 10))
+NLP_KEEPALIVE_EXPIRY = float(os.getenv("NLP_KEEPALIVE_EXPIRY", 60.0))
+NLP_CONNECT_TIMEOUT = float(os.getenv("NLP_CONNECT_TIMEOUT", 5.0))
+NLP_TIMEOUT = float(os.getenv("NLP_TIMEOUT", 300.0))
+
+TIMEOUTS = {endpoint: env_per_endpoint("NLP_TIMEOUT", endpoint, NLP_TIMEOUT) for endpoint in ENDPOINTS}
+
+# richieste contemporanee verso ciascun endpoint (NLP_CONCURRENCY_<ENDPOINT> per il singolo)
+NLP_CONCURRENCY = int(os.getenv("NLP_CONCURRENCY", 1))
+
+CONCURRENCY = {endpoint: env_per_endpoint("NLP_CONCURRENCY", endpoint, NLP_CONCURRENCY, int) for endpoint in ENDPOINTS}
+
+# endpoint le cui richieste vengono raggruppate e inviate alla rotta /<endpoint>/batch
+BATCH_ENDPOINTS = {endpoint for endpoint in os.getenv("NLP_BATCH_ENDPOINTS", "").split(",") if endpoint}
+NLP_BATCH_WINDOW = float(os.getenv("NLP_BATCH_WINDOW_MS", 200)) / 1000
+NLP_BATCH_MAX_SIZE = int(os.getenv("NLP_BATCH_MAX_SIZE", 16))
+
+# circuit breaker per endpoint (vedi nlp/breaker.py)
+NLP_BREAKER_WINDOW = float(os.getenv("NLP_BREAKER_WINDOW", 60.0))
+NLP_BREAKER_MIN_CALLS = int(os.getenv("NLP_BREAKER_MIN_CALLS", 5))
+NLP_BREAKER_ERROR_RATE = float(os.getenv("NLP_BREAKER_ERROR_RATE", 0.5))
+NLP_BREAKER_OPEN_SECONDS = float(os.getenv("NLP_BREAKER_OPEN_SECONDS", 30.0))
+NLP_BREAKER_SLOW_CALL = float(os.getenv("NLP_BREAKER_SLOW_CALL", 120.0))
+
+SLOW_CALLS = {endpoint: env_per_endpoint("NLP_BREAKER_SLOW_CALL", endpoint, NLP_BREAKER_SLOW_CALL) for endpoint in ENDPOINTS}
+
+# tempo massimo complessivo per una pipeline di valutazione, al posto di un timeout fisso per chiamata
+NLP_PIPELINE_DEADLINE = float(os.getenv("NLP_PIPELINE_DEADLINE", 600.0))
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from nlp.config import CONCURRENCY, NLP_CONCURRENCY
+
+
+class EndpointLimiter:
+    """
+    Limita le richieste contemporanee verso un endpoint NLP e tiene
+    traccia di quante coroutine sono in coda e di quanto aspettano,
+    così da poter dimensionare i limiti sulla capacità reale del server.
+    """
+
+    def __init__(self, endpoint: str, limit: int, window: int = 1000):
+        self.endpoint = endpoint
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+        self.in_flight = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent_waits: deque[float] = deque(maxlen=window)
+
+    @asynccontextmanager
+    async def slot(self):
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        wait = time.monotonic() - start
+        self.acquired += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self._recent_waits.append(wait)
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        recent = sorted(self._recent_waits)
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "acquired": self.acquired,
+            "avg_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+            "max_wait": self.max_wait,
+            "p99_recent_wait": recent[int(0.99 * (len(recent) - 1))] if recent else 0.0,
+        }
+
+
+_limiters: dict[str, EndpointLimiter] = {}
+
+
+def get_limiter(endpoint: str) -> EndpointLimiter:
+    if endpoint not in _limiters:
+        _limiters[endpoint] = EndpointLimiter(endpoint, CONCURRENCY.get(endpoint, NLP_CONCURRENCY))
+    return _limiters[endpoint]
+
+
+def limiter_stats() -> dict[str, dict]:
+    return {endpoint: limiter.stats() for endpoint, limiter in _limiters.items()}
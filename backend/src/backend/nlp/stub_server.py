@@ -0,0 +1,165 @@
+"""
+Server NLP finto, per test e benchmark senza il servizio reale.
+
+Implementa gli stessi endpoint del servizio NLP con risposte deterministiche
+(dipendono solo dal payload) e, per ciascuno, una rotta /<endpoint>/batch
+che accetta {"items": [...]} e risponde {"results": [...]}.
+
+Latenza e tasso di errore si configurano per endpoint con STUB_LATENCY e
+STUB_ERROR_RATE (o con --latency e --error-rate), ad esempio:
+
+    STUB_LATENCY="default=lognormal:1.5:0.6,cyan=uniform:5:15"
+    STUB_ERROR_RATE="default=0.01,green_validity=0.05"
+
+Distribuzioni (valori in secondi): fixed:S, uniform:MIN:MAX, normal:MEDIA:DEV,
+lognormal:MEDIANA:SIGMA, exponential:MEDIA. Un errore risponde 503.
+
+    python -m nlp.stub_server --port 8071 --latency "default=fixed:0.5"
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+from collections import Counter
+from typing import Callable
+
+from fastapi import FastAPI, HTTPException
+
+
+app = FastAPI(title="Stub NLP CulturaLLM")
+
+# numero di chiamate ricevute per rotta, utile nei test
+calls: Counter = Counter()
+
+
+def parse_distribution(spec: str) -> Callable[[], float]:
+    """Trasforma una specifica come 'lognormal:1.5:0.6' in una funzione che campiona la latenza"""
+    name, *args = spec.split(":")
+    values = [float(arg) for arg in args]
+
+    if name == "fixed":
+        return lambda: values[0]
+    if name == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if name == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if name == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    if name == "exponential":
+        return lambda: random.expovariate(1 / values[0])
+    raise ValueError(f"Distribuzione sconosciuta: {spec}")
+
+
+def parse_per_endpoint(spec: str) -> dict[str, str]:
+    """'default=fixed:0.5,cyan=uniform:5:15' -> {'default': 'fixed:0.5', 'cyan': 'uniform:5:15'}"""
+    entries = (item.split("=", 1) for item in spec.split(",") if item.strip())
+    return {endpoint.strip(): value.strip() for endpoint, value in entries}
+
+
+latency: dict[str, Callable[[], float]] = {}
+error_rate: dict[str, float] = {}
+
+
+def configure(latency_spec: str = "", error_rate_spec: str = "") -> None:
+    latency.clear()
+    error_rate.clear()
+    latency.update({endpoint: parse_distribution(value) for endpoint, value in parse_per_endpoint(latency_spec).items()})
+    error_rate.update({endpoint: float(value) for endpoint, value in parse_per_endpoint(error_rate_spec).items()})
+
+
+configure(os.getenv("STUB_LATENCY", ""), os.getenv("STUB_ERROR_RATE", ""))
+
+
+async def simulate(endpoint: str) -> None:
+    """Aspetta la latenza campionata per l'endpoint e a volte fallisce con 503"""
+    sample = latency.get(endpoint) or latency.get("default")
+    if sample is not None:
+        await asyncio.sleep(sample())
+
+    if random.random() < error_rate.get(endpoint, error_rate.get("default", 0.0)):
+        calls[f"{endpoint}:errors"] += 1
+        raise HTTPException(status_code=503, detail="Errore simulato dallo stub NLP")
+
+
+def _digest(payload: dict) -> int:
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return int(hashlib.sha256(raw.encode()).hexdigest(), 16)
+
+
+def green_cultural(payload: dict) -> dict:
+    score = _digest(payload) % 11
+    return {"score": score, "feedback": f"Specificità culturale stimata: {score}/10"}
+
+
+def green_coherence_qt(payload: dict) -> dict:
+    return {"bool": "Vero" if _digest(payload) % 4 else "Falso"}
+
+
+def cyan(payload: dict) -> dict:
+    return {"risposta": f"Risposta generata per: {payload.get('argomento', '')}"}
+
+
+def magenta(payload: dict) -> dict:
+    return {"humanized_response": payload.get("llm_response", "")}
+
+
+def green_validity(payload: dict) -> dict:
+    score = _digest(payload) % 6
+    return {"score": score, "feedback": f"Validità stimata: {score}/5"}
+
+
+def green_coherence_qa(payload: dict) -> dict:
+    return {"bool": "Vero" if _digest(payload) % 4 else "Falso"}
+
+
+HANDLERS = {
+    "green_cultural": green_cultural,
+    "green_coherence_QT": green_coherence_qt,
+    "cyan": cyan,
+    "magenta": magenta,
+    "green_validity": green_validity,
+    "green_coherence_QA": green_coherence_qa,
+}
+
+
+def _register(endpoint: str, handler) -> None:
+
+    async def single(payload: dict) -> dict:
+        calls[endpoint] += 1
+        await simulate(endpoint)
+        return handler(payload)
+
+    async def batch(body: dict) -> dict:
+        calls[f"{endpoint}/batch"] += 1
+        # un batch costa quanto una singola chiamata, come su una GPU
+        await simulate(endpoint)
+        return {"results": [handler(item) for item in body.get("items", [])]}
+
+    app.add_api_route(f"/{endpoint}", single, methods=["POST"])
+    app.add_api_route(f"/{endpoint}/batch", batch, methods=["POST"])
+
+
+for _endpoint, _handler in HANDLERS.items():
+    _register(_endpoint, _handler)
+
+
+@app.get("/stats")
+def get_stats() -> dict:
+    return dict(calls)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8071)
+    parser.add_argument("--latency", default=os.getenv("STUB_LATENCY", ""))
+    parser.add_argument("--error-rate", default=os.getenv("STUB_ERROR_RATE", ""))
+    args = parser.parse_args()
+
+    configure(args.latency, args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,66 @@
+import pytest
+
+
+class FakeCursor:
+
+    def __init__(self, connection: "FakeConnection", dictionary: bool):
+        self.connection = connection
+        self.dictionary = dictionary
+        self.rows = []
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=()):
+        conn = self.connection
+        conn.queries.append((query, params))
+        for marker, rows in conn.results.items():
+            if marker in query:
+                self.rows = list(rows(params) if callable(rows) else rows)
+                return
+        if query.strip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
+            conn.pending.append((query, params))
+            self.lastrowid = len(conn.committed) + len(conn.pending)
+            return
+        raise AssertionError(f"query inattesa: {query}")
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakeConnection:
+    """
+    Connessione al DB per i test che non ne hanno una vera. results associa a un
+    pezzo del testo della query le righe da restituire (una lista o una funzione
+    dei parametri); le scritture senza risultati configurati restano in pending
+    fino a commit(), come in una transazione.
+    """
+
+    def __init__(self, results: dict | None = None):
+        self.results = results or {}
+        self.queries: list[tuple[str, tuple]] = []
+        self.pending: list[tuple[str, tuple]] = []
+        self.committed: list[tuple[str, tuple]] = []
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self, dictionary)
+
+    def commit(self):
+        self.committed += self.pending
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+
+@pytest.fixture
+def fake_connection():
+    """Costruttore di FakeConnection: fake_connection({"FROM users": [(7,)]})"""
+    return FakeConnection
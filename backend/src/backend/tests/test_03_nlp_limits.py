@@ -0,0 +1,29 @@
+import asyncio
+
+from nlp.limits import EndpointLimiter
+
+
+def test_limiter_caps_concurrency_and_tracks_queue():
+    limiter = EndpointLimiter("green_cultural", limit=2)
+    peak = 0
+    depths = []
+
+    async def call():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.in_flight)
+            depths.append(limiter.waiting)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(run())
+
+    stats = limiter.stats()
+    assert peak == 2
+    assert max(depths) > 0
+    assert stats["acquired"] == 6
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
+    assert stats["max_wait"] > 0
@@ -0,0 +1,31 @@
+import time
+
+from lru import LRUCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_items=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_lru_respects_weight_budget_and_expiry():
+    cache = LRUCache(max_weight=10, weigher=len)
+    cache.put("big", b"x" * 11)
+    assert cache.get("big") is None
+
+    cache.put("a", b"x" * 6)
+    cache.put("b", b"x" * 6)
+    assert cache.get("a") is None
+    assert cache.weight == 6
+
+    cache.put("old", b"x", expires_at=time.time() - 1)
+    assert cache.get("old") is None
+    assert cache.stats()["items"] == 1
@@ -0,0 +1,88 @@
+import asyncio
+
+import httpx
+
+from nlp import stub_server
+from nlp.batching import BatchDispatcher, SingleFlight
+
+
+def stub_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=stub_server.app), base_url="http://nlp-stub")
+
+
+def test_dispatcher_sends_one_batch_and_fans_out_results():
+    stub_server.calls.clear()
+    questions = [f"Domanda numero {i}?" for i in range(5)]
+
+    async def run():
+        async with stub_client() as client:
+
+            async def send_batch(payloads):
+                resp = await client.post("/green_cultural/batch", json={"items": payloads})
+                resp.raise_for_status()
+                return resp.json()["results"]
+
+            dispatcher = BatchDispatcher("green_cultural", send_batch, window=0.05, max_size=16)
+            batched = await asyncio.gather(*(dispatcher.submit({"question": q}) for q in questions))
+            single = [(await client.post("/green_cultural", json={"question": q})).json() for q in questions]
+            return dispatcher, batched, single
+
+    dispatcher, batched, single = asyncio.run(run())
+
+    assert batched == single
+    assert stub_server.calls["green_cultural/batch"] == 1
+    assert dispatcher.stats()["avg_batch_size"] == 5
+
+
+def test_dispatcher_flushes_when_batch_is_full():
+    sizes = []
+
+    async def send_batch(payloads):
+        sizes.append(len(payloads))
+        return [{"echo": payload} for payload in payloads]
+
+    async def run():
+        dispatcher = BatchDispatcher("green_validity", send_batch, window=10.0, max_size=3)
+        return await asyncio.gather(*(dispatcher.submit({"n": i}) for i in range(6)))
+
+    results = asyncio.run(run())
+
+    assert sizes == [3, 3]
+    assert results == [{"echo": {"n": i}} for i in range(6)]
+
+
+def test_single_flight_deduplicates_identical_payloads():
+    stub_server.calls.clear()
+
+    async def run():
+        flights = SingleFlight()
+        async with stub_client() as client:
+
+            async def call():
+                await asyncio.sleep(0.01)
+                resp = await client.post("/green_validity", json={"question": "Q", "answer": "A"})
+                return resp.json()
+
+            results = await asyncio.gather(*(flights.run("same-key", call) for _ in range(4)))
+        return flights, results
+
+    flights, results = asyncio.run(run())
+
+    assert stub_server.calls["green_validity"] == 1
+    assert flights.deduplicated == 3
+    assert len(flights) == 0
+    assert all(result == results[0] for result in results)
+
+
+def test_batch_errors_reach_every_waiter():
+
+    async def send_batch(payloads):
+        raise RuntimeError("NLP non raggiungibile")
+
+    async def run():
+        dispatcher = BatchDispatcher("cyan", send_batch, window=0.01)
+        return await asyncio.gather(*(dispatcher.submit({"n": i}) for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from endpoints.answers import answers_nlp
+from nlp.breaker import CircuitBreaker, CircuitOpen
+from nlp.client import gather_or_cancel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_breaker(clock: FakeClock) -> CircuitBreaker:
+    return CircuitBreaker("green_cultural", window=60, min_calls=4, error_rate=0.5,
+                          slow_call=10, open_seconds=30, clock=clock)
+
+
+def call(breaker: CircuitBreaker, ok: bool = True, latency: float = 1.0) -> None:
+    breaker.before_call()
+    breaker.record(ok, latency)
+
+
+def test_breaker_opens_on_errors_and_fails_fast():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+
+    call(breaker)
+    call(breaker)
+    call(breaker, ok=False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    call(breaker, ok=False)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 10
+    with pytest.raises(CircuitOpen) as exc:
+        breaker.before_call()
+    assert exc.value.retry_after == pytest.approx(20)
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_slow_calls_count_as_failures():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+
+    for _ in range(4):
+        call(breaker, latency=15)
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_half_open_probe_closes_or_reopens():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        call(breaker, ok=False)
+
+    clock.now = 31
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # una sola richiesta di prova alla volta
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.record(False, 1.0)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 62
+    call(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_old_calls_leave_the_window():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    call(breaker, ok=False)
+    call(breaker, ok=False)
+
+    clock.now = 100
+    call(breaker)
+    call(breaker, ok=False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["calls_in_window"] == 2
+
+
+def test_pipeline_stages_are_cancelled_when_one_fails():
+    cancelled = []
+
+    async def slow_stage():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def failing_stage():
+        await asyncio.sleep(0)
+        raise CircuitOpen("coherence_qa", 5.0)
+
+    async def pipeline():
+        return await gather_or_cancel(slow_stage(), failing_stage())
+
+    with pytest.raises(CircuitOpen):
+        asyncio.run(asyncio.wait_for(pipeline(), timeout=1))
+    assert cancelled == [True]
+
+    async def ok(value):
+        return value
+
+    assert asyncio.run(gather_or_cancel(ok(1), ok(2))) == [1, 2]
+
+
+def test_each_stage_is_reported_as_soon_as_it_finishes(monkeypatch):
+    events = []
+    coherence_done = asyncio.Event()
+
+    async def evaluate_validity(answer, question):
+        return 4, "ok"
+
+    async def evaluate_coherence_qa(answer, question, answer_id):
+        await coherence_done.wait()
+        return True
+
+    async def record_event(user_id, kind, item_id, stage, data=None):
+        events.append(stage)
+        # la validità è notificata mentre la coerenza è ancora in corso
+        if stage == "scored":
+            coherence_done.set()
+
+    async def execute_background_query_async(query, params=(), **kwargs):
+        events.append("inserted" if "INSERT" in query else "read")
+        return {"question": "Domanda?"}
+
+    monkeypatch.setattr(answers_nlp, "evaluate_validity", evaluate_validity)
+    monkeypatch.setattr(answers_nlp, "evaluate_coherence_qa", evaluate_coherence_qa)
+    monkeypatch.setattr(answers_nlp, "record_event", record_event)
+    monkeypatch.setattr(answers_nlp, "execute_background_query_async", execute_background_query_async)
+
+    asyncio.run(asyncio.wait_for(answers_nlp.background_evaluation_pipeline(1, "Risposta", 2, user_id=10), timeout=1))
+    assert events == ["read", "scored", "coherence_checked", "inserted"]
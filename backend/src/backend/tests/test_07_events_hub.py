@@ -0,0 +1,56 @@
+import asyncio
+
+from events.feed import TailWindow
+from events.hub import EventHub
+
+
+def event(id, user_id, stage="scored"):
+    return {"id": id, "user_id": user_id, "kind": "question", "item_id": 1, "stage": stage}
+
+
+def test_hub_delivers_only_to_subscribers_of_the_user():
+    async def scenario():
+        hub = EventHub()
+        alice = hub.subscribe(1)
+        other_alice = hub.subscribe(1)
+        bob = hub.subscribe(2)
+
+        hub.publish(event(1, 1))
+        hub.publish(event(2, 3))
+
+        assert (await alice.get())["id"] == 1
+        assert (await other_alice.get())["id"] == 1
+        assert bob.empty()
+
+        hub.unsubscribe(1, alice)
+        hub.unsubscribe(1, other_alice)
+        assert hub.stats()["users"] == 1
+        assert hub.stats()["delivered"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_hub_drops_oldest_events_for_slow_clients():
+    async def scenario():
+        hub = EventHub(queue_size=2)
+        queue = hub.subscribe(1)
+        for i in range(1, 5):
+            hub.publish(event(i, 1))
+
+        assert [queue.get_nowait()["id"], queue.get_nowait()["id"]] == [3, 4]
+        assert hub.dropped == 2
+
+    asyncio.run(scenario())
+
+
+def test_tail_window_publishes_late_commits_once():
+    window = TailWindow(floor=10, overlap=5)
+    assert window.start() == 10
+
+    # l'evento 12 viene committato dopo il 13
+    assert [row["id"] for row in window.fresh([event(11, 1), event(13, 1)])] == [11, 13]
+    assert window.start() == 10
+    assert [row["id"] for row in window.fresh([event(11, 1), event(12, 1), event(13, 1)])] == [12]
+
+    assert [row["id"] for row in window.fresh([event(20, 1)])] == [20]
+    assert window.start() == 15
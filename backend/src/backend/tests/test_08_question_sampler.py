@@ -0,0 +1,54 @@
+import random
+from collections import Counter
+
+from endpoints.questions.sampler import QuestionSampler
+
+
+def test_sampler_never_returns_answered_questions():
+    sampler = QuestionSampler(rng=random.Random(1))
+    sampler.load(range(1, 101))
+    answered = set(range(1, 100))
+
+    assert {sampler.sample(answered) for _ in range(50)} == {100}
+    assert sampler.sample(set(range(1, 101))) is None
+
+
+def test_sampler_is_uniform_over_eligible_questions():
+    sampler = QuestionSampler(rng=random.Random(2))
+    sampler.load(range(1, 21))
+    answered = {1, 2, 3, 4, 5}
+
+    counts = Counter(sampler.sample(answered) for _ in range(30_000))
+    assert set(counts) == set(range(6, 21))
+    assert max(counts.values()) / min(counts.values()) < 1.25
+
+
+def test_sampler_extends_only_with_new_ids():
+    sampler = QuestionSampler()
+    sampler.load([1, 2, 3])
+    sampler.extend([2, 3, 4, 5])
+    assert sampler.stats()["questions"] == 5
+    assert sampler.stats()["max_id"] == 5
+
+
+def test_sampler_adds_questions_committed_out_of_order():
+    sampler = QuestionSampler(rng=random.Random(4))
+    sampler.load([1, 2, 4])
+    # la domanda 3 viene committata dopo la 4 e arriva con la finestra di rilettura
+    sampler.extend([2, 3, 4, 5])
+    assert list(sampler._ids) == [1, 2, 3, 4, 5]
+    assert {sampler.sample({1, 2, 4, 5}) for _ in range(20)} == {3}
+
+
+def test_sampler_keeps_candidates_for_users_who_answered_almost_everything():
+    sampler = QuestionSampler(max_probes=4, rng=random.Random(3))
+    sampler.load(range(1, 1001))
+    answered = set(range(1, 998))
+
+    assert {sampler.sample(answered, user_id=7) for _ in range(200)} == {998, 999, 1000}
+    assert sampler.stats()["dense_users"] == 1
+
+    # domande nuove e risposte date dopo il calcolo della lista
+    sampler.extend([1001])
+    answered.update({998, 999, 1000})
+    assert sampler.sample(answered, user_id=7) == 1001
@@ -0,0 +1,68 @@
+import random
+
+from endpoints.validate.scheduler import AnswerScheduler
+
+
+def test_scheduler_prefers_least_rated_answers_not_excluded():
+    scheduler = AnswerScheduler(rng=random.Random(1))
+    scheduler.load([(1, 2), (2, 0), (3, 0), (4, 1)], max_answer_id=4, max_rating_id=3)
+
+    assert {scheduler.next_for(set()) for _ in range(50)} == {2, 3}
+    assert scheduler.next_for({2, 3}) == 4
+    assert scheduler.next_for({1, 2, 3, 4}) is None
+
+
+def test_scheduler_moves_answers_between_buckets_on_rating():
+    scheduler = AnswerScheduler(rng=random.Random(2))
+    scheduler.load([(1, 0), (2, 0)], max_answer_id=2, max_rating_id=0)
+
+    scheduler.record_rating(1, user_id=10, rating_id=1)
+    assert scheduler.count(1) == 1
+    assert {scheduler.next_for(set()) for _ in range(20)} == {2}
+
+    # lo stesso rating riletto dal DB non viene contato due volte
+    scheduler._apply_tail([3], [(1, 1, 10), (2, 2, 11)])
+    assert scheduler.count(1) == 1
+    assert scheduler.count(2) == 1
+    assert scheduler.count(3) == 0
+    assert scheduler.next_for(set()) == 3
+
+
+def test_scheduler_counts_ratings_for_answers_not_yet_loaded():
+    scheduler = AnswerScheduler()
+    scheduler.load([], max_answer_id=0, max_rating_id=0)
+
+    scheduler.record_rating(5, user_id=None, rating_id=1)
+    scheduler.add_answer(5)
+    assert scheduler.count(5) == 1
+    assert scheduler.stats()["answers"] == 1
+
+
+def test_scheduler_counts_ratings_committed_out_of_order():
+    scheduler = AnswerScheduler(tail_overlap=10)
+    scheduler.load([(1, 0), (2, 0)], max_answer_id=2, max_rating_id=0)
+
+    # il rating 2 viene committato dopo il 3: la prima lettura vede solo il 3
+    scheduler._apply_tail([], [(3, 1, 10)])
+    assert scheduler.stats()["max_rating_id"] == 3
+    scheduler._apply_tail([], [(2, 2, 11), (3, 1, 10)])
+    assert (scheduler.count(1), scheduler.count(2)) == (1, 1)
+
+    # anche un rating locale con id più basso dell'ultimo letto viene contato
+    scheduler.record_rating(2, user_id=12, rating_id=1)
+    assert scheduler.count(2) == 2
+    scheduler._apply_tail([], [(1, 2, 12), (2, 2, 11), (3, 1, 10)])
+    assert (scheduler.count(1), scheduler.count(2)) == (1, 2)
+
+
+def test_scheduler_skips_ratings_already_counted_by_reconcile():
+    scheduler = AnswerScheduler(tail_overlap=10)
+    # il rating 4 viene committato, poi la ricostruzione lo conta e solo dopo
+    # la rotta che l'ha inserito chiama record_rating
+    scheduler.load([(1, 1), (2, 0)], max_answer_id=2, max_rating_id=4)
+
+    scheduler.record_rating(1, user_id=10, rating_id=4)
+    assert (scheduler.count(1), scheduler.count(2)) == (1, 0)
+
+    scheduler.record_rating(1, user_id=11, rating_id=5)
+    assert scheduler.count(1) == 2
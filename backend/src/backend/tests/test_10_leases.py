@@ -0,0 +1,64 @@
+from endpoints.questions.leases import LeaseTable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_leased_items_are_skipped_only_for_other_users():
+    clock = FakeClock()
+    leases = LeaseTable(lease_seconds=60, clock=clock)
+    assert leases.acquire(1, user_id=10) == 1060.0
+
+    assert 1 in leases.skip_for(20)
+    assert 1 not in leases.skip_for(10)
+
+    leases.release(1, user_id=20)
+    assert 1 in leases.skip_for(20)
+    leases.release(1, user_id=10)
+    assert 1 not in leases.skip_for(20)
+
+
+def test_leases_expire_unless_renewed():
+    clock = FakeClock()
+    leases = LeaseTable(lease_seconds=60, clock=clock)
+    leases.acquire(1, user_id=10)
+    leases.acquire(2, user_id=10)
+
+    clock.now += 30
+    leases.acquire(2, user_id=10)
+    clock.now += 40
+
+    assert 1 not in leases.skip_for(20)
+    assert 2 in leases.skip_for(20)
+    assert leases.stats()["active"] == 1
+    assert leases.stats()["expired"] == 1
+
+
+def test_skip_includes_items_chosen_in_the_same_batch():
+    leases = LeaseTable()
+    chosen = {5}
+    skip = leases.skip_for(10, chosen)
+    assert 5 in skip
+    chosen.add(6)
+    assert 6 in skip
+
+
+def test_items_leased_to_another_user_cannot_be_acquired():
+    clock = FakeClock()
+    leases = LeaseTable(lease_seconds=60, clock=clock)
+    assert leases.acquire(1, user_id=10) == 1060.0
+
+    # due batch hanno scelto lo stesso elemento: vince il primo
+    assert leases.acquire(1, user_id=20) is None
+    assert 1 in leases.skip_for(20)
+    assert leases.stats()["conflicts"] == 1
+
+    clock.now += 10
+    assert leases.acquire(1, user_id=10) == 1070.0
+    clock.now += 60
+    assert leases.acquire(1, user_id=20) == 1130.0
@@ -0,0 +1,52 @@
+import json
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from endpoints.gamification.snapshot import LeaderboardSnapshot
+from etag import cached_response
+
+
+def rows(*scores):
+    return [{"username": f"user{i}", "score": score, "user_id": i} for i, score in enumerate(scores, 1)]
+
+
+def test_snapshot_serves_prefixes_with_versioned_etags():
+    snapshot = LeaderboardSnapshot(size=10)
+    snapshot.load(rows(30, 20, 10))
+
+    body, etag, top = snapshot.top(2)
+    assert json.loads(body) == [{"username": "user1", "score": 30}, {"username": "user2", "score": 20}]
+    assert [row["user_id"] for row in top] == [1, 2]
+
+    snapshot.load(rows(30, 20, 10))
+    assert snapshot.top(2)[1] == etag
+
+    snapshot.load(rows(30, 25, 10))
+    assert snapshot.top(2)[1] != etag
+
+
+def test_snapshot_refreshes_early_only_after_invalidation():
+    snapshot = LeaderboardSnapshot(interval=60, min_interval=0)
+    assert snapshot.is_stale()
+    snapshot.load(rows(1))
+    assert not snapshot.is_stale()
+    snapshot.invalidate()
+    assert snapshot.is_stale()
+
+
+def test_cached_response_returns_304_for_matching_etag():
+    app = FastAPI()
+
+    @app.get("/")
+    def index(request: Request):
+        return cached_response(request, b"[]")
+
+    client = TestClient(app)
+    first = client.get("/")
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/", headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert client.get("/", headers={"If-None-Match": '"other"'}).status_code == 200
@@ -0,0 +1,36 @@
+import random
+
+from endpoints.gamification.ranking import RankIndex
+
+
+def brute_force_rank(scores: dict[int, int], user_id: int) -> int:
+    score = scores[user_id]
+    return 1 + sum(
+        1 for other, other_score in scores.items()
+        if other_score > score or (other_score == score and other < user_id)
+    )
+
+
+def test_rank_matches_leaderboard_order_with_ties():
+    index = RankIndex()
+    index.load([(1, 10), (2, 30), (3, 10), (4, 0), (5, 30)])
+
+    assert [index.rank(user_id) for user_id in (2, 5, 1, 3, 4)] == [1, 2, 3, 4, 5]
+    assert index.rank(99) is None
+
+
+def test_incremental_updates_match_brute_force():
+    rng = random.Random(7)
+    scores = {user_id: rng.randint(0, 50) for user_id in range(1, 301)}
+    index = RankIndex()
+    index.load(scores.items())
+
+    for _ in range(2000):
+        user_id = rng.randint(1, 320)
+        # anche punteggi fuori dall'intervallo iniziale, in entrambe le direzioni
+        scores[user_id] = max(-20, scores.get(user_id, 0) + rng.randint(-5, 200))
+        index.set_score(user_id, scores[user_id])
+
+    assert len(index) == len(scores)
+    for user_id in rng.sample(sorted(scores), 60):
+        assert index.rank(user_id) == brute_force_rank(scores, user_id)
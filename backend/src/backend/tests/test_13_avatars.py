@@ -0,0 +1,89 @@
+import asyncio
+import base64
+import io
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from endpoints.profile import avatars
+from endpoints.profile.identicon import render
+
+
+@pytest.fixture
+def avatar_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatars, "AVATAR_CACHE_DIR", str(tmp_path))
+    avatars._memory.clear()
+    for key in avatars.stats:
+        avatars.stats[key] = 0
+    yield tmp_path
+    avatars.shutdown_render_pool()
+    avatars._memory.clear()
+
+
+def test_render_sizes():
+    for size in avatars.AVATAR_SIZES:
+        assert Image.open(io.BytesIO(render("mario", size))).size == (size, size)
+    assert render("mario", 64) == render("mario", 64)
+
+
+def test_avatar_is_rendered_once_then_served_from_memory_and_disk(avatar_cache):
+    png, etag = asyncio.run(avatars.get_avatar_png("mario", 64))
+    assert png == render("mario", 64)
+    assert avatars.stats["renders"] == 1
+    assert len(list(avatar_cache.rglob("*.png"))) == 1
+
+    assert asyncio.run(avatars.get_avatar_png("mario", 64)) == (png, etag)
+    assert avatars.stats["memory_hits"] == 1
+
+    avatars._memory.clear()
+    assert asyncio.run(avatars.get_avatar_png("mario", 64)) == (png, etag)
+    assert avatars.stats["disk_hits"] == 1
+    assert avatars.stats["renders"] == 1
+
+
+def test_concurrent_misses_share_one_render(avatar_cache):
+    async def many():
+        return await asyncio.gather(*(avatars.get_avatar_png("luigi", 32) for _ in range(5)))
+
+    results = asyncio.run(many())
+    assert len(set(results)) == 1
+    assert avatars.stats["renders"] == 1
+
+
+def test_sprite_places_every_avatar_at_its_offset(avatar_cache):
+    body, etag = asyncio.run(avatars.get_sprite(["mario", "luigi", "peach", "mario"], 32))
+    data = json.loads(body)
+    assert data["size"] == 32
+    assert sorted(data["offsets"]) == ["luigi", "mario", "peach"]
+    assert avatars.stats["renders"] == 3
+
+    sheet = Image.open(io.BytesIO(base64.b64decode(data["sprite"]))).convert("RGB")
+    x, y = data["offsets"]["peach"]
+    tile = sheet.crop((x, y, x + 32, y + 32))
+    assert tile.tobytes() == Image.open(io.BytesIO(render("peach", 32))).convert("RGB").tobytes()
+
+    # stesso insieme di username in un altro ordine: stessa sprite, dalla memoria
+    assert asyncio.run(avatars.get_sprite(["peach", "luigi", "mario"], 32)) == (body, etag)
+    assert avatars.stats["sprite_hits"] == 1
+
+
+
+def test_disk_cache_evicts_least_recently_used_files(avatar_cache, monkeypatch):
+    monkeypatch.setattr(avatars, "AVATAR_DISK_BYTES", 1000)
+    keys = [f"{i:02d}" * 32 for i in range(6)]
+    for i, key in enumerate(keys[:4]):
+        avatars.write_disk(key, b"x" * 200)
+        # mtime distinti anche su filesystem con risoluzione grossolana
+        os.utime(avatars._path(key), (i, i))
+
+    # letto di recente: non deve essere il primo a sparire
+    assert avatars.read_disk(keys[0]) == b"x" * 200
+    avatars.write_disk(keys[4], b"x" * 200)
+    avatars.write_disk(keys[5], b"x" * 200)
+
+    assert sum(f.stat().st_size for f in avatar_cache.rglob("*.png")) <= 1000
+    assert avatars.stats["disk_evictions"] > 0
+    assert avatars.read_disk(keys[0]) is not None
+    assert avatars.read_disk(keys[1]) is None
@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+from endpoints.profile import history
+
+
+def fake_history(total):
+    calls = []
+
+    def fetch_chunk(query, user_id, after):
+        calls.append(after)
+        ids = [i for i in range(1, total + 1) if i > after][:history.HISTORY_STREAM_CHUNK]
+        return [{"id": i, "question": f"domanda {i}", "topic": "storia"} for i in ids]
+
+    return fetch_chunk, calls
+
+
+def collect(stream):
+    async def run():
+        return [chunk async for chunk in stream]
+    return asyncio.run(run())
+
+
+def test_stream_writes_one_json_line_per_row_in_chunks(monkeypatch):
+    fetch_chunk, calls = fake_history(7)
+    monkeypatch.setattr(history, "HISTORY_STREAM_CHUNK", 3)
+    monkeypatch.setattr(history, "fetch_chunk", fetch_chunk)
+
+    chunks = collect(history.stream_history(history.QUESTIONS_QUERY, 1))
+    rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+
+    assert [row["id"] for row in rows] == list(range(1, 8))
+    assert len(chunks) == 3
+    assert calls == [0, 3, 6]
+
+
+def test_stream_resumes_after_cursor_and_stops_on_exact_multiple(monkeypatch):
+    fetch_chunk, calls = fake_history(6)
+    monkeypatch.setattr(history, "HISTORY_STREAM_CHUNK", 3)
+    monkeypatch.setattr(history, "fetch_chunk", fetch_chunk)
+
+    chunks = collect(history.stream_history(history.QUESTIONS_QUERY, 1, after=3))
+
+    assert [json.loads(line)["id"] for line in "".join(chunks).splitlines()] == [4, 5, 6]
+    assert calls == [3, 6]
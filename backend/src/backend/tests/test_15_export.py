@@ -0,0 +1,63 @@
+import io
+import json
+from decimal import Decimal
+
+import pytest
+
+from export import dataset
+
+
+def answers(params):
+    after, size = params
+    return [
+        {"answer_id": i, "question_id": 10 + i % 2, "topic": "cucina", "question_type": "human",
+         "question": f"domanda {i}", "answer_type": "human", "answer_llm_id": None, "answer": f"risposta {i}"}
+        for i in range(after + 1, min(after + size, 5) + 1)
+    ]
+
+
+@pytest.fixture
+def connection(fake_connection):
+    return fake_connection({
+        "FROM answers a": answers,
+        "FROM questions_evaluation": [(10, Decimal("7.5"), 1)],
+        "FROM answers_evaluation": [(2, Decimal("4.0"), 0)],
+        "FROM ratings": [(2, 3, Decimal("3.6667"), Decimal("1"))],
+    })
+
+
+def test_fetch_chunk_merges_evaluations_and_ratings(connection):
+    rows = dataset.fetch_chunk(connection, 0, 3)
+
+    assert [row["answer_id"] for row in rows] == [1, 2, 3]
+    by_id = {row["answer_id"]: row for row in rows}
+    assert by_id[2]["cultural_specificity"] == 7.5 and by_id[2]["coherence_qt"] is True
+    assert by_id[2]["validity"] == 4.0 and by_id[2]["coherence_qa"] is False
+    assert (by_id[2]["ratings"], by_id[2]["flag_ia"]) == (3, 1)
+    assert by_id[1]["cultural_specificity"] is None
+    assert (by_id[1]["ratings"], by_id[1]["rating_avg"]) == (0, None)
+    assert [name for name, _ in dataset.FIELDS] == list(rows[0])
+
+
+def test_export_steps_resume_from_last_answer_id(connection):
+    encoder = dataset.NdjsonEncoder()
+    data, last_id, count = dataset.export_step(connection, encoder, 3, 10)
+    assert (last_id, count) == (5, 2)
+    assert [json.loads(line)["answer_id"] for line in data.decode().splitlines()] == [4, 5]
+
+    assert dataset.export_step(connection, encoder, 5, 10) == (b"", 5, 0)
+
+
+@pytest.mark.skipif(not dataset.parquet_available(), reason="pyarrow non installato")
+def test_parquet_is_written_one_row_group_per_chunk(connection):
+    import pyarrow.parquet as pq
+
+    encoder = dataset.ParquetEncoder()
+    out = b"".join([
+        dataset.export_step(connection, encoder, 0, 3)[0],
+        dataset.export_step(connection, encoder, 3, 3)[0],
+        encoder.close(),
+    ])
+    parquet = pq.ParquetFile(io.BytesIO(out))
+    assert parquet.num_row_groups == 2
+    assert parquet.read().column("answer_id").to_pylist() == [1, 2, 3, 4, 5]
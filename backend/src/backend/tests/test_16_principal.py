@@ -0,0 +1,61 @@
+import pytest
+from fastapi import HTTPException, Request
+
+from endpoints.auth import auth
+
+
+def users_connection(fake_connection, users):
+    """Risponde a SELECT id FROM users WHERE username = ? con gli id di users"""
+    return fake_connection({
+        "FROM users": lambda params: [(users[params[0]],)] if params[0] in users else [],
+    })
+
+
+def request(path="/profile/"):
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": []})
+
+
+def setup_function():
+    auth._user_ids.clear()
+    auth.user_id_lookups.clear()
+
+
+def test_user_id_claim_avoids_the_query(fake_connection):
+    conn = users_connection(fake_connection, {"mario": 7})
+    principal = auth.get_current_principal(request(), {"sub": "mario", "uid": 7}, conn)
+
+    assert (principal.username, principal.user_id) == ("mario", 7)
+    assert conn.queries == []
+    assert auth.auth_stats()["lookups"]["/profile/"]["saved"] == 1
+
+
+def test_legacy_tokens_are_resolved_once_then_cached(fake_connection):
+    conn = users_connection(fake_connection, {"mario": 7})
+    for _ in range(3):
+        assert auth.get_current_principal(request(), {"sub": "mario"}, conn).user_id == 7
+
+    assert len(conn.queries) == 1
+    counts = auth.auth_stats()["lookups"]["/profile/"]
+    assert (counts["db"], counts["cache"], counts["saved"]) == (1, 2, 2)
+
+
+def test_rename_invalidates_the_cached_id(fake_connection):
+    users = {"mario": 7}
+    conn = users_connection(fake_connection, users)
+    assert auth.get_current_user_id("mario", conn) == 7
+
+    # mario si rinomina e un nuovo utente prende il suo vecchio username
+    users["mario"] = 8
+    auth.forget_user_id("mario")
+    assert auth.get_current_user_id("mario", conn) == 8
+
+
+def test_admin_access_follows_the_user_id_not_the_username(monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_USER_IDS", {7})
+    assert auth.get_admin_user({"sub": "mario", "uid": 7}) == 7
+
+    # un altro utente con lo username dell'amministratore, o un token senza uid
+    for payload in ({"sub": "mario", "uid": 8}, {"sub": "mario"}):
+        with pytest.raises(HTTPException) as denied:
+            auth.get_admin_user(payload)
+        assert denied.value.status_code == 403
@@ -0,0 +1,39 @@
+import hashlib
+from datetime import timedelta
+
+import pytest
+
+import lru
+from crypto import jwt
+from crypto.models import TokenExpired, TokenInvalid
+
+
+def setup_function():
+    jwt._verified.clear()
+    jwt._verified.hits = jwt._verified.misses = 0
+
+
+def test_verified_tokens_are_served_from_cache():
+    token = jwt.create_access_token({"sub": "mario", "uid": 7})
+    first = jwt.decode_access_token(token)
+    first["sub"] = "modificato"
+
+    assert jwt.decode_access_token(token)["sub"] == "mario"
+    assert jwt.token_cache_stats()["hits"] == 1
+
+
+def test_cached_token_expires_with_its_exp(monkeypatch):
+    token = jwt.create_access_token({"sub": "mario"}, expires_delta=timedelta(minutes=1))
+    exp = jwt.decode_access_token(token)["exp"]
+
+    monkeypatch.setattr(lru.time, "time", lambda: exp + 1)
+    assert jwt._verified.get(hashlib.sha256(token.encode()).digest()) is None
+
+
+def test_invalid_and_expired_tokens_are_not_cached():
+    token = jwt.create_access_token({"sub": "mario"})
+    with pytest.raises(TokenInvalid):
+        jwt.decode_access_token(token[:-2] + ("AA" if not token.endswith("AA") else "BB"))
+    with pytest.raises(TokenExpired):
+        jwt.decode_access_token(jwt.create_access_token({"sub": "mario"}, expires_delta=timedelta(seconds=-1)))
+    assert len(jwt._verified) == 0
@@ -0,0 +1,82 @@
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from crypto import password
+from crypto.executor import BoundedExecutor, ExecutorFull
+from endpoints.auth import auth
+from exceptions import executor_full_exception_handler, handle_exceptions
+
+
+def test_scrypt_hashes_verify_and_legacy_hashes_are_upgraded():
+    salt = password.get_salt(16)
+    stored = password.hash_password("segreta123", salt)
+    assert stored.startswith("scrypt$")
+    assert password.verify_password(stored, salt, "segreta123")
+    assert not password.verify_password(stored, salt, "sbagliata1")
+    assert not password.needs_rehash(stored)
+
+    legacy = hashlib.sha256(salt + b"segreta123").hexdigest()
+    assert password.verify_password(legacy, salt, "segreta123")
+    assert password.needs_rehash(legacy)
+
+    valid, upgraded = password.verify_and_upgrade(legacy, salt, "segreta123")
+    new_hash, new_salt = upgraded
+    assert valid and password.verify_password(new_hash, bytes.fromhex(new_salt), "segreta123")
+    assert password.verify_and_upgrade(legacy, salt, "sbagliata1") == (False, None)
+
+
+def test_executor_rejects_work_beyond_its_limit():
+    executor = BoundedExecutor(workers=1, limit=2)
+    release = threading.Event()
+
+    async def burst():
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(ExecutorFull) as full:
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(*running)
+        return full.value
+
+    full = asyncio.run(burst())
+    assert full.retry_after >= 1
+    assert executor.stats()["rejected"] == 1
+    assert executor.stats()["pending"] == 0
+    executor.shutdown()
+
+
+def test_full_executor_answers_503_with_retry_after():
+    app = FastAPI()
+    app.exception_handler(ExecutorFull)(executor_full_exception_handler)
+
+    @app.post("/login")
+    @handle_exceptions()
+    async def login():
+        raise ExecutorFull(3)
+
+    response = TestClient(app).post("/login")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "3"
+
+
+def test_unknown_users_cost_a_password_check_too(monkeypatch, fake_connection):
+    checks = []
+
+    async def run(func, *args):
+        checks.append(args)
+        return func(*args)
+
+    monkeypatch.setattr(auth.password_executor, "run", run)
+    conn = fake_connection({"FROM users": []})
+    form = SimpleNamespace(username="nessuno", password="segreta123")
+
+    with pytest.raises(HTTPException) as unknown:
+        asyncio.run(auth.login(form, conn))
+    assert unknown.value.status_code == 401 and unknown.value.detail == "Email o password errati"
+    assert checks == [(password.DUMMY_HASH, password.DUMMY_SALT, "segreta123")]
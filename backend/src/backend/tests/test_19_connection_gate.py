@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from db import pool
+from db.mariadb import background_connection
+from db.pool import ConnectionGate, PoolSaturated
+
+
+def test_gate_sheds_when_the_wait_queue_is_full():
+    gate = ConnectionGate(size=1, max_waiting=1, timeout=5)
+    gate.acquire()
+
+    waiter = threading.Thread(target=gate.acquire)
+    waiter.start()
+    while gate.waiting == 0:
+        time.sleep(0.001)
+
+    with pytest.raises(PoolSaturated) as saturated:
+        gate.acquire()
+    assert saturated.value.retry_after >= 1
+
+    gate.release(0.01)
+    waiter.join(timeout=1)
+    stats = gate.stats()
+    assert stats["in_use"] == 1 and stats["waiting"] == 0
+    assert stats["checkouts"] == 2 and stats["shed"] == 1 and stats["timeouts"] == 0
+    assert stats["utilization"] == 1.0
+
+
+def test_gate_times_out_waiting_requests():
+    gate = ConnectionGate(size=1, max_waiting=4, timeout=0.05)
+    gate.acquire()
+
+    start = time.monotonic()
+    with pytest.raises(PoolSaturated):
+        gate.acquire()
+    assert time.monotonic() - start >= 0.05
+
+    gate.release(0.01)
+    assert gate.acquire() < 0.05
+    assert gate.stats()["timeouts"] == 1
+
+
+class OneConnectionPool:
+    """Come mariadb.ConnectionPool con pool_size=1: get_connection fallisce se la connessione è in uso"""
+
+    def __init__(self):
+        self.in_use = False
+
+    def get_connection(self):
+        assert not self.in_use, "PoolError: pool esaurito"
+        self.in_use = True
+        return self
+
+    def close(self):
+        self.in_use = False
+
+
+def test_background_connections_wait_instead_of_failing(monkeypatch):
+    monkeypatch.setattr(pool, "_background_pool", OneConnectionPool())
+    monkeypatch.setattr(pool, "background_gate", ConnectionGate(size=1, max_waiting=4, timeout=5))
+
+    errors = []
+
+    def job():
+        try:
+            with background_connection():
+                time.sleep(0.01)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=job) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=1)
+
+    assert errors == []
+    stats = pool.background_gate.stats()
+    assert stats["checkouts"] == 4 and stats["in_use"] == 0
+    assert stats["shed"] == 0 and stats["timeouts"] == 0
@@ -0,0 +1,70 @@
+from typing import Annotated
+
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from db import mariadb as db
+from db.pool import PoolSaturated
+
+
+@pytest.fixture
+def pool(monkeypatch, fake_connection):
+    events = []
+
+    def checkout():
+        events.append("checkout")
+        return fake_connection({"SELECT 1": [(1,)]}), 0.0
+
+    def checkin(conn, checked_out_at):
+        events.append("checkin")
+
+    monkeypatch.setattr(db, "checkout", checkout)
+    monkeypatch.setattr(db, "checkin", checkin)
+    monkeypatch.setattr(db, "lazy_connections", db.Counter())
+    return events
+
+
+def make_client():
+    app = FastAPI()
+
+    @app.get("/rejected")
+    def rejected(conn: Annotated[db.LazyConnection, Depends(db.db_connection)]):
+        raise HTTPException(status_code=401, detail="Non autenticato")
+
+    @app.get("/query")
+    def query(conn: Annotated[db.LazyConnection, Depends(db.db_connection)], release: bool = False):
+        rows = db.execute_query(conn, "SELECT 1")
+        if release:
+            conn.release()
+        return rows
+
+    return TestClient(app)
+
+
+def test_connection_is_checked_out_only_when_used(pool):
+    client = make_client()
+
+    assert client.get("/rejected").status_code == 401
+    assert pool == []
+
+    assert client.get("/query").json() == [[1]]
+    assert pool == ["checkout", "checkin"]
+
+    assert client.get("/query", params={"release": True}).status_code == 200
+    assert pool == ["checkout", "checkin"] * 2
+
+    stats = db.lazy_connection_stats()
+    assert stats["requests"] == 3 and stats["skipped"] == 1
+    assert stats["checked_out"] == 2 and stats["released_early"] == 1
+
+
+def test_saturated_pool_is_a_503_not_a_query_error(monkeypatch, pool):
+    def checkout():
+        raise PoolSaturated(retry_after=3)
+
+    monkeypatch.setattr(db, "checkout", checkout)
+    response = make_client().get("/query")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
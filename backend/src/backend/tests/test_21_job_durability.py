@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from db.mariadb import execute_query, transaction_async
+from jobs import worker
+from jobs.queue import lease
+from jobs.models import Job
+
+
+def test_writes_in_a_transaction_are_committed_together_or_not_at_all(fake_connection):
+    conn = fake_connection()
+
+    async def submit(fail):
+        async with transaction_async(conn):
+            execute_query(conn, "INSERT INTO questions VALUES (?)", (1,), fetch=False, commit=False)
+            if fail:
+                raise HTTPException(status_code=500, detail="enqueue fallito")
+            execute_query(conn, "INSERT INTO evaluation_jobs VALUES (?)", (1,), fetch=False, commit=False)
+
+    with pytest.raises(HTTPException):
+        asyncio.run(submit(fail=True))
+    assert conn.committed == [] and conn.pending == []
+
+    asyncio.run(submit(fail=False))
+    assert len(conn.committed) == 2
+
+
+def test_ack_errors_do_not_escape_the_job_task(monkeypatch):
+    async def handler(payload):
+        pass
+
+    def broken_ack(job):
+        raise RuntimeError("connessione persa")
+
+    async def no_event(job, stage):
+        pass
+
+    monkeypatch.setitem(worker.HANDLERS, "question", handler)
+    monkeypatch.setattr(worker, "_ack_job", broken_ack)
+    monkeypatch.setattr(worker, "_record_outcome", no_event)
+    before = dict(worker.stats)
+
+    job = Job(id=1, kind="question", payload={"question_id": 1}, attempts=1, max_attempts=5, age=0.0)
+    asyncio.run(worker.process(job))
+
+    assert worker.stats["settle_errors"] == before["settle_errors"] + 1
+    assert worker.stats["done"] == before["done"]
+    assert worker.stats["running"] == before["running"]
+
+
+def test_expired_jobs_out_of_attempts_fail_instead_of_running_again(fake_connection):
+    conn = fake_connection({
+        "FOR UPDATE SKIP LOCKED": [(1, "pending", 0, 5), (2, "running", 5, 5), (3, "running", 2, 5)],
+        "TIMESTAMPDIFF": lambda ids: [
+            {"id": job_id, "kind": "question", "payload": "{}", "attempts": 1, "max_attempts": 5, "age": 0}
+            for job_id in ids
+        ],
+    })
+
+    jobs = lease(conn, "worker-1", 10, 60)
+
+    assert [job.id for job in jobs] == [1, 3]
+    (failed, failed_params), (running, running_params) = conn.committed
+    assert "'failed'" in failed and failed_params[1:] == (2,)
+    assert "'running'" in running and running_params == ("worker-1", 60, 1, 3)
+    assert conn.pending == []
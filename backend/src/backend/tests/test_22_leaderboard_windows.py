@@ -0,0 +1,66 @@
+import json
+import uuid
+
+import mariadb
+import pytest
+
+from db.mariadb import execute_query
+from db.pool import settings_from_env
+from endpoints.gamification.leaderboard import encode_cursor
+from endpoints.gamification.rollups import windowed_page
+from endpoints.gamification.snapshot import serialize
+
+
+def test_windowed_page_filters_by_window_nation_and_cursor(fake_connection):
+    conn = fake_connection({"FROM leaderboard_daily": [{"username": "mario", "score": 12, "user_id": 7}]})
+
+    rows = windowed_page(conn, "week", "Italia", (20, 3), 50)
+    assert json.loads(serialize(rows)) == [{"username": "mario", "score": 12}]
+
+    query, params = conn.queries[-1]
+    assert "CAST(SUM(d.score) AS SIGNED)" in query
+    assert "d.nation = ?" in query and "HAVING" in query
+    assert params == (6, "Italia", 20, 20, 3, 50)
+
+    windowed_page(conn, "day", None, None, 10)
+    query, params = conn.queries[-1]
+    assert "d.nation" not in query and "HAVING" not in query
+    assert params == (0, 10)
+
+
+@pytest.fixture
+def db():
+    """Connessione al DB con lo schema e i trigger di mariadb/init; tutto viene annullato alla fine"""
+    try:
+        conn = mariadb.connect(**settings_from_env())
+    except Exception as e:
+        pytest.skip(f"database non disponibile: {e}")
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def test_log_triggers_roll_scores_up_by_day(db):
+    username = f"rollup-{uuid.uuid4().hex[:12]}"
+    user_id = execute_query(db, """
+        INSERT INTO users (username, email, nation, password_hash, salt, signup_date, last_login)
+        VALUES (?, ?, 'Italia', 'x', 'x', NOW(), NOW())
+    """, (username, f"{username}@test.local"), fetch=False, commit=False)
+
+    log_id = execute_query(db, """
+        INSERT INTO logs (action_id, action_type, user_id, score, timestamp)
+        VALUES (1, 'question', ?, 5, NOW())
+    """, (user_id,), fetch=False, commit=False)
+    execute_query(db, "UPDATE logs SET score = 8 WHERE id = ?", (log_id,), fetch=False, commit=False)
+
+    daily = execute_query(
+        db, "SELECT nation, score FROM leaderboard_daily WHERE user_id = ? AND day = CURDATE()", (user_id,)
+    )
+    assert daily == [("Italia", 8)]
+
+    rows = [row for row in windowed_page(db, "day", "Italia", None, 1000) if row["user_id"] == user_id]
+    assert rows == [{"username": username, "score": 8, "user_id": user_id}]
+    assert json.loads(serialize(rows)) == [{"username": username, "score": 8}]
+    assert encode_cursor(rows[0]["score"], user_id)
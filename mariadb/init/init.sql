@@ -103,6 +103,8 @@ CREATE TABLE IF NOT EXISTS logs (
     score INT NOT NULL DEFAULT 0,
     timestamp DATETIME NOT NULL,
     notes TEXT,
+    -- join con answers/questions nello storico del profilo
+    INDEX idx_logs_action (action_type, action_id),
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL,
     FOREIGN KEY (llm_id) REFERENCES llms(id) ON DELETE SET NULL
 );
@@ -110,11 +112,29 @@ CREATE TABLE IF NOT EXISTS logs (
 -- CLASSIFICA
 CREATE TABLE IF NOT EXISTS leaderboard (
     user_id INT NOT NULL,
+    nation VARCHAR(255),
     score INT NOT NULL DEFAULT 0,
     num_ratings INT DEFAULT 0,
     num_questions INT DEFAULT 0,
     num_answers INT DEFAULT 0,
+    updated_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3),
     UNIQUE (user_id),
+    -- ordine della classifica, per la paginazione a cursore
+    INDEX idx_leaderboard_rank (score DESC, user_id),
+    INDEX idx_leaderboard_nation_rank (nation, score DESC, user_id),
+    -- righe cambiate di recente, lette dall'indice delle posizioni (endpoints/gamification/ranking.py)
+    INDEX idx_leaderboard_updated (updated_at),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- PUNTEGGI PER UTENTE E PER GIORNO (mantenuti dai trigger su logs, per le classifiche su finestre)
+CREATE TABLE IF NOT EXISTS leaderboard_daily (
+    day DATE NOT NULL,
+    user_id INT NOT NULL,
+    nation VARCHAR(255),
+    score INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id),
+    INDEX idx_leaderboard_daily_nation (nation, day, user_id, score),
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
@@ -131,6 +151,47 @@ CREATE TABLE IF NOT EXISTS reports (
     FOREIGN KEY (answer_id) REFERENCES answers(id) ON DELETE CASCADE
 );
 
+-- CODA DELLE VALUTAZIONI NLP (svuotata dal worker)
+CREATE TABLE IF NOT EXISTS evaluation_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    kind ENUM('question', 'answer') NOT NULL,
+    payload JSON NOT NULL,
+    status ENUM('pending', 'running', 'done', 'failed') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    available_at DATETIME(3) NOT NULL,
+    leased_until DATETIME(3),
+    lease_owner VARCHAR(255),
+    last_error TEXT,
+    created_at DATETIME(3) NOT NULL,
+    finished_at DATETIME(3),
+    INDEX idx_evaluation_jobs_ready (status, available_at)
+);
+
+-- CACHE DEI RISULTATI NLP (chiave = hash di endpoint, versione del modello e payload)
+CREATE TABLE IF NOT EXISTS nlp_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    endpoint VARCHAR(64) NOT NULL,
+    model_version VARCHAR(64) NOT NULL,
+    response JSON NOT NULL,
+    created_at DATETIME NOT NULL,
+    expires_at DATETIME NOT NULL,
+    INDEX idx_nlp_cache_expires (expires_at)
+);
+
+-- EVENTI DELLE VALUTAZIONI (stati delle pipeline, inviati ai client via SSE)
+CREATE TABLE IF NOT EXISTS evaluation_events (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    kind ENUM('question', 'answer') NOT NULL,
+    item_id INT NOT NULL,
+    stage VARCHAR(32) NOT NULL,
+    data JSON,
+    created_at DATETIME(3) NOT NULL,
+    INDEX idx_evaluation_events_user (user_id, id),
+    INDEX idx_evaluation_events_created (created_at)
+);
+
 -- LLM Fittizio iniziale
 INSERT INTO llms(name) VALUES("LLM_PLACEHOLDER");
 
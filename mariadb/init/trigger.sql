@@ -4,8 +4,8 @@ CREATE OR REPLACE TRIGGER trg_leaderboard_insert
 AFTER INSERT ON users
 FOR EACH ROW
 BEGIN
-  INSERT IGNORE INTO leaderboard (user_id, score, num_ratings, num_questions, num_answers)
-  VALUES (NEW.id, 0, 0, 0, 0);
+  INSERT IGNORE INTO leaderboard (user_id, nation, score, num_ratings, num_questions, num_answers)
+  VALUES (NEW.id, NEW.nation, 0, 0, 0, 0);
 END;
 //
 DELIMITER ;
@@ -174,3 +174,37 @@ BEGIN
 END;
 //
 DELIMITER ;
+
+-- 10. Somma il punteggio di un nuovo log nei punteggi giornalieri
+DELIMITER //
+CREATE OR REPLACE TRIGGER trg_leaderboard_daily_insert
+AFTER INSERT ON logs
+FOR EACH ROW
+BEGIN
+  IF NEW.user_id IS NOT NULL THEN
+    INSERT INTO leaderboard_daily (day, user_id, nation, score)
+    SELECT DATE(NEW.timestamp), u.id, u.nation, NEW.score
+    FROM users u
+    WHERE u.id = NEW.user_id
+    ON DUPLICATE KEY UPDATE score = score + NEW.score;
+  END IF;
+END;
+//
+DELIMITER ;
+
+-- 11. Punti aggiunti a un log esistente (valutazioni, rating ricevuti): contano nel giorno in cui arrivano
+DELIMITER //
+CREATE OR REPLACE TRIGGER trg_leaderboard_daily_update
+AFTER UPDATE ON logs
+FOR EACH ROW
+BEGIN
+  IF NEW.score <> OLD.score AND NEW.user_id IS NOT NULL THEN
+    INSERT INTO leaderboard_daily (day, user_id, nation, score)
+    SELECT CURDATE(), u.id, u.nation, NEW.score - OLD.score
+    FROM users u
+    WHERE u.id = NEW.user_id
+    ON DUPLICATE KEY UPDATE score = score + (NEW.score - OLD.score);
+  END IF;
+END;
+//
+DELIMITER ;